@@ -3,9 +3,12 @@
 from dash import Dash, html, dcc
 from .src.components import state_dropdown, live_graph, window_size, visual_3d
 from .src.components import ids
-import pandas as pd
+import hashlib
+import numpy as np
 import os
-from io import StringIO
+
+# Parsed meshes, as .npy files keyed by mesh path and modification time
+MESH_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'DigiTWind', 'mesh')
 
 class Retina(Dash):
     def __init__(self, brain):
@@ -13,12 +16,14 @@ class Retina(Dash):
         self.title              = brain.title
         self.test_name          = brain.test_name
         self.channels           = brain.channels_L[1:] # without time (user-friendly labels)
-        self.pdata              = brain.memory.shared_pdata
-        self.vdata              = brain.memory.shared_vdata
+        self.pdata              = brain.memory.pbuffer
+        self.vdata              = brain.memory.vbuffer
         self.twin_rate          = brain.twin_rate
+        self.max_points         = 1000  # points per live graph trace (min/max decimated)
         self.current_error_dict = brain.memory.current_error_dict
         self.channel_info       = brain.channel_info
         self.mirrcoeff          = brain.memory.mirrcoeff
+        self.score_names        = {state: brain.memory.score_name(state) for state in self.channels} # fidelity names (turbine 1 in a farm)
         self.tol                = brain.tol
 
         self.mesh_file_path     = brain.model_config.mesh_file_path
@@ -50,27 +55,36 @@ class Retina(Dash):
         self.run_server(debug=debug, host=host, threaded=True)
 
     def load_mesh_data(self, file_path):
-        print("Loading data from: ", file_path)
-
-        with open(file_path, 'r') as f:
-            lines = f.readlines()[:-2]  # read all lines except the last two
-            data_str = ''.join(lines)
+        # (N x 3) float32 vertices of the GDF mesh, symmetric halves included, memory-mapped from
+        # a .npy cache keyed by the file path and modification time (parsed on the first load only)
+        stat = os.stat(file_path)
+        key = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}"
+        cache_file = os.path.join(MESH_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + '.npy')
 
-        # Skip the first 4 rows as they do not contain mesh data
-        data = pd.read_csv(StringIO(data_str), skiprows=4, sep="\s+", header=None, usecols=[0, 1, 2])
+        if not os.path.isfile(cache_file):
+            print("Loading data from: ", file_path)
+            vertices = self.parse_gdf(file_path)
+            os.makedirs(MESH_CACHE_DIR, exist_ok=True)
+            tmp_file = cache_file + f'.{os.getpid()}.tmp'
+            with open(tmp_file, 'wb') as f:
+                np.save(f, vertices)
+            os.replace(tmp_file, cache_file)
+        else:
+            print("Loading cached mesh for: ", file_path)
+        return np.load(cache_file, mmap_mode='r')
 
-        # Name the columns for easier access
-        data.columns = ["x", "y", "z"]
-
-        # Create a new DataFrame with y values negated
-        data_neg_y = data.copy()
-        data_neg_y["y"] = -data["y"]
-
-        # Concatenate old data with new DataFrame
-        data = pd.concat([data, data_neg_y])
+    @staticmethod
+    def parse_gdf(file_path):
+        # WAMIT GDF: 4 header lines (title, ULEN GRAV, ISX ISY, NPAN), then 4 vertices per panel
+        with open(file_path, 'r') as f:
+            header = [next(f) for _ in range(4)]
+            isx, isy = (int(v) for v in header[2].split()[:2])
+            n_panels = int(header[3].split()[0])
+            vertices = np.loadtxt(f, usecols=(0, 1, 2), max_rows=4 * n_panels, dtype=np.float32, ndmin=2)
 
-        # Save the original x values
-        data['x_original'] = data['x'].copy()
-        data['y_original'] = data['y'].copy()
-        data['z_original'] = data['z'].copy()
-        return data
\ No newline at end of file
+        # Add the mirrored halves of the symmetry planes
+        if isy:
+            vertices = np.vstack([vertices, vertices * np.array([1, -1, 1], dtype=np.float32)])
+        if isx:
+            vertices = np.vstack([vertices, vertices * np.array([-1, 1, 1], dtype=np.float32)])
+        return vertices
@@ -5,9 +5,17 @@ SELECT_ALL_STATES_BUTTON = "select-all-states-button"
 # GRAPHS
 LIVE_GRAPHS = "live-graphs"
 
+# 3D VIEW
+VISUAL_3D = "visual-3d"
+VISUAL_3D_POSE = "visual-3d-pose"
+VISUAL_3D_MESH = "visual-3d-mesh"
+
 # INTERVAL COMPONENTS
 INTERVAL_COMPONENT = "interval-component"
 
 # SECTIONS
 STATS_SECTION = 'stats-section'
-WINDOW_SIZE   = 'window_size'
\ No newline at end of file
+WINDOW_SIZE   = 'window_size'
+
+# STORES
+CLIENT_ID     = 'client-id'
\ No newline at end of file
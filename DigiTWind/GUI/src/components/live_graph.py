@@ -1,102 +1,193 @@
-from dash import Dash, dcc, html
-from dash.dependencies import Input, Output, ALL
+from dash import Dash, dcc, html, callback_context, no_update
+from dash.dependencies import Input, Output, State, ALL
+from dash.exceptions import PreventUpdate
+from collections import OrderedDict
+from DigiTWind.downsample import minmax_buckets
 from . import ids
 import plotly.graph_objs as go
+import numpy as np
+import uuid
+
+MAX_CLIENTS = 64  # browser sessions whose cursors are kept
+
 
 def render(retina):
+    # Per-client cursors: next physical/virtual tick to read, the rows read but not drawn yet (a
+    # partial min/max bucket), the window in seconds, the bucket width (ticks per pair of points)
+    # and the cap on the points of a trace in the browser
+    cursors = OrderedDict()
+    streams = {'p': retina.pdata, 'v': retina.vdata}
+
+    def stats_text(state):
+        # Mirroring Reporting
+        return "Test Name: {}  \n" \
+               "Current error: {:.2f}  \n" \
+               "Error tolerance: {:.2f}%  \n" \
+               "Mirroring coefficient: {:.2f}%  ".format(retina.test_name,
+                                                         retina.current_error_dict[retina.score_names[state]],
+                                                         retina.tol * 100,
+                                                         retina.mirrcoeff[retina.score_names[state]])
+
+    def bucket_width(n_ticks):
+        # Ticks per min/max bucket so n_ticks fit in max_points (raw samples if they already fit)
+        return 1 if n_ticks <= retina.max_points else -(-n_ticks // (retina.max_points // 2))
+
+    def bucket(cursor, stream, rows):
+        # Decimate the pending rows and `rows` of a stream at the cursor width, per state
+        rows = np.vstack([cursor['pending'][stream], rows])
+        points = []
+        for i in range(1, rows.shape[1]):
+            x, y, used = minmax_buckets(rows[:, 0], rows[:, i], cursor['width'])
+            points.append((x, y))
+        used = len(rows) if rows.shape[1] == 1 else used
+        cursor['pending'][stream] = rows[used:]
+        return points
+
+    def draw(cursor, states):
+        # Points of the window (the whole history when there is none) per state and stream, with
+        # the same bucket width the interval then streams at (see extend_graphs)
+        window = cursor['window']
+        if window:
+            n_ticks = int(window / retina.twin_rate) + 1
+            cursor['width'] = bucket_width(n_ticks)
+            cursor['cap'] = n_ticks if cursor['width'] == 1 else 2 * -(-n_ticks // cursor['width'])
+        else:
+            # room for the history to double before it is redrawn at a coarser width
+            cursor['width'] = bucket_width(2 * max(retina.pdata.seq, retina.vdata.seq))
+            cursor['cap'] = retina.max_points
+        cursor['columns'] = [retina.pdata.columns[0]] + states
+        cursor['pending'] = {stream: np.empty((0, len(cursor['columns']))) for stream in streams}
+        cursor['shown'] = {}
+        traces = {state: [] for state in states}
+        for stream, buffer in streams.items():
+            end = buffer.seq
+            first = 0
+            if window:
+                latest = buffer.latest()
+                if len(latest):
+                    first = buffer.search(latest[-1, 0] - window)
+            _, rows = buffer.read(first, end, cursor['columns'])
+            cursor[stream + 'tick'] = end
+            points = bucket(cursor, stream, rows)
+            for state, xy in zip(states, points):
+                traces[state].append(xy)
+            cursor['shown'][stream] = len(points[0][0]) if points else 0
+        return traces
+
+    def figure(state, traces):
+        (ptime_values, pdata_values), (vtime_values, vdata_values) = traces
+        data = [
+            go.Scatter(
+                x=ptime_values,
+                y=pdata_values,
+                mode='lines',
+                name=f'{state} pdata'
+            ),
+            go.Scatter(
+                x=vtime_values,
+                y=vdata_values,
+                mode='lines',
+                name=f'{state} vdata'
+            )
+        ]
+
+        layout = go.Layout(
+            xaxis=dict(
+                title="t [s]",
+                titlefont=dict(
+                    family="Courier New, monospace",
+                    size=18,
+                    color="#7f7f7f"
+                )
+            ),
+            yaxis=dict(
+                title=state,
+                titlefont=dict(
+                    family="Courier New, monospace",
+                    size=18,
+                    color="#7f7f7f"
+                )
+            )
+        )
+        return go.Figure(data=data, layout=layout)
+
     @retina.callback(
-        Output(ids.LIVE_GRAPHS, 'children'),
+        [Output(ids.LIVE_GRAPHS, 'children'),
+         Output(ids.CLIENT_ID, 'data')],
         [Input(ids.STATE_DROPDOWN, 'value'),
-         Input(ids.INTERVAL_COMPONENT, 'n_intervals'),
-         Input(ids.WINDOW_SIZE, 'value')]
+         Input(ids.WINDOW_SIZE, 'value')],
+        [State(ids.CLIENT_ID, 'data')]
     )
-    def update_graphs(selected_states, n, window_size):
+    def update_graphs(selected_states, window_size, client_id):
+        # Full redraw, only when the selection or the window changes; the interval then
+        # streams new points into these figures (see extend_graphs)
+        if client_id is None:
+            client_id = uuid.uuid4().hex
+        states = [state for state in retina.channels if state in selected_states]
+        cursors[client_id] = cursor = {'window': window_size or 0}
+        cursors.move_to_end(client_id)
+        while len(cursors) > MAX_CLIENTS:
+            cursors.popitem(last=False)
+        traces = draw(cursor, states)
+
         graphs = []
-        for state in retina.channels:
-            if state in selected_states:
-                ptime_values = list(retina.pdata.keys())
-                vtime_values = list(retina.vdata.keys())
-
-                # determine the threshold for the last window_size seconds
-                if ptime_values:  # Check if the list is not empty
-                    ptime_threshold = max(ptime_values) - window_size
-                else:
-                    ptime_threshold = 0  # You can assign any default value you want here
-
-                if vtime_values:  # Check if the list is not empty
-                    vtime_threshold = max(vtime_values) - window_size
-                else:
-                    vtime_threshold = 0  # You can assign any default value you want here
-
-                # filter keys that fall within the last 10 seconds
-                pkeys_to_keep = [key for key in ptime_values if key >= ptime_threshold]
-                vkeys_to_keep = [key for key in vtime_values if key >= vtime_threshold]
-
-                pdata_values = [retina.pdata[key][state] for key in pkeys_to_keep]
-                vdata_values = [retina.vdata[key][state] for key in vkeys_to_keep]
-
-                # use the filtered keys for the x-values
-                ptime_values = pkeys_to_keep
-                vtime_values = vkeys_to_keep
-
-                traces = [
-                    go.Scatter(
-                        x=ptime_values,
-                        y=pdata_values,
-                        mode='lines',
-                        name=f'{state} pdata'
-                    ),
-                    go.Scatter(
-                        x=vtime_values,
-                        y=vdata_values,
-                        mode='lines',
-                        name=f'{state} vdata'
-                    )
-                ]
-
-                layout = go.Layout(
-                    xaxis=dict(
-                        title="t [s]",
-                        titlefont=dict(
-                            family="Courier New, monospace",
-                            size=18,
-                            color="#7f7f7f"
-                        )
-                    ),
-                    yaxis=dict(
-                        title=state,
-                        titlefont=dict(
-                            family="Courier New, monospace",
-                            size=18,
-                            color="#7f7f7f"
-                        )
-                    )
-                )
-                graph = dcc.Graph(
-                    id={'type': 'dynamic-graph', 'index': state},
-                    figure=go.Figure(data=traces, layout=layout)
-                )
+        for state in states:
+            # last window_size seconds of each buffer, decimated to at most max_points points
+            graph = dcc.Graph(
+                id={'type': 'dynamic-graph', 'index': state},
+                figure=figure(state, traces[state])
+            )
+
+            stats_paragraph = dcc.Markdown(stats_text(state), id={'type': 'graph-stats', 'index': state})
 
-                # Mirroring Reporting
-                stats = "Test Name: {}  \n" \
-                        "Current error: {:.2f}  \n" \
-                        "Error tolerance: {:.2f}%  \n" \
-                        "Mirroring coefficient: {:.2f}%  ".format(retina.test_name,
-                                                                  retina.current_error_dict[state],
-                                                                  retina.tol * 100,
-                                                                  retina.mirrcoeff[state])
-                stats_paragraph = dcc.Markdown(stats)
+            stats_container = html.Div(children=stats_paragraph, style={'width': '30%', 'display': 'inline-block', 'vertical-align': 'middle'})
 
-                stats_container = html.Div(children=stats_paragraph, style={'width': '30%', 'display': 'inline-block', 'vertical-align': 'middle'})
+            graph_container = html.Div(children=graph, style={'width': '70%', 'display': 'inline-block', 'vertical-align': 'middle'})
 
-                graph_container = html.Div(children=graph, style={'width': '70%', 'display': 'inline-block', 'vertical-align': 'middle'})
+            # Add a subheading before each graph
+            subheading = html.H3(f"Data for {state}")
+
+            graph_and_stats = html.Div(children=[subheading, graph_container, stats_container])
+            graphs.append(graph_and_stats)
+
+        return graphs, client_id
+
+    @retina.callback(
+        [Output({'type': 'dynamic-graph', 'index': ALL}, 'extendData'),
+         Output({'type': 'dynamic-graph', 'index': ALL}, 'figure'),
+         Output({'type': 'graph-stats', 'index': ALL}, 'children')],
+        [Input(ids.INTERVAL_COMPONENT, 'n_intervals')],
+        [State(ids.CLIENT_ID, 'data')]
+    )
+    def extend_graphs(n, client_id):
+        # Send each client only the samples published since its cursor, decimated like the
+        # figures it holds (whole buckets only, the rest waits for the next interval)
+        cursor = cursors.get(client_id)
+        states = [output['id']['index'] for output in callback_context.outputs_list[0]]
+        if cursor is None or not states or cursor['columns'][1:] != states:
+            raise PreventUpdate
+        if all(buffer.seq == cursor[stream + 'tick'] for stream, buffer in streams.items()):
+            raise PreventUpdate
+        stats = [stats_text(state) for state in states]
 
-                # Add a subheading before each graph
-                subheading = html.H3(f"Data for {state}")
+        points = {}
+        for stream, buffer in streams.items():
+            end = buffer.seq
+            _, rows = buffer.read(cursor[stream + 'tick'], end, cursor['columns'])
+            cursor[stream + 'tick'] = end
+            points[stream] = bucket(cursor, stream, rows)
+            cursor['shown'][stream] += len(points[stream][0][0])
 
-                graph_and_stats = html.Div(children=[subheading, graph_container, stats_container])
-                graphs.append(graph_and_stats)
+        if not cursor['window'] and max(cursor['shown'].values()) > cursor['cap']:
+            # The whole history outgrew the cap: redraw it at a coarser width
+            traces = draw(cursor, states)
+            return [no_update] * len(states), [figure(state, traces[state]) for state in states], stats
 
-        return graphs
+        extend = []
+        for (px, py), (vx, vy) in zip(points['p'], points['v']):
+            data = {'x': [px.tolist(), vx.tolist()], 'y': [py.tolist(), vy.tolist()]}
+            # the cap keeps about window_size seconds of points in the browser
+            extend.append([data, [0, 1], cursor['cap']])
+        return extend, [no_update] * len(states), stats
 
-    return html.Div(id=ids.LIVE_GRAPHS)
+    return html.Div(children=[html.Div(id=ids.LIVE_GRAPHS), dcc.Store(id=ids.CLIENT_ID)])
@@ -1,87 +1,99 @@
 from dash import Dash, dcc, html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
 from . import ids
-import pandas as pd
 import numpy as np
-#
-# class Displacement:
-#     def __init__(self):
-#         self.surge = 0
-#         self.sway  = 0
-#         self.heave = 0
-#         self.roll  = 0
-#         self.pitch = 0
-#         self.yaw   = 0
-#
-#     def update_disp(self, vdata):
-#
-#         if len(vdata.keys()) == 0:
-#             self.surge = 0
-#             self.sway  = 0
-#             self.heave = 0
-#             self.roll  = 0
-#             self.pitch = 0
-#             self.yaw   = 0
-#         else:
-#             last_second = max(vdata.keys())
-#             self.surge = vdata[last_second]['Surge']
-#             self.sway  = vdata[last_second]['Sway']
-#             self.heave = vdata[last_second]['Heave']
-#             self.roll  = np.deg2rad(vdata[last_second]['Roll'])
-#             self.pitch = np.deg2rad(vdata[last_second]['Pitch'])
-#             self.yaw   = np.deg2rad(vdata[last_second]['Yaw'])
-
-# def rotation_matrix(roll, pitch, yaw):
-#     R_x = np.array([[1, 0, 0],
-#                     [0, np.cos(roll), -np.sin(roll)],
-#                     [0, np.sin(roll), np.cos(roll)]])
-#
-#     R_y = np.array([[np.cos(pitch), 0, np.sin(pitch)],
-#                     [0, 1, 0],
-#                     [-np.sin(pitch), 0, np.cos(pitch)]])
-#
-#     R_z = np.array([[np.cos(yaw), -np.sin(yaw), 0],
-#                     [np.sin(yaw), np.cos(yaw), 0],
-#                     [0, 0, 1]])
-#
-#     R = np.dot(R_z, np.dot(R_y, R_x))
-#     return R
-
-
-# def animator(data, disp):
-#     animated = data.copy()
-#     animated.reset_index(drop=True, inplace=True)
-#     animated["x"] = animated["x_original"] + disp.surge
-#     animated["y"] = animated["y_original"] + disp.sway
-#     animated["z"] = animated["z_original"] + disp.heave
-#
-#     # Get the rotation matrix for the given roll, pitch, and yaw
-#     R = rotation_matrix(disp.roll, disp.pitch, disp.yaw)
-#
-#     # Apply the rotation matrix to each point
-#     for i in range(len(animated)):
-#         point = np.array([animated.loc[i, "x"], animated.loc[i, "y"], animated.loc[i, "z"]])
-#         rotated_point = np.dot(R, point)
-#         animated.loc[i, ["x", "y", "z"]] = rotated_point
-#
-#     return animated
-
-
-
-def create_3d_figure(mesh_data, vdata):
-    min_val = mesh_data[['x', 'y', 'z']].min().min()
-    max_val = mesh_data[['x', 'y', 'z']].max().max()
-
-    # disp = Displacement()
-    # disp.update_disp(vdata)
-    # animated_data = animator(mesh_data, disp)
+
+# Platform rigid-body DOFs (surge, sway, heave, roll, pitch, yaw) by technical channel name
+DOF_CHANNELS = ['PtfmTDX', 'PtfmTDY', 'PtfmTDZ', 'PtfmRDX', 'PtfmRDY', 'PtfmRDZ']
+MAX_VERTICES = 5000   # vertices drawn in the 3D view (the mesh is decimated above this)
+POSE_TOL     = 1e-4   # smallest pose change (m, rad) pushed to the client
+
+
+def rotation_matrix(roll, pitch, yaw):
+    cr, sr = np.cos(roll), np.sin(roll)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    # R = R_z(yaw) R_y(pitch) R_x(roll)
+    return np.array([[cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr],
+                     [sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr],
+                     [-sp,     cp * sr,                cp * cr]])
+
+
+def rigid_body_transform(vertices, pose):
+    # Rotate then translate all (N x 3) vertices at once; pose = surge, sway, heave [m], roll, pitch, yaw [rad]
+    R = rotation_matrix(*pose[3:]).astype(np.float32)
+    return vertices @ R.T + np.asarray(pose[:3], dtype=np.float32)
+
+
+def display_vertices(mesh_data, max_vertices=MAX_VERTICES):
+    # In-memory (N x 3) float32 copy of the mesh vertices at rest, decimated to at most max_vertices
+    step = -(-len(mesh_data) // max_vertices)
+    return np.ascontiguousarray(mesh_data[::step], dtype=np.float32)
+
+
+def pose_reader(retina):
+    # Latest platform pose from the virtual buffer (DOFs that are not recorded stay at zero)
+    channel_info = retina.channel_info
+    lnames = dict(zip(channel_info['TNAME'], channel_info['LNAME']))
+    units = dict(zip(channel_info['TNAME'], channel_info['UNIT']))
+    dofs, cols, scale = [], [], []
+    for i, tname in enumerate(DOF_CHANNELS):
+        if tname in lnames:
+            dofs.append(i)
+            cols.append(retina.vdata.index(lnames[tname]))
+            scale.append(np.pi / 180 if units[tname] == 'deg' else 1.0)
+    scale = np.array(scale)
+
+    def read_pose():
+        pose = np.zeros(6)
+        rows = retina.vdata.latest()
+        if len(rows):
+            pose[dofs] = rows[-1, cols] * scale
+        return pose
+
+    return read_pose, bool(dofs)
+
+
+# Browser-side rigid_body_transform: moves the mesh at rest (sent once) to the pose, so the
+# interval only ships the six pose values
+MOVE_MESH_JS = '''
+function(pose, mesh, figure) {
+    if (!pose || !mesh || !figure) {
+        return window.dash_clientside.no_update;
+    }
+    const [surge, sway, heave, roll, pitch, yaw] = pose;
+    const cr = Math.cos(roll), sr = Math.sin(roll);
+    const cp = Math.cos(pitch), sp = Math.sin(pitch);
+    const cy = Math.cos(yaw), sy = Math.sin(yaw);
+    // R = R_z(yaw) R_y(pitch) R_x(roll)
+    const R = [cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr,
+               sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr,
+               -sp,     cp * sr,                cp * cr];
+    const n = mesh.x.length;
+    const x = new Array(n), y = new Array(n), z = new Array(n);
+    for (let i = 0; i < n; i++) {
+        const a = mesh.x[i], b = mesh.y[i], c = mesh.z[i];
+        x[i] = R[0] * a + R[1] * b + R[2] * c + surge;
+        y[i] = R[3] * a + R[4] * b + R[5] * c + sway;
+        z[i] = R[6] * a + R[7] * b + R[8] * c + heave;
+    }
+    const trace = Object.assign({}, figure.data[0], {x: x, y: y, z: z});
+    return Object.assign({}, figure, {data: [trace].concat(figure.data.slice(1))});
+}
+'''
+
+
+def create_3d_figure(vertices):
+    min_val = vertices.min()
+    max_val = vertices.max()
 
     traces = [
         go.Scatter3d(
-            x=mesh_data["x"], #x=animated_data["x"] if you want it animated
-            y=mesh_data["y"], #y=animated_data["y"] if you want it animated
-            z=mesh_data["z"], #z=animated_data["z"] if you want it animated
+            x=vertices[:, 0],
+            y=vertices[:, 1],
+            z=vertices[:, 2],
             mode='markers',
             marker=dict(size=2)
         )
@@ -99,6 +111,7 @@ def create_3d_figure(mesh_data, vdata):
                 eye=dict(x=1.5, y=-1.5, z=0.5),
             ),
         ),
+        uirevision='platform',  # keep the user's camera while the mesh moves
         autosize=False,
         width=900,  # Set the width and height to your desired values
         height=900,
@@ -108,37 +121,46 @@ def create_3d_figure(mesh_data, vdata):
 
 
 def render(retina, mesh_data, vdata):
+    vertices = display_vertices(mesh_data)
+    read_pose, animated = pose_reader(retina)
     graph = dcc.Graph(
-        id={'type': 'dynamic-graph'},
-        figure=create_3d_figure(mesh_data, vdata)
+        id=ids.VISUAL_3D,
+        figure=create_3d_figure(rigid_body_transform(vertices, read_pose()))
     )
 
     graph_container = html.Div(children=graph, id='3d-graph-container')
 
-    # update_graph_callback(retina)
+    children = [graph_container, dcc.Store(id=ids.VISUAL_3D_POSE)]
+    if animated:
+        # mesh at rest, moved in the browser (see MOVE_MESH_JS)
+        rest = np.round(vertices, 4)
+        children.append(dcc.Store(id=ids.VISUAL_3D_MESH,
+                                  data={'x': rest[:, 0].tolist(), 'y': rest[:, 1].tolist(), 'z': rest[:, 2].tolist()}))
+        update_graph_callback(retina, read_pose)
 
     return html.Div(
-        children=[graph_container],
+        children=children,
     )
 
-#
-# def update_graph_callback(retina):
-#     @retina.callback(
-#         Output({'type': 'dynamic-graph'}, 'figure'),
-#         Input(ids.INTERVAL_COMPONENT, 'n_intervals')
-#     )
-#     def update_graph(n_intervals):
-#         if len(retina.vdata.keys()) != 0:
-#             # Get the latest second's data
-#             last_second = max(retina.vdata.keys())
-#             last_second_data = retina.vdata[last_second]
-#
-#             dof_keys = ['Surge', 'Sway', 'Heave', 'Roll', 'Pitch', 'Yaw']
-#
-#             # Check if all degrees of freedom are available in the latest second's data
-#             if all(key in last_second_data for key in dof_keys):
-#                 return create_3d_figure(retina.mesh_data, retina.vdata)  # make sure retina.mesh_data is passed here
-#             else:
-#                 return go.Figure()  # return an empty figure
-#
-#
+
+def update_graph_callback(retina, read_pose):
+    @retina.callback(
+        Output(ids.VISUAL_3D_POSE, 'data'),
+        [Input(ids.INTERVAL_COMPONENT, 'n_intervals')],
+        [State(ids.VISUAL_3D_POSE, 'data')]
+    )
+    def update_pose(n_intervals, last_pose):
+        # Send only the latest pose (six values), and nothing at all while the platform has not
+        # moved since this client's last update; the browser moves the mesh
+        pose = read_pose()
+        if last_pose is not None and np.max(np.abs(pose - last_pose)) < POSE_TOL:
+            raise PreventUpdate
+        return pose.tolist()
+
+    retina.clientside_callback(
+        MOVE_MESH_JS,
+        Output(ids.VISUAL_3D, 'figure'),
+        [Input(ids.VISUAL_3D_POSE, 'data')],
+        [State(ids.VISUAL_3D_MESH, 'data'),
+         State(ids.VISUAL_3D, 'figure')]
+    )
@@ -2,14 +2,16 @@
 
 import numpy as np
 import pandas as pd
-import time
 import multiprocessing as mp
 import os
+import queue
 
 # Digital Twin Modules
 from DigiTWind.nerve import NervePhysical, NerveVirtual
 from DigiTWind.GUI.retina import Retina
 from DigiTWind.memory import Memory
+from DigiTWind.clock import TwinClock
+from DigiTWind.sources import prefetch
 
 class Brain:
     def __init__(self, dtw_settings):
@@ -20,6 +22,7 @@ class Brain:
         # time settings
         self.twin_rate     = dtw_settings['time_settings']['twin_rate']     # twin rate (twin frequency)
         self.t_max         = dtw_settings['time_settings']['t_max']         # maximum duration
+        self.t_grace       = dtw_settings['time_settings'].get('t_grace', 10.0)  # wait past t_max for lagging streams
         # channel information
         self.channel_info  = dtw_settings['channel_info']                   # channels information
         self.channels      = self.channel_info['TNAME']                     # channels name (technical)
@@ -28,178 +31,265 @@ class Brain:
         self.physical_env  = dtw_settings['modes']['physical_env']          # flag for the Physical system.
         self.virtual_env   = dtw_settings['modes']['virtual_env']           # flag for the virtual system.
         self.gui           = dtw_settings['modes']['gui']                   # flag for graphical user interface
-        # nodel configuration
+        # nodel configuration (a list of configurations twins a farm, one turbine each)
+        self.n_turbines    = dtw_settings.get('n_turbines', 1)
         if self.virtual_env:
-            self.model_config  = dtw_settings['model_config']
+            model_config       = dtw_settings['model_config']
+            self.model_configs = model_config if isinstance(model_config, (list, tuple)) else [model_config]
+            self.model_config  = self.model_configs[0]
+            self.n_turbines    = len(self.model_configs)
         # tolerance
         self.tol           = dtw_settings['tol']
         # variables
         self.pdata         = None
         self.vdata         = None
         # memory variables
-        self.memory        = Memory(self.channels_L, self.t_max, self.twin_rate)
+        self.memory        = Memory(self.channels_L, self.t_max, self.twin_rate, self.tol,
+                                    n_turbines=self.n_turbines)
+        # twin clock (shared real-time scheduler)
+        self.clock         = TwinClock(self.twin_rate)
+        self.n_ticks       = self.clock.tick_count(self.t_max)
 
 
     def load_pdata(self, filename):
-        self.pdata = NervePhysical(filename)
+        # filename: experiment file to replay, or a live PhysicalSource; in a farm, a list with
+        # one per turbine (a single one is shared by all turbines)
+        filenames = filename if isinstance(filename, (list, tuple)) else [filename] * self.n_turbines
+        self.pdatas = [NervePhysical(filename) for filename in filenames]
+        self.pdata = self.pdatas[0]
 
     def preprocess_pdata(self):
-        df = self.pdata.get_data()                               # import data
-        df = df[self.channels].copy()                            # isolate channels of interest
-        df = self.pdata.scale_data(df, self.channel_info, False) # scale channels of interest (and zero drift)
-        df = df[df['Time'] <= self.t_max + self.twin_rate]
-        time_range = np.arange(0, self.t_max + self.twin_rate, self.twin_rate)
-        df_interpolated = pd.DataFrame()
-        for channel in self.channels:
-            df_interpolated[channel] = np.interp(time_range, df['Time'], df[channel])
-        df_interpolated.reset_index(drop=True, inplace=True)
-        self.sync_pdata_df = df_interpolated
+        # Scaled physical data resampled onto the twin grid, read block by block on demand
+        # (scale channels of interest, no zero drift)
+        self.sync_pdata_blocks = [pdata.sync_blocks(self.channel_info, self.twin_rate, self.n_ticks, False)
+                                  for pdata in self.pdatas]
 
     def print_sync_pdata(self):
-        for i, row in self.sync_pdata_df.iterrows():
-            if row['Time'] <= self.t_max:
-                row_dict = row.to_dict()
-                row_dict['Time'] = row['Time']
-
-                # Create a mapping from TNAME to LNAME
-                tname_to_lname = dict(zip(self.channel_info['TNAME'], self.channel_info['LNAME']))
+        # Create a mapping from TNAME to LNAME
+        tname_to_lname = dict(zip(self.channel_info['TNAME'], self.channel_info['LNAME']))
+
+        # Blocks are read on background threads, so a source that is slow to deliver (a live
+        # acquisition) never holds the clock back
+        pending = [prefetch(sync_blocks) for sync_blocks in self.sync_pdata_blocks]
+        blocks = [turbine_blocks.get() for turbine_blocks in pending]  # first blocks are ready before the clock starts
+        starts = [0] * len(blocks)                                     # tick of the first row in the current blocks
+        n_ticks = 0
+        for tick in self.clock.ticks('physical', self.n_ticks):
+            # Move on to the blocks holding this tick, if they have arrived
+            late = False
+            for turbine in range(len(blocks)):
+                while blocks[turbine] is not None and tick >= starts[turbine] + len(blocks[turbine]):
+                    try:
+                        block = pending[turbine].get_nowait()
+                    except queue.Empty:
+                        late = True
+                        break
+                    starts[turbine] += len(blocks[turbine])
+                    blocks[turbine] = block
+            if any(block is None for block in blocks):
+                break
+            if late:
+                # The data for this tick is not there yet: skip the tick (counted as missed)
+                self.clock.miss('physical')
+                continue
+            n_ticks = tick + 1
+
+            # Advance the shared physical clock to this tick
+            self.memory.shared_ptick.value = tick
+            self.memory.shared_ptime.value = self.clock.time_of(tick)
+            for turbine, (block, start) in enumerate(zip(blocks, starts)):
+                row_dict = dict(zip(self.channels, block[tick - start]))
 
                 # Create a new dictionary with renamed keys
                 row_dict = {tname_to_lname.get(key, key): value for key, value in row_dict.items()}
 
                 row_dict = {k: float(f"{v:.4f}") if isinstance(v, float) else v for k, v in row_dict.items()}
-                print(f"P : {row_dict}")
-                # Store physical data in the shared dictionary
-                self.memory.shared_pdata[self.memory.shared_ptime.value] = row_dict
-                time.sleep(self.twin_rate)
-                self.memory.shared_ptime.value += self.twin_rate
-            else:
-                break
+                print(f"P{turbine + 1 if self.n_turbines > 1 else ' '}: {row_dict}")
+                # Store physical data in the shared ring buffer (keyed by the shared physical time)
+                row_dict['Time'] = self.memory.shared_ptime.value
+                self.memory.pbuffers[turbine].put(tick, [row_dict[channel] for channel in self.channels_L])
+            self.memory.tick.signal()
+
+        # Hold the last sample for one period, then mark the physical run as over
+        self.clock.wait('physical', n_ticks)
+        self.memory.shared_ptick.value = self.n_ticks
+        self.memory.shared_ptime.value = self.clock.time_of(self.n_ticks)
+        self.memory.tick.signal()
 
     def physproc1(self, filename):
         self.load_pdata(filename)
         self.preprocess_pdata()
         self.print_sync_pdata()
-
-    def print_sync_vdata(self):
-        while self.memory.shared_vtime.value <= self.t_max:
-            # Calculate the maximum value calculated in the model and whether it's syncronizable or not
-            Tvmax= self.vdata.shared_max_time
-
+        for pdata in self.pdatas:
+            pdata.report()
+
+    def print_sync_vdata(self, turbine=0):
+        # Create a mapping from TNAME to LNAME
+        tname_to_lname = dict(zip(self.channel_info['TNAME'], self.channel_info['LNAME']))
+
+        try:
+            self._sync_vdata(turbine, tname_to_lname)
+        finally:
+            # Mark this virtual stream as over, even if it stopped on an error
+            with self.memory.shared_vdone.get_lock():
+                self.memory.shared_vdone.value += 1
+            self.memory.tick.signal()
+
+    def _sync_vdata(self, turbine, tname_to_lname):
+        model_seen, seen = 0, 0
+        tick = 0
+        model_tick = 0  # last model sample at or before the current twin time
+        while tick < self.n_ticks:
             # Check if Physical Mode is on to synchronize with it.
-            if self.physical_env:
-                synchronizability = Tvmax.value >= self.memory.shared_ptime.value
-                self.memory.shared_vtime.value = self.memory.shared_ptime.value
-            else:
-                synchronizability = True
+            if self.physical_env and tick > self.memory.shared_ptick.value:
+                # Sleep until the physical twin reaches this tick
+                seen = self.memory.tick.wait(seen, timeout=self.twin_rate)
+                continue
 
-            if synchronizability:
-                # Get all data for the current time
-                data = self.vdata.shared_dict[self.memory.shared_vtime.value]
+            # Interpolate the model samples (native DT) onto the twin time, if it is syncronizable
+            vtime = self.clock.time_of(tick)
+            sample, model_tick = self.vdata.shared_buffers[turbine].interp(vtime, model_tick)
+            if sample is None:
+                # Sleep until the model publishes a new time step
+                model_seen = self.vdata.tick.wait(model_seen, timeout=self.twin_rate)
+                continue
 
-                # Select only the desired channels
-                data = {channel: data[channel] for channel in self.channels}
+            self.memory.shared_vtick.value = tick
+            self.memory.shared_vtime.value = vtime
 
-                for tname, unit in zip(self.channel_info['TNAME'], self.channel_info['UNIT']):
-                    if unit == 'deg':
-                        # Convert rad units to deg
-                        data[tname] = np.rad2deg(data[tname])
+            # Get all data for the current tick (desired channels only)
+            data = dict(zip(self.channels, sample))
 
-                # Create a mapping from TNAME to LNAME
-                tname_to_lname = dict(zip(self.channel_info['TNAME'], self.channel_info['LNAME']))
+            for tname, unit in zip(self.channel_info['TNAME'], self.channel_info['UNIT']):
+                if unit == 'deg':
+                    # Convert rad units to deg
+                    data[tname] = np.rad2deg(data[tname])
 
-                # Create a new dictionary with renamed keys
-                data = {tname_to_lname.get(key, key): value for key, value in data.items()}
+            # Create a new dictionary with renamed keys
+            data = {tname_to_lname.get(key, key): value for key, value in data.items()}
 
-                row_dict = {k: float(f"{v:.4f}") if isinstance(v, float) else v for k, v in data.items()}
+            row_dict = {k: float(f"{v:.4f}") if isinstance(v, float) else v for k, v in data.items()}
 
-                print(f"V : {row_dict}")
-                # Append data to list
-                self.memory.vdata_list.append(row_dict)
-                # Store virtual data in the shared dictionary
-                self.memory.shared_vdata[self.memory.shared_vtime.value] = row_dict
-                time.sleep(self.twin_rate)
-                self.memory.shared_vtime.value += self.twin_rate
+            print(f"V{turbine + 1 if self.n_turbines > 1 else ' '}: {row_dict}")
+            # Store virtual data in the shared ring buffer (keyed by the shared virtual time)
+            row_dict['Time'] = vtime
+            self.memory.vbuffers[turbine].put(tick, [row_dict[channel] for channel in self.channels_L])
+            self.memory.tick.signal()
+
+            if self.physical_env:
+                # The physical clock paces the virtual stream
+                tick += 1
+            else:
+                tick = self.clock.wait('virtual', tick + 1)
 
     def virtproc1(self, turbine_params, turbine_name, controller_params):
-        # mesh file
-        model_config = self.model_config
+        # one model (OpenFAST + DISCON) per turbine; turbine_name may be a list, one per turbine
+        turbine_names = turbine_name if isinstance(turbine_name, (list, tuple)) else [turbine_name] * self.n_turbines
         # Create an instance of NerveVirtual
-        self.vdata = NerveVirtual(self.twin_rate)
-
-        # Update twin rate in the DISCON file
-        self.vdata.update_twin_rate(model_config.param_filename, turbine_params, turbine_name, controller_params)
-        clean_variables, of_file = self.vdata.change_model_setup(
-            model_config.fastfile,
-            model_config.OF_filename,
-            model_config.f_list,
-            model_config.v_list,
-            model_config.des_v_list)
+        # (room for the model reporting at up to twice the twin rate)
+        self.vdata = NerveVirtual(self.twin_rate, self.channels, 2 * self.memory.capacity,
+                                  n_turbines=self.n_turbines)
+
+        setups = []
+        for turbine, (model_config, name) in enumerate(zip(self.model_configs, turbine_names)):
+            # Update twin rate (and ZeroMQ port) in the DISCON file
+            self.vdata.update_twin_rate(model_config.param_filename, turbine_params, name, controller_params,
+                                        turbine=turbine)
+            setups.append(self.vdata.change_model_setup(
+                model_config.fastfile,
+                model_config.OF_filename,
+                model_config.f_list,
+                model_config.v_list,
+                model_config.des_v_list))
 
         # Run ZeroMQ (P1) and OpenFAST(P2) in parallel
         p1 = mp.Process(target=self.vdata.run_zmq)
-        p2 = mp.Process(target=self.vdata.run_virtual, args=(
+        p2 = [mp.Process(target=self.vdata.run_virtual, args=(
             model_config.OF_filename,
             model_config.fastcall,
             model_config.fastfile,
             model_config.lib_name,
-            model_config.param_filename))
-        p3 = mp.Process(target=self.print_sync_vdata)
-
-        p1.start()
-        p2.start()
-
-        # Let the initiation finishes
-        while True:
-            if self.vdata.shared_max_time.value>0:
-                p3.start()
-                break
-
-        p1.join()
-        p2.join()
-        p3.join()
-
-        # Convert list of data points to DataFrame
-        df = pd.DataFrame(list(self.memory.vdata_list))  # Convert managed list to ordinary list
+            model_config.param_filename)) for model_config in self.model_configs]
+        p3 = [mp.Process(target=self.print_sync_vdata, args=(turbine,)) for turbine in range(self.n_turbines)]
+
+        try:
+            p1.start()
+            for p in p2:
+                p.start()
+
+            # Let the initiation finishes
+            model_seen = 0
+            while self.vdata.shared_max_time <= 0 and p1.is_alive():
+                model_seen = self.vdata.tick.wait(model_seen, timeout=1.0)
+            for p in p3:
+                p.start()
+
+            for p in [p1] + p2 + p3:
+                if p.pid is not None:
+                    p.join()
+        finally:
+            # Every virtual stream is over once its process has exited (or never started)
+            with self.memory.shared_vdone.get_lock():
+                self.memory.shared_vdone.value = max(self.memory.shared_vdone.value, self.n_turbines)
+            self.memory.tick.signal()
+
+        # Convert buffered data points to DataFrame
+        df = self.memory.vbuffer.to_frame()
         df['Time'] = pd.to_timedelta(df['Time'], unit='S')  # Assuming 'Time' is in seconds
         self.sync_vdata_df = df
 
-        # Restore model setup to clean version
-        self.vdata.restore_model_setup(
-            model_config.f_list,
-            model_config.v_list,
-            clean_variables, of_file)
+        for model_config, (clean_variables, of_file) in zip(self.model_configs, setups):
+            # Restore model setup to clean version
+            self.vdata.restore_model_setup(
+                model_config.f_list,
+                model_config.v_list,
+                clean_variables, of_file)
 
-        # Send output files to the designated output folder
-        self.vdata.output_manager(
-            model_config.OF_filename,
-            'output', of_file)
+            # Send output files to the designated output folder
+            self.vdata.output_manager(
+                model_config.OF_filename,
+                'output', of_file)
+
+        # Free the model sample buffers
+        self.vdata.release()
 
     def realize(self, channels):
-        error_dict = {channel: 0 for channel in channels[1:]}  # Initiate error_dict with zeros for all channels
-        while self.memory.shared_ptime.value <= self.t_max:
-            # Ensure that the current time exists in both shared dictionaries
-            if self.memory.shared_ptime.value in self.memory.shared_pdata and self.memory.shared_ptime.value in self.memory.shared_vdata:
-                if self.memory.shared_ptime.value == self.memory.shared_vtime.value:
-                    pdata_dict = self.memory.shared_pdata[self.memory.shared_ptime.value]
-                    vdata_dict = self.memory.shared_vdata[self.memory.shared_ptime.value]
-
-                    # Calculate the absolute error for each channel and add it to the corresponding total error
-                    for idx, channel in enumerate(self.channels_L):
-                        if channel != 'Time':  # Skip the first channel
-                            if channel in pdata_dict and channel in vdata_dict:
-                                pdata = pdata_dict[channel]
-                                vdata = vdata_dict[channel]
-                                error_dict[channel] = abs(pdata - vdata)
-                                self.memory.current_error_dict[channel] = error_dict[channel]
-                                self.memory.total_error_dict[channel] += error_dict[channel]
-                                tol = self.tol
-                                self.memory.fidelity_test(error_dict[channel], tol, channel)
-
-                for channel, error in error_dict.items():
-                    print(f"Current error for {channel}: {error}")
-
-                time.sleep(self.twin_rate)
+        ticks = [0] * self.n_turbines  # next tick to score, per turbine
+        seen = 0
+        # give up on streams still running t_grace after t_max (e.g. a model process that died)
+        deadline = self.clock.deadline(self.clock.tick_of(self.t_max + self.t_grace))
+        running = True
+        while running:
+            # until the physical run and every virtual stream are over
+            running = (self.memory.shared_ptime.value <= self.t_max
+                       or self.memory.shared_vdone.value < self.n_turbines)
+            if running and self.clock.now() > deadline:
+                print(f"Stopping the fidelity test: streams still running {self.t_grace} s after t_max")
+                running = False
+            for turbine, (pbuffer, vbuffer) in enumerate(zip(self.memory.pbuffers, self.memory.vbuffers)):
+                # Gather every tick both streams of this turbine have reached (O(1) lookup by tick index)
+                prows, vrows = [], []
+                tick = ticks[turbine]
+                while tick < min(pbuffer.seq, vbuffer.seq):
+                    prow = pbuffer.get(tick)
+                    vrow = vbuffer.get(tick)
+                    tick += 1
+                    if prow is not None and vrow is not None:  # skip ticks missed by one of the streams
+                        prows.append(prow)
+                        vrows.append(vrow)
+                ticks[turbine] = tick
+
+                if prows:
+                    # Score the aligned block for all channels at once (skip the time column);
+                    # turbines are scored independently so a slow one does not hold back the rest
+                    errors = self.memory.fidelity_test(np.array(prows)[:, 1:], np.array(vrows)[:, 1:],
+                                                       turbine if self.n_turbines > 1 else None)
+                    for channel, error in zip(channels[1:], errors):
+                        print(f"Current error for {self.memory.score_name(channel, turbine)}: {error}")
+
+            # Sleep until either stream publishes a new sample
+            if running:
+                seen = self.memory.tick.wait(seen, timeout=self.twin_rate)
 
         # Report Final Fidelity values
         self.memory.report_fidelity()
@@ -209,7 +299,7 @@ class Brain:
     def metrolize(self, filename=None, turbine_params=None,
                   turbine_name=None, controller_params=None):
         if self.physical_env and filename is None:
-            raise ValueError("A filename must be provided when running in physical mode.")
+            raise ValueError("A filename (or physical source) must be provided when running in physical mode.")
         if self.virtual_env and (turbine_params is None or turbine_name is None or controller_params is None):
             raise ValueError("All virtual parameters must be provided when running in virtual mode.")
 
@@ -236,6 +326,12 @@ class Brain:
         for p in processes:
             p.join()
 
+        # Report the twin clock timing statistics
+        self.clock.report()
+
+        # Free the shared twin buffers
+        self.memory.release()
+
     def visualize(self):
         if self.gui:
             app = Retina(self)
@@ -0,0 +1,171 @@
+# Copyright 2023 - Yuksel Rudy Alkarem
+
+import multiprocessing as mp
+import time
+import numpy as np
+
+
+class TwinClock:
+    '''
+    Drift-free real-time scheduler shared by all twin processes.
+
+    Tick k is due at the absolute monotonic deadline epoch + k * period, so the twin time of a
+    sample is always derived from its integer tick index and a late tick never pushes the
+    following ones back. Each stream (physical, virtual, ...) keeps its own jitter, overrun and
+    missed-tick counters in shared memory, updated under a lock since several processes may
+    drive the same stream (one virtual stream per turbine in a farm).
+    '''
+    STATS = ['ticks', 'missed', 'overruns', 'jitter_sum', 'jitter_sq', 'jitter_max']
+
+    def __init__(self, period, streams=('physical', 'virtual')):
+        self.period  = period
+        self.streams = list(streams)
+        self._epoch  = mp.Value('d', np.nan)   # monotonic time of tick 0, set by the first process to start
+        self._stats  = mp.RawArray('d', len(self.streams) * len(self.STATS))
+        self._lock   = mp.Lock()                # guards the read-modify-write of the stats
+
+    @property
+    def epoch(self):
+        if np.isnan(self._epoch.value):
+            with self._epoch.get_lock():
+                if np.isnan(self._epoch.value):
+                    self._epoch.value = time.monotonic()
+        return self._epoch.value
+
+    def time_of(self, tick):
+        # Twin time of a tick (rounded so equal ticks always give identical float keys)
+        return round(tick * self.period, 9)
+
+    def tick_of(self, t):
+        # Nearest tick to a twin time
+        return int(round(t / self.period))
+
+    def tick_count(self, t_max):
+        # Number of ticks with twin time <= t_max
+        return int(np.floor(t_max / self.period + 1e-9)) + 1
+
+    def deadline(self, tick):
+        return self.epoch + tick * self.period
+
+    def now(self):
+        return time.monotonic()
+
+    def current_tick(self):
+        return int((self.now() - self.epoch) // self.period)
+
+    def wait(self, stream, tick):
+        '''
+        Sleep until `tick` is due and return the tick to process. If the deadline was missed by
+        one period or more, the missed ticks are skipped (and counted) so the stream stays on the
+        wall clock instead of drifting behind it.
+        '''
+        deadline = self.deadline(tick)
+        now = time.monotonic()
+        if now < deadline:
+            time.sleep(deadline - now)
+            now = time.monotonic()
+        lateness = now - deadline
+        missed = int(lateness // self.period)
+
+        if missed > 0:
+            lateness -= missed * self.period
+        stats = self._stream_stats(stream)
+        with self._lock:
+            stats[0] += 1
+            if missed > 0:
+                stats[1] += missed
+                stats[2] += 1
+            stats[3] += lateness
+            stats[4] += lateness ** 2
+            stats[5] = max(stats[5], lateness)
+        return tick + missed
+
+    def miss(self, stream, n=1):
+        # Count ticks a stream skipped because its data was not there in time
+        stats = self._stream_stats(stream)
+        with self._lock:
+            stats[1] += n
+
+    def ticks(self, stream, stop, start=0):
+        # Yield tick indices in [start, stop) as each one falls due
+        tick = start
+        while tick < stop:
+            tick = self.wait(stream, tick)
+            if tick >= stop:
+                break
+            yield tick
+            tick += 1
+
+    def _stream_stats(self, stream):
+        i = self.streams.index(stream) * len(self.STATS)
+        return np.frombuffer(self._stats, dtype=np.float64)[i:i + len(self.STATS)]
+
+    def stats(self, stream):
+        with self._lock:
+            ticks, missed, overruns, jitter_sum, jitter_sq, jitter_max = self._stream_stats(stream).copy()
+        n = max(ticks, 1)
+        jitter_mean = jitter_sum / n
+        return {
+            'ticks'      : int(ticks),
+            'missed'     : int(missed),
+            'overruns'   : int(overruns),
+            'jitter_mean': jitter_mean,
+            'jitter_std' : np.sqrt(max(jitter_sq / n - jitter_mean ** 2, 0.0)),
+            'jitter_max' : jitter_max,
+        }
+
+    def report(self):
+        for stream in self.streams:
+            stats = self.stats(stream)
+            if stats['ticks']:
+                print(f"Clock [{stream}]: {stats['ticks']} ticks, {stats['missed']} missed in "
+                      f"{stats['overruns']} overruns, jitter {stats['jitter_mean'] * 1e3:.3f} ms "
+                      f"(std {stats['jitter_std'] * 1e3:.3f} ms, max {stats['jitter_max'] * 1e3:.3f} ms)")
+
+
+class LatencyHistogram:
+    '''
+    Log-binned latency histogram in shared memory (1 us to 10 s, 10 bins per decade plus an
+    underflow and an overflow bin), written by one process and readable by the others.
+    '''
+    EDGES = np.logspace(-6, 1, 71)
+
+    def __init__(self, name):
+        self.name    = name
+        self._counts = mp.RawArray('d', len(self.EDGES) + 1)
+        self._totals = mp.RawArray('d', 2)   # [sum, max]
+
+    def record(self, seconds):
+        np.frombuffer(self._counts, dtype=np.float64)[np.searchsorted(self.EDGES, seconds)] += 1
+        self._totals[0] += seconds
+        self._totals[1] = max(self._totals[1], seconds)
+
+    @property
+    def counts(self):
+        return np.frombuffer(self._counts, dtype=np.float64)
+
+    def percentile(self, q):
+        # Upper edge of the bin holding the q-th percentile (capped at the largest sample)
+        counts = self.counts
+        n = counts.sum()
+        if n == 0:
+            return np.nan
+        i = int(np.searchsorted(np.cumsum(counts), q / 100 * n))
+        return min(float(self.EDGES[min(i, len(self.EDGES) - 1)]), self._totals[1])
+
+    def stats(self):
+        n = int(self.counts.sum())
+        return {
+            'count': n,
+            'mean' : self._totals[0] / max(n, 1),
+            'p50'  : self.percentile(50),
+            'p99'  : self.percentile(99),
+            'max'  : self._totals[1],
+        }
+
+    def report(self):
+        stats = self.stats()
+        if stats['count']:
+            print(f"Latency [{self.name}]: {stats['count']} samples, mean {stats['mean'] * 1e3:.3f} ms, "
+                  f"p50 < {stats['p50'] * 1e3:.3f} ms, p99 < {stats['p99'] * 1e3:.3f} ms, "
+                  f"max {stats['max'] * 1e3:.3f} ms")
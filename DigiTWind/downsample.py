@@ -0,0 +1,74 @@
+# Copyright 2023 - Yuksel Rudy Alkarem
+
+import numpy as np
+
+
+def minmax(x, y, n_out):
+    '''
+    Min/max decimation: split the series into about n_out / 2 equal buckets and keep the
+    smallest and largest sample of each (plus both ends), so peaks survive however many points
+    are dropped.
+    '''
+    n = len(x)
+    if n_out is None or n <= n_out or n_out < 4:
+        return x, y
+    width = -(-n // ((n_out - 2) // 2))  # samples per bucket
+    n_full = n // width
+    body = y[:n_full * width].reshape(n_full, width)
+    offsets = np.arange(n_full) * width
+    picks = [[0, n - 1], offsets + body.argmin(axis=1), offsets + body.argmax(axis=1)]
+    if n_full * width < n:  # last, partial bucket
+        tail = y[n_full * width:]
+        picks.append([n_full * width + tail.argmin(), n_full * width + tail.argmax()])
+    idx = np.unique(np.concatenate(picks))  # back in time order
+    return x[idx], y[idx]
+
+
+def lttb(x, y, n_out):
+    '''
+    Largest-Triangle-Three-Buckets decimation: keep the first and last samples and, in each of
+    the n_out - 2 buckets in between, the sample forming the largest triangle with the previous
+    pick and the average of the next bucket.
+    '''
+    n = len(x)
+    if n_out is None or n <= n_out or n_out < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            cx, cy = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+
+def minmax_buckets(x, y, width):
+    '''
+    Min/max decimation in fixed buckets of `width` samples: the smallest and largest sample of
+    each full bucket, in time order (every sample when width is 1). Returns (x, y, used), where
+    the samples from `used` on, a last partial bucket, are left for the next call, so a stream
+    decimated in pieces gives the same points as decimated at once.
+    '''
+    if width <= 1:
+        return x, y, len(x)
+    used = len(x) // width * width
+    body = y[:used].reshape(-1, width)
+    offsets = np.arange(len(body))[:, None] * width
+    idx = np.sort(np.column_stack([body.argmin(axis=1), body.argmax(axis=1)]) + offsets, axis=1).ravel()
+    return x[idx], y[idx], used
+
+
+def decimate(x, y, n_out, method='minmax'):
+    # Reduce a (time, value) series to at most n_out points ('minmax' or 'lttb')
+    if method == 'minmax':
+        return minmax(x, y, n_out)
+    if method == 'lttb':
+        return lttb(x, y, n_out)
+    raise ValueError(f"Unknown decimation method: {method}")
@@ -0,0 +1,120 @@
+# Copyright 2023 - Yuksel Rudy Alkarem
+
+import numpy as np
+import pandas as pd
+
+
+class FidelityEngine:
+    '''
+    Vectorized fidelity scoring of virtual against physical data.
+
+    `update` takes aligned (ticks x channels) physical and virtual blocks and refreshes the
+    absolute error, running totals, mirroring coefficient, RMSE and normalized error for all
+    channels at once. The mirroring coefficient history is kept in a preallocated array.
+    Groups of channels (e.g. the channels of one turbine in a farm) can be scored on their
+    own with `columns`, so a group that falls behind does not hold back the others.
+    '''
+    def __init__(self, channels, n_ticks, tol, capacity=None,
+                 current_error=None, total_error=None, mirrcoeff=None):
+        self.channels      = list(channels)   # channels to score (without 'Time')
+        self.n_ticks       = n_ticks          # ticks in a full run (mirroring coefficient denominator)
+        self.tol           = tol
+        self.capacity      = int(np.ceil(n_ticks)) if capacity is None else capacity
+        n_channels         = len(self.channels)
+        # Per-channel state (may be views on shared memory so other processes can read it)
+        self.current_error = np.zeros(n_channels) if current_error is None else current_error
+        self.total_error   = np.zeros(n_channels) if total_error is None else total_error
+        self.mirrcoeff     = np.zeros(n_channels) if mirrcoeff is None else mirrcoeff
+        self.mirrcount     = np.zeros(n_channels)
+        self.sq_error      = np.zeros(n_channels)
+        self.psum          = np.zeros(n_channels)
+        self.psq           = np.zeros(n_channels)
+        # Time history
+        self.counts        = np.zeros(n_channels, dtype=np.int64)  # ticks scored per channel
+        self.mirrcoeff_t   = np.full((self.capacity, n_channels), np.nan)
+
+    @property
+    def count(self):
+        return int(self.counts.max()) if len(self.counts) else 0
+
+    def update(self, pdata, vdata, columns=None):
+        # columns: indices of the channels in the blocks (default: all), scored together
+        cols = slice(None) if columns is None else columns
+        pdata = np.atleast_2d(np.asarray(pdata, dtype=np.float64))
+        vdata = np.atleast_2d(np.asarray(vdata, dtype=np.float64))
+        n = len(pdata)
+        if n == 0:
+            return self.current_error[cols]
+
+        error = np.abs(pdata - vdata)
+        self.current_error[cols] = error[-1]
+        self.total_error[cols]  += error.sum(axis=0)
+        self.sq_error[cols]     += (error ** 2).sum(axis=0)
+        self.psum[cols]         += pdata.sum(axis=0)
+        self.psq[cols]          += (pdata ** 2).sum(axis=0)
+
+        # Mirroring count/coefficient after each tick of the block
+        mirrcount = self.mirrcount[cols] + np.cumsum(error < self.tol, axis=0)
+        mirrcoeff_t = mirrcount / self.n_ticks * 1e2
+        self.mirrcount[cols] = mirrcount[-1]
+        self.mirrcoeff[cols] = mirrcoeff_t[-1]
+
+        start = int(self.counts[cols].max())
+        if start + n > self.capacity:
+            self._grow(start + n)
+        self.mirrcoeff_t[start:start + n, cols] = mirrcoeff_t
+        self.counts[cols] = start + n
+        return self.current_error[cols]
+
+    def _grow(self, size):
+        history = np.full((max(size, 2 * self.capacity), len(self.channels)), np.nan)
+        history[:self.count] = self.mirrcoeff_t[:self.count]
+        self.mirrcoeff_t = history
+        self.capacity = len(history)
+
+    @property
+    def rmse(self):
+        return np.sqrt(self.sq_error / np.maximum(self.counts, 1))
+
+    @property
+    def normalized_error(self):
+        # RMSE normalized by the standard deviation of the physical data
+        n = np.maximum(self.counts, 1)
+        pstd = np.sqrt(np.maximum(self.psq / n - (self.psum / n) ** 2, 0.0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(pstd > 0, self.rmse / pstd, np.nan)
+
+    def history(self):
+        return pd.DataFrame(self.mirrcoeff_t[:self.count], columns=self.channels)
+
+    def summary(self):
+        return pd.DataFrame({
+            'total_error'     : self.total_error,
+            'rmse'            : self.rmse,
+            'normalized_error': self.normalized_error,
+            'mirrcoeff'       : self.mirrcoeff,
+        }, index=self.channels)
+
+
+def rescore(pdata, vdata, channels, tol, n_ticks=None):
+    '''
+    Offline batch re-scoring of a whole run.
+
+    pdata, vdata: DataFrames (or CSV filenames) with a 'Time' column and the `channels` columns.
+    The virtual data is interpolated onto the physical times before scoring.
+    '''
+    if isinstance(pdata, str):
+        pdata = pd.read_csv(pdata)
+    if isinstance(vdata, str):
+        vdata = pd.read_csv(vdata)
+
+    ptime = pdata['Time'].to_numpy(dtype=np.float64)
+    vtime = vdata['Time'].to_numpy(dtype=np.float64)
+    pblock = pdata[channels].to_numpy(dtype=np.float64)
+    vblock = np.column_stack([np.interp(ptime, vtime, vdata[channel].to_numpy(dtype=np.float64))
+                              for channel in channels])
+
+    engine = FidelityEngine(channels, len(ptime) if n_ticks is None else n_ticks, tol,
+                            capacity=len(ptime))
+    engine.update(pblock, vblock)
+    return engine
@@ -1,37 +1,332 @@
 # Copyright 2023 - Yuksel Rudy Alkarem
 
 import multiprocessing as mp
+from multiprocessing import resource_tracker, shared_memory
 import os
+import sys
+import threading
+import numpy as np
 import pandas as pd
 
+# Digital Twin Modules
+from DigiTWind.downsample import decimate
+from DigiTWind.fidelity import FidelityEngine
+
+
+_attach_lock = threading.Lock()
+
+
+def _attach_shared_memory(name):
+    '''
+    Attach to an existing shared memory segment without registering it with the resource
+    tracker: the creating process owns (and unlinks) the segment, and a process that merely
+    attached must not have it unlinked or reported as leaked when it exits.
+    '''
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Older versions always register on attach. Unregistering afterwards is not an option: a
+    # spawned child shares its parent's tracker, so that would drop the creator's registration
+    # as well. Skip the registration instead.
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class RingBuffer:
+    '''
+    Fixed-width float64 ring buffer living in shared memory.
+
+    One row per sample (time + channel columns), stored in slot `tick % capacity` and stamped
+    with its tick index so a row is found in O(1) by tick. A single writer publishes rows by
+    stamping them and bumping the sequence counter; any number of readers copy rows out without
+    locks and discard whatever the writer overwrote while they were reading.
+    '''
+    HEADER = 1  # int64 slots in front of the stamps: [sequence counter = last tick + 1]
+
+    def __init__(self, columns, capacity, name=None):
+        self.columns  = list(columns)
+        self.width    = len(self.columns)
+        self.capacity = int(capacity)
+        nbytes        = 8 * (self.HEADER + self.capacity + self.capacity * self.width)
+        if name is None:
+            self.shm  = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            self.shm  = _attach_shared_memory(name)
+        self._attach()
+        if name is None:
+            self._header[:] = 0
+            self._stamps[:] = -1
+            self._data[:]   = np.nan
+
+    def _attach(self):
+        self._header = np.ndarray((self.HEADER,), dtype=np.int64, buffer=self.shm.buf)
+        self._stamps = np.ndarray((self.capacity,), dtype=np.int64, buffer=self.shm.buf,
+                                  offset=8 * self.HEADER)
+        self._data   = np.ndarray((self.capacity, self.width), dtype=np.float64,
+                                  buffer=self.shm.buf, offset=8 * (self.HEADER + self.capacity))
+
+    # Re-attach by name when sent to a spawned process
+    def __getstate__(self):
+        return {'columns': self.columns, 'capacity': self.capacity, 'name': self.shm.name}
+
+    def __setstate__(self, state):
+        self.columns  = state['columns']
+        self.width    = len(self.columns)
+        self.capacity = state['capacity']
+        self.shm      = _attach_shared_memory(state['name'])
+        self._attach()
+
+    @property
+    def seq(self):
+        # One past the newest tick written (number of rows for a gap-free stream)
+        return int(self._header[0])
+
+    def __len__(self):
+        return min(self.seq, self.capacity)
+
+    def index(self, column):
+        return self.columns.index(column)
+
+    def put(self, tick, row):
+        # Single writer only: invalidate the slot, write the row, then stamp and publish it
+        slot = tick % self.capacity
+        self._stamps[slot] = -1
+        self._data[slot] = row
+        self._stamps[slot] = tick
+        if tick >= self._header[0]:
+            self._header[0] = tick + 1
+
+    def append(self, row):
+        self.put(self.seq, row)
+
+    def get(self, tick):
+        # Copy of the row for `tick`, or None if not written yet / already overwritten
+        slot = tick % self.capacity
+        if tick < 0 or self._stamps[slot] != tick:
+            return None
+        row = self._data[slot].copy()
+        if self._stamps[slot] != tick:
+            return None
+        return row
+
+    def read(self, start=0, stop=None, columns=None):
+        # Copy rows with ticks in [start, stop), optionally only some columns; returns (first_tick, rows)
+        end = self.seq
+        stop = end if stop is None else min(stop, end)
+        start = max(start, end - self.capacity, 0)
+        cols = slice(None) if columns is None else [self.index(column) for column in columns]
+        if stop <= start:
+            return start, np.empty((0, self.width))[:, cols]
+        ticks = np.arange(start, stop)
+        idx = ticks % self.capacity
+        before = self._stamps[idx]
+        rows = self._data[idx] if columns is None else self._data[np.ix_(idx, cols)]
+        # Keep rows that were stamped with their tick both before and after the copy
+        valid = (before == ticks) & (self._stamps[idx] == ticks)
+        return start, rows[valid]
+
+    def latest(self, n=1):
+        _, rows = self.read(self.seq - n)
+        return rows
+
+    def _time(self, tick, stop):
+        # Time of the first published row at or after `tick` (inf if there is none before `stop`)
+        while tick < stop:
+            slot = tick % self.capacity
+            if self._stamps[slot] == tick:
+                return self._data[slot, 0]
+            tick += 1
+        return np.inf
+
+    def search(self, t, right=False):
+        # First tick with time >= t (> t if `right`), by bisection over the ticks held
+        end = self.seq
+        lo, hi = max(end - self.capacity, 0), end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            time = self._time(mid, hi)
+            if time < t or (right and time == t):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def window(self, start=None, stop=None, columns=None):
+        '''
+        Rows with start <= time <= stop (open ends when None) for `columns` (time first, all
+        columns when None). The bounds are found by bisection, so the cost depends on the window,
+        not on how long the buffer has been written.
+        '''
+        first = 0 if start is None else self.search(start)
+        last = None if stop is None else self.search(stop, right=True)
+        if columns is not None:
+            columns = [self.columns[0]] + [column for column in columns if column != self.columns[0]]
+        _, rows = self.read(first, last, columns)
+        return rows
+
+    def series(self, column, duration=None, max_points=None, method='minmax'):
+        '''
+        (time, values) of `column` over the last `duration` seconds (everything when None),
+        decimated to at most `max_points` points ('minmax' or 'lttb').
+        '''
+        start = None
+        if duration is not None:
+            last = self.latest()
+            start = last[-1, 0] - duration if len(last) else None
+        rows = self.window(start, columns=[column])
+        return decimate(rows[:, 0], rows[:, -1], max_points, method)
+
+    def interp(self, t, start=0):
+        '''
+        Linearly interpolate all columns at time `t` (column 0) from a gap-free stream whose
+        times increase with the tick. Returns (row, tick) where `tick` is the last row at or
+        before `t`, to be passed back as `start` so successive calls walk forward in O(1).
+        The row is None while `t` is not bracketed by published rows.
+        '''
+        end = self.seq
+        tick = max(start, end - self.capacity, 0)
+        while tick + 1 < end and self._data[(tick + 1) % self.capacity, 0] <= t:
+            tick += 1
+        lo = self.get(tick)
+        if lo is None or lo[0] > t:
+            return None, tick
+        if lo[0] == t:
+            return lo, tick
+        hi = self.get(tick + 1)
+        if hi is None:
+            return None, tick
+        weight = (t - lo[0]) / (hi[0] - lo[0])
+        return lo + weight * (hi - lo), tick
+
+    def to_frame(self):
+        _, rows = self.read()
+        return pd.DataFrame(rows, columns=self.columns)
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class ChannelVector:
+    '''
+    Per-channel float64 values in shared memory with dict-style access by channel name.
+    '''
+    def __init__(self, channels, value=0.0):
+        self.channels = list(channels)
+        self._index   = {channel: i for i, channel in enumerate(self.channels)}
+        self._array   = mp.RawArray('d', len(self.channels))
+        self.values   = np.frombuffer(self._array, dtype=np.float64)
+        self.values[:] = value
+
+    def __getstate__(self):
+        return {'channels': self.channels, '_array': self._array}
+
+    def __setstate__(self, state):
+        self.channels = state['channels']
+        self._index   = {channel: i for i, channel in enumerate(self.channels)}
+        self._array   = state['_array']
+        self.values   = np.frombuffer(self._array, dtype=np.float64)
+
+    def __getitem__(self, channel):
+        return float(self.values[self._index[channel]])
+
+    def __setitem__(self, channel, value):
+        self.values[self._index[channel]] = value
+
+    def __contains__(self, channel):
+        return channel in self._index
+
+    def keys(self):
+        return list(self.channels)
+
+    def items(self):
+        return [(channel, float(value)) for channel, value in zip(self.channels, self.values)]
+
+
+class Tick:
+    '''
+    Shared wake-up counter: producers signal when new samples exist, consumers block until
+    the counter moves past what they have already seen (or the timeout expires).
+    '''
+    def __init__(self):
+        self._cond = mp.Condition()
+        self._seq  = mp.RawValue('q', 0)
+
+    @property
+    def seq(self):
+        return self._seq.value
+
+    def signal(self):
+        with self._cond:
+            self._seq.value += 1
+            self._cond.notify_all()
+
+    def wait(self, seen, timeout=None):
+        # Return the current counter once it exceeds `seen`, or after `timeout` seconds
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq.value > seen, timeout)
+            return self._seq.value
+
 
 class Memory:
-    def __init__(self, channels, t_max, twin_rate):
+    def __init__(self, channels, t_max, twin_rate, tol=0.0, capacity=None, n_turbines=1):
         self.channels           = channels
         self.t_max              = t_max
         self.twin_rate          = twin_rate
-        self.manager            = mp.Manager()  # Create a Manager
-        self.shared_ptime       = self.manager.Value('d', 0.0) # Create a shared dictionary for the physical time
-        self.shared_vtime       = self.manager.Value('d', 0.0) # Create a shared dictionary for the virtual time
-        self.shared_pdata       = self.manager.dict() # Create a shared dictionary for the physical data
-        self.shared_vdata       = self.manager.dict() # Create a shared dictionary for the virtual data
-        self.vdata_list         = self.manager.list()  # Use the Manager to create the list for virtual data
+        self.tol                = tol
+        if capacity is None:    # hold the full run by default
+            capacity            = int(np.ceil(t_max / twin_rate)) + 2
+        self.capacity           = capacity
+        self.n_turbines         = n_turbines
+        self.shared_ptime       = mp.Value('d', 0.0) # Shared physical time
+        self.shared_vtime       = mp.Value('d', 0.0) # Shared virtual time
+        self.shared_ptick       = mp.Value('q', 0)   # Shared physical tick index
+        self.shared_vtick       = mp.Value('q', 0)   # Shared virtual tick index
+        self.shared_vdone       = mp.Value('i', 0)   # Virtual streams (turbines) that have finished
+        self.tick               = Tick()             # Signaled whenever a buffer or the shared clock moves
+        self.pbuffers           = [RingBuffer(channels, capacity) for _ in range(n_turbines)] # Physical data ring buffers (time + channels), one per turbine
+        self.vbuffers           = [RingBuffer(channels, capacity) for _ in range(n_turbines)] # Virtual data ring buffers (time + channels), one per turbine
+        self.pbuffer            = self.pbuffers[0]
+        self.vbuffer            = self.vbuffers[0]
         self.sync_pdata_df      = None
         self.sync_vdata_df      = None
-        # Fidelity Testing
-        self.mirrcount          = {channel: 0.0 for channel in self.channels} # Mirroring count for fidelity testing
-        self.mirrcoeff          = self.manager.dict({channel: 0.0 for channel in self.channels}) # Mirroring coefficient for fidelity testing
-        self.mirrcoeff_t        = {channel: [] for channel in self.channels[1:]}   # Mirroring coefficient as a function of time
-        self.total_error_dict   = self.manager.dict({channel: 0 for channel in
-                            channels[1:]})  # Initiate total_error_dict with zeros for all channels
-        self.current_error_dict = self.manager.dict({channel: 0 for channel in
-                            channels[1:]})
-    def fidelity_test(self, error, tol, channel):
-        if error < tol:
-            self.mirrcount[channel] += 1
-
-        self.mirrcoeff[channel] = self.mirrcount[channel] / (self.t_max / self.twin_rate + 1) * 1e2
-        self.mirrcoeff_t[channel].append(self.mirrcoeff[channel])
+        # Fidelity Testing (one engine for all turbines: turbine by turbine blocks of channels)
+        scored                  = [self.score_name(channel, turbine) for turbine in range(n_turbines)
+                                   for channel in channels[1:]]
+        self.mirrcoeff          = ChannelVector(scored)  # Mirroring coefficient for fidelity testing
+        self.total_error_dict   = ChannelVector(scored)  # Initiate total_error_dict with zeros for all channels
+        self.current_error_dict = ChannelVector(scored)
+        self.fidelity           = FidelityEngine(scored, self.t_max / self.twin_rate + 1, tol,
+                                                 capacity=capacity,
+                                                 current_error=self.current_error_dict.values,
+                                                 total_error=self.total_error_dict.values,
+                                                 mirrcoeff=self.mirrcoeff.values)
+
+    def score_name(self, channel, turbine=0):
+        # Name of a channel in the fidelity results (prefixed by the turbine in a farm)
+        return channel if self.n_turbines == 1 else f"WT{turbine + 1} {channel}"
+
+    def turbine_columns(self, turbine):
+        # Fidelity columns of one turbine
+        width = len(self.channels) - 1
+        return slice(turbine * width, (turbine + 1) * width)
+
+    @property
+    def mirrcoeff_t(self):
+        # Mirroring coefficient as a function of time
+        return self.fidelity.history()
+
+    def fidelity_test(self, pdata, vdata, turbine=None):
+        # Score aligned (ticks x channels) physical and virtual blocks (channels without time),
+        # of one turbine, or of all turbines side by side when turbine is None
+        columns = None if turbine is None else self.turbine_columns(turbine)
+        return self.fidelity.update(pdata, vdata, columns)
 
     def write_mirrcoeff_t(self, filename="mirrcoeff_t.csv"):
         # Check if the directory exists and create it if necessary
@@ -39,14 +334,23 @@ class Memory:
         if not os.path.exists(outdir):
             os.makedirs(outdir)
 
-        # Creating DataFrame from mirrcoeff_t dictionary
-        df = pd.DataFrame(self.mirrcoeff_t)
+        # Creating DataFrame from mirrcoeff_t history
+        df = self.mirrcoeff_t
 
         # Writing DataFrame to CSV
         df.to_csv(os.path.join(outdir, filename), index=False)
 
     def report_fidelity(self):
-        for channel, total_error in self.total_error_dict.items():
+        mirrcoeff_t = self.mirrcoeff_t
+        for (channel, total_error), rmse, nerror in zip(self.total_error_dict.items(),
+                                                       self.fidelity.rmse, self.fidelity.normalized_error):
             print(f"Total error for {channel}: {total_error}")
+            print(f"RMSE for {channel}: {rmse} (normalized: {nerror})")
             print(f"mirroring coefficient for {channel}: {self.mirrcoeff[channel]}")
-            print(f"mirroring coefficient in time for {channel}: {self.mirrcoeff_t[channel]}")
\ No newline at end of file
+            print(f"mirroring coefficient in time for {channel}: {mirrcoeff_t[channel].tolist()}")
+
+    def release(self):
+        # Free the shared-memory blocks (call once, from the process that created them)
+        for buffer in self.pbuffers + self.vbuffers:
+            buffer.close()
+            buffer.unlink()
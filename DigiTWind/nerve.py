@@ -3,60 +3,172 @@
 import pandas as pd
 import numpy as np
 import multiprocessing as mp
-from multiprocessing import Process, Manager
 from ROSCO_toolbox.ofTools.fast_io.FAST_reader import InputReader_OpenFAST
 from ROSCO_toolbox.ofTools.fast_io.FAST_writer import InputWriter_OpenFAST
 from ROSCO_toolbox import control_interface as ROSCO_ci
-from ROSCO_toolbox.control_interface import turbine_zmq_server
+from ROSCO_toolbox.control_interface import farm_zmq_server
 from ROSCO_toolbox.inputs.validation import load_rosco_yaml
 from ROSCO_toolbox.utilities import run_openfast
 from ROSCO_toolbox.utilities import read_DISCON, write_DISCON
 from ROSCO_toolbox import turbine as ROSCO_turbine
 from ROSCO_toolbox import controller as ROSCO_controller
 import os
+import queue
+import threading
 import time
 
+# Digital Twin Modules
+from DigiTWind.clock import LatencyHistogram
+from DigiTWind.memory import RingBuffer, Tick
+from DigiTWind.sources import PhysicalSource, FileSource
+
 class NervePhysical:
-    def __init__(self, filename):
-        self.data = pd.read_csv(filename)
+    def __init__(self, source, chunksize=10000):
+        # source: experiment file name (replayed) or a PhysicalSource (live acquisition)
+        if isinstance(source, PhysicalSource):
+            self.filename = None
+            self.source   = source
+        else:
+            self.filename = source
+            self.source   = None
+        self.chunksize = chunksize   # rows read per block when replaying a file
+        self.data      = None
 
     def get_data(self):
+        # Whole experiment file (loaded on first use; streaming does not need it)
+        if self.data is None:
+            self.data = pd.read_csv(self.filename)
         return self.data
 
-    def scale_data(self, df, channel_info, zero_drift):
-        tnames = channel_info['TNAME']
-        units = channel_info['UNIT']
+    def stream(self, channels):
+        # Yield raw blocks (rows x channels, in `channels` order) from the source
+        if self.source is None:
+            self.source = FileSource(self.filename, channels, self.chunksize)
+        elif list(self.source.channels) != list(channels):
+            raise ValueError(f"Physical source channels {self.source.channels} do not match {channels}")
+        return self.source.blocks()
+
+    def report(self):
+        if self.source is not None:
+            stats = self.source.stats()
+            print(f"Physical source: {stats['received']} samples received, {stats['dropped']} dropped, "
+                  f"{stats['malformed']} malformed packets discarded")
+
+    def sync_blocks(self, channel_info, twin_rate, n_ticks, zero_drift=False, drift_window=None):
+        '''
+        Yield scaled blocks resampled onto the twin grid (tick k at time k * twin_rate, time in
+        column 0) as the source delivers them. Interpolation carries the last raw sample across
+        chunk boundaries, and the last sample is held until the end of the grid. With zero_drift,
+        channels are zeroed online by a running (or `drift_window`-sample windowed) mean.
+        '''
+        channels = channel_info['TNAME']
+        scale = self.scale_vector(channel_info)  # built once, applied to every block
+        drift = ZeroDrift(len(channels) - 1, drift_window) if zero_drift else None
+        tick = 0
+        last = None
+        for raw in self.stream(channels):
+            raw = raw * scale
+            if drift is not None:
+                raw[:, 1:] = drift.update(raw[:, 1:])
+            if last is not None:
+                raw = np.vstack([last, raw])
+            last = raw[-1:]
+
+            # Twin ticks covered by the samples read so far
+            stop = min(n_ticks, int(np.floor(raw[-1, 0] / twin_rate + 1e-9)) + 1)
+            if stop > tick:
+                yield self._resample(raw, np.arange(tick, stop) * twin_rate)
+                tick = stop
+            if tick >= n_ticks:
+                return
+
+        if last is not None and tick < n_ticks:
+            yield self._resample(last, np.arange(tick, n_ticks) * twin_rate)
+
+    @staticmethod
+    def _resample(raw, time_range):
+        block = np.empty((len(time_range), raw.shape[1]))
+        block[:, 0] = time_range
+        for i in range(1, raw.shape[1]):
+            block[:, i] = np.interp(time_range, raw[:, 0], raw[:, i])
+        return block
+
+    @staticmethod
+    def scale_vector(channel_info):
+        # Froude scale factor per channel: sqrt(scale) for 's', scale for 'm', 1 otherwise ('deg', ...)
         scale = channel_info['scale']  # now scale is a common value for all channels
+        factors = {'s': np.sqrt(scale), 'm': scale}
+        return np.array([factors.get(unit, 1.0) for unit in channel_info['UNIT']], dtype=np.float64)
 
-        for tname, unit in zip(tnames, units):
-            if unit == 's':
-                df[tname] *= np.sqrt(scale)
-            elif unit == 'm':
-                df[tname] *= scale
-            # For 'deg' or any other unit, do nothing
+    def scale_data(self, df, channel_info, zero_drift):
+        tnames = channel_info['TNAME']
+        df[tnames] = df[tnames].to_numpy(dtype=np.float64) * self.scale_vector(channel_info)
 
         # If zero drift is to be considered, apply it to all channels except 'Time'
         if zero_drift:
-            for tname in tnames:
-                if tname != 'Time':
-                    df[tname] -= df[tname].mean()  # Subtract mean to make it zero-mean
+            others = [tname for tname in tnames if tname != 'Time']
+            df[others] -= df[others].mean()  # Subtract mean to make it zero-mean
 
         return df
 
 
+class ZeroDrift:
+    '''
+    Online zero-drift correction: subtracts from each sample the mean of the samples seen so
+    far (running mean) or of the last `window` samples (windowed mean), one block at a time.
+    '''
+    def __init__(self, n_channels, window=None):
+        self.window  = window
+        self.total   = np.zeros(n_channels)  # running sum (running mean)
+        self.count   = 0
+        self.history = np.empty((0, n_channels))  # last window - 1 samples (windowed mean)
+
+    def update(self, block):
+        if self.window is None:
+            counts = self.count + np.arange(1, len(block) + 1)
+            sums = self.total + np.cumsum(block, axis=0)
+            self.total = sums[-1]
+            self.count = counts[-1]
+            return block - sums / counts[:, None]
+
+        full = np.vstack([self.history, block])
+        sums = np.vstack([np.zeros((1, full.shape[1])), np.cumsum(full, axis=0)])
+        end = np.arange(len(self.history) + 1, len(full) + 1)  # one past each new sample
+        begin = np.maximum(end - self.window, 0)
+        self.history = full[-(self.window - 1):] if self.window > 1 else full[:0]
+        return block - (sums[end] - sums[begin]) / (end - begin)[:, None]
+
+
 class NerveVirtual:
-    def __init__(self, twin_rate):
-        self.twin_rate = twin_rate
-        self.manager   = Manager()
-        self.shared_dict = self.manager.dict()
-        self.shared_max_time = self.manager.Value('d', 0.0)
+    def __init__(self, twin_rate, channels, capacity, n_turbines=1, base_port=5555):
+        self.twin_rate  = twin_rate
+        self.channels   = channels    # measurement channels to keep (technical names, 'Time' first)
+        self.n_turbines = n_turbines  # models twinned at once (one ZeroMQ port each)
+        self.ports      = [base_port + turbine for turbine in range(n_turbines)]
+        self.shared_buffers = [RingBuffer(channels, capacity) for _ in range(n_turbines)]  # model samples at their native times
+        self.shared_buffer = self.shared_buffers[0]
+        self.shared_max_times = mp.RawArray('d', n_turbines)  # latest model time of each turbine
+        self.tick = Tick()  # Signaled on every new model time step (of any turbine)
+        self.setpoints = mp.RawArray('d', 5 * n_turbines)  # Precomputed replies: gen torque, nacelle heading, 3 blade pitches
+        self.reply_latency   = LatencyHistogram('zmq reply')    # measurement received -> setpoints sent
+        self.publish_latency = LatencyHistogram('zmq publish')  # measurement received -> in shared_buffer
+
+    @property
+    def shared_max_time(self):
+        # Model time reached by all turbines
+        return min(self.shared_max_times)
 
-    def update_twin_rate(self, param_filename, turbine_params, turbine_name, controller_params):
+    def set_setpoints(self, genTorque=0.0, nacelleHeading=0.0, bladePitch=(0.0, 0.0, 0.0), turbine=0):
+        # Setpoints returned to ROSCO from the next controller step on
+        self.setpoints[5 * turbine:5 * turbine + 5] = [genTorque, nacelleHeading, *bladePitch]
+
+    def update_twin_rate(self, param_filename, turbine_params, turbine_name, controller_params, turbine=0):
         # Read, update, and write DISCON file (turbine is dummy except for the name,
         # controller is dummy here)
         DISCON_in = read_DISCON(param_filename)
         DISCON_in["ZMQ_Mode"] = 1
         DISCON_in["ZMQ_UpdatePeriod"] = self.twin_rate
+        DISCON_in["ZMQ_CommAddress"] = f"tcp://localhost:{self.ports[turbine]}"
         turbine = ROSCO_turbine.Turbine(turbine_params)
         turbine.TurbineName = turbine_name
         controller = ROSCO_controller.Controller(controller_params)
@@ -155,18 +267,58 @@ class NerveVirtual:
         elapsed_time = end_time - start_time
         print(f"Time taken to run the process: {elapsed_time} seconds")
     def run_zmq(self):
-        self.connect_zmq = True
-        self.s = turbine_zmq_server(network_address="tcp://*:5555", timeout=600.0, verbose=False)
-        while self.connect_zmq:
-            #  Get latest measurements from ROSCO
-            self.measurements = self.s.get_measurements()
-            yaw_setpoint = 0.0
-            self.s.send_setpoints(nacelleHeading=yaw_setpoint)
-            self.shared_dict[self.measurements['Time']] = self.measurements  # Store measurements at each time step
-            self.shared_max_time.value = self.measurements['Time']
-            if self.measurements['iStatus'] == -1:
-                self.connect_zmq = False
-                self.s._disconnect()
+        '''
+        ZeroMQ bridge to ROSCO, one port per turbine multiplexed on a single poller. Each
+        controller step is answered straight away from the turbine's precomputed setpoint slot;
+        the measurements are handed to a publisher thread that writes them to the turbine's
+        shared buffer and wakes the twin, so OpenFAST never waits on the twin's IPC and a slow
+        turbine never holds back the others.
+        '''
+        self.s = farm_zmq_server(network_addresses=[f"tcp://*:{port}" for port in self.ports],
+                                 timeout=600.0, verbose=False, structured=True)
+        pending = queue.SimpleQueue()
+        publisher = threading.Thread(target=self._publish, args=(pending,), daemon=True)
+        publisher.start()
+
+        running = set(range(self.n_turbines))
+        while running:
+            #  Get latest measurements from whichever turbines sent one and reply at once
+            ready = self.s.get_ready_measurements()
+            if not ready:
+                raise IOError(f"ZeroMQ connection to turbine(s) {sorted(running)} timed out.")
+            for turbine, measurements in ready.items():
+                received = time.perf_counter()
+                genTorque, nacelleHeading, *bladePitch = self.setpoints[5 * turbine:5 * turbine + 5]
+                self.s.zmq_servers[turbine].send_setpoints(genTorque, nacelleHeading, bladePitch)
+                self.reply_latency.record(time.perf_counter() - received)
+
+                pending.put((turbine, [measurements[channel] for channel in self.channels], received))
+                if measurements['iStatus'] == -1:
+                    running.discard(turbine)
+                    self.s._disconnect([turbine])
+
+        pending.put(None)
+        publisher.join()
+        self.reply_latency.report()
+        self.publish_latency.report()
+
+    def _publish(self, pending):
+        # Single writer of the shared buffers: store measurements at each time step
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            turbine, row, received = item
+            self.shared_buffers[turbine].append(row)
+            self.shared_max_times[turbine] = row[0]
+            self.tick.signal()
+            self.publish_latency.record(time.perf_counter() - received)
+
+    def release(self):
+        # Free the model sample buffers (call once, from the process that created them)
+        for buffer in self.shared_buffers:
+            buffer.close()
+            buffer.unlink()
 
     def output_manager(self, output_folder, output_file, of_file):
         # Moving output files to output directory (supports: .out, .outb, .MD.out)
@@ -0,0 +1,327 @@
+# Copyright 2023 - Yuksel Rudy Alkarem
+
+import queue
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+
+
+def prefetch(blocks, maxsize=4):
+    '''
+    Read an iterator of blocks on a background thread into a bounded queue, so a consumer on
+    the twin clock polls for them (get_nowait) instead of blocking until the source delivers.
+    None in the queue marks the end of the blocks.
+    '''
+    pending = queue.Queue(maxsize)
+
+    def run():
+        try:
+            for block in blocks:
+                pending.put(block)
+        finally:
+            pending.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+    return pending
+
+
+class PhysicalSource(ABC):
+    '''
+    Base class for physical acquisition sources used by NervePhysical.
+
+    A source yields raw blocks (rows x channels) with time in column 0 and the channels in
+    TNAME order, in model-scale units (NervePhysical scales and resamples them).
+    '''
+    def __init__(self, channels):
+        self.channels = list(channels)
+        self.received  = 0  # samples received
+        self.dropped   = 0  # samples dropped because the twin could not keep up
+        self.malformed = 0  # packets discarded because they did not hold whole rows
+
+    @abstractmethod
+    def blocks(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {'received': self.received, 'dropped': self.dropped, 'malformed': self.malformed}
+
+
+class FileSource(PhysicalSource):
+    '''
+    Replay of an experiment file, read in chunks: CSV (only the requested columns are parsed)
+    or a memory-mapped .npy structured array with named fields.
+    '''
+    def __init__(self, filename, channels, chunksize=10000):
+        super().__init__(channels)
+        self.filename  = filename
+        self.chunksize = chunksize
+
+    def blocks(self):
+        if self.filename.endswith('.npy'):
+            data = np.load(self.filename, mmap_mode='r')
+            for start in range(0, len(data), self.chunksize):
+                chunk = data[start:start + self.chunksize]
+                block = np.column_stack([chunk[channel] for channel in self.channels]).astype(np.float64)
+                self.received += len(block)
+                yield block
+        else:
+            for chunk in pd.read_csv(self.filename, usecols=self.channels, chunksize=self.chunksize):
+                block = chunk[self.channels].to_numpy(dtype=np.float64)
+                self.received += len(block)
+                yield block
+
+
+class LiveSource(PhysicalSource):
+    '''
+    Base class for live sources. Samples are received on a background thread into a bounded
+    queue of blocks. With `block=True` a full queue holds the receiver back, so backpressure
+    reaches the sender (TCP/ZeroMQ flow control); otherwise new samples are dropped and counted.
+
+    columns: names of the values in each incoming row (defaults to `channels`); only `channels`
+             are kept, in TNAME order.
+    timeout: seconds without data after which the acquisition is considered over (None: never).
+    rebase:  shift time so the first sample is at t = 0.
+    '''
+    def __init__(self, channels, columns=None, maxsize=1024, block=False, timeout=None, rebase=True):
+        super().__init__(channels)
+        self.columns  = list(channels) if columns is None else list(columns)
+        self._select  = [self.columns.index(channel) for channel in self.channels]
+        self.maxsize  = maxsize
+        self.block    = block
+        self.timeout  = timeout
+        self.rebase   = rebase
+        self._queue   = queue.Queue(maxsize)
+        self._stop    = threading.Event()
+        self._done    = threading.Event()  # receiver thread finished
+        self._thread  = None
+        self._t0      = None
+
+    # Subclasses: open the connection, and return a (rows x columns) array, an empty array when
+    # nothing arrived within a short poll, or None at the end of the stream
+    def _open(self):
+        pass
+
+    @abstractmethod
+    def _receive(self):
+        pass
+
+    def _close(self):
+        pass
+
+    def _parse_binary(self, data):
+        # Rows of packed little-endian float64; a packet that does not hold whole rows is
+        # discarded (and counted) so one bad datagram does not stop the receiver
+        size = 8 * len(self.columns)
+        if len(data) % size:
+            self.malformed += 1
+            if self.malformed == 1:
+                print(f"Physical source: discarding a {len(data)}-byte packet, not a multiple of {size}-byte rows")
+            return np.empty((0, len(self.columns)))
+        return np.frombuffer(data, dtype='<f8').reshape(-1, len(self.columns))
+
+    def _parse_text(self, data):
+        # Comma/space separated values, one row per line; unparsable packets are discarded
+        width = len(self.columns)
+        try:
+            values = np.array(data.decode().replace(',', ' ').split(), dtype=np.float64)
+        except (UnicodeDecodeError, ValueError):
+            self.malformed += 1
+            if self.malformed == 1:
+                print("Physical source: discarding a packet that is not comma-separated values")
+            return np.empty((0, width))
+        n = len(values) // width
+        return values[:n * width].reshape(n, width)
+
+    def start(self):
+        if self._thread is None:
+            self._open()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                rows = self._receive()
+                if rows is None:
+                    break
+                if len(rows) == 0:
+                    continue
+                rows = np.atleast_2d(rows)[:, self._select]
+                self.received += len(rows)
+                if self.block:
+                    while not self._stop.is_set():
+                        try:
+                            self._queue.put(rows, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                else:
+                    try:
+                        self._queue.put_nowait(rows)
+                    except queue.Full:
+                        self.dropped += len(rows)
+        finally:
+            self._done.set()
+            self._close()
+
+    def blocks(self):
+        self.start()
+        idle = 0.0
+        while True:
+            try:
+                rows = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._done.is_set() and self._queue.empty():
+                    break
+                idle += 0.1
+                if self.timeout is not None and idle >= self.timeout:
+                    break
+                continue
+            idle = 0.0
+            # Drain whatever else is already waiting into the same block
+            pending = [rows]
+            while True:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            block = np.vstack(pending)
+            if self.rebase:
+                if self._t0 is None:
+                    self._t0 = block[0, 0]
+                block[:, 0] -= self._t0
+            yield block
+        self.close()
+
+    def close(self):
+        self._stop.set()
+
+
+class SocketSource(LiveSource):
+    '''
+    UDP or TCP acquisition. Rows are packed little-endian float64 (fmt='binary') or text lines
+    of comma-separated values (fmt='text'). UDP binds to `address`; TCP connects to the DAQ.
+    '''
+    def __init__(self, channels, address=('127.0.0.1', 5600), protocol='udp', fmt='binary', **kwargs):
+        super().__init__(channels, **kwargs)
+        self.address  = address
+        self.protocol = protocol
+        self.fmt      = fmt
+        self._pending = b''
+
+    def _open(self):
+        if self.protocol == 'udp':
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind(self.address)
+        elif self.protocol == 'tcp':
+            self.sock = socket.create_connection(self.address)
+        else:
+            raise ValueError(f"Unknown protocol: {self.protocol}")
+        self.sock.settimeout(0.1)
+
+    def _receive(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.timeout:
+            return np.empty((0, len(self.columns)))
+        if not data:
+            return None  # TCP peer closed the connection
+        if self.protocol == 'tcp':
+            # Keep partial rows/lines for the next read
+            data = self._pending + data
+            if self.fmt == 'binary':
+                size = 8 * len(self.columns)
+                cut = len(data) - len(data) % size
+            else:
+                cut = data.rfind(b'\n') + 1
+            data, self._pending = data[:cut], data[cut:]
+        if self.fmt == 'binary':
+            return self._parse_binary(data)
+        return self._parse_text(data)
+
+    def _close(self):
+        self.sock.close()
+
+
+class ZMQSource(LiveSource):
+    '''
+    ZeroMQ SUB acquisition. Each message holds one or more rows as packed little-endian float64
+    (fmt='binary') or comma-separated text (fmt='text'). The socket high-water mark follows
+    `maxsize`, so with block=False ZeroMQ also sheds load at the socket.
+    '''
+    def __init__(self, channels, address='tcp://127.0.0.1:5601', topic=b'', fmt='binary', **kwargs):
+        super().__init__(channels, **kwargs)
+        self.address = address
+        self.topic   = topic
+        self.fmt     = fmt
+
+    def _open(self):
+        import zmq
+        self.context = zmq.Context()
+        self.sock = self.context.socket(zmq.SUB)
+        self.sock.setsockopt(zmq.RCVHWM, self.maxsize)
+        self.sock.setsockopt(zmq.SUBSCRIBE, self.topic)
+        self.sock.connect(self.address)
+        self.poller = zmq.Poller()
+        self.poller.register(self.sock, zmq.POLLIN)
+
+    def _receive(self):
+        if not self.poller.poll(100):
+            return np.empty((0, len(self.columns)))
+        data = self.sock.recv()[len(self.topic):]
+        if self.fmt == 'binary':
+            return self._parse_binary(data)
+        return self._parse_text(data)
+
+    def _close(self):
+        self.sock.close()
+        self.context.term()
+
+
+class SyntheticSource(LiveSource):
+    '''
+    Simulated DAQ for tests: sums of sinusoids (or user callables f(t)) sampled at
+    `sample_rate`, optionally paced in real time, for `duration` seconds.
+    '''
+    def __init__(self, channels, sample_rate=100.0, duration=60.0, signals=None,
+                 realtime=True, block_size=10, noise=0.0, seed=None, **kwargs):
+        super().__init__(channels, **kwargs)
+        self.sample_rate = sample_rate
+        self.duration    = duration
+        self.realtime    = realtime
+        self.block_size  = block_size
+        self.noise       = noise
+        self.rng         = np.random.default_rng(seed)
+        if signals is None:
+            signals = {channel: (lambda t, i=i: np.sin(2 * np.pi * 0.1 * (i + 1) * t))
+                       for i, channel in enumerate(self.columns[1:])}
+        self.signals     = signals
+        self._sample     = 0
+
+    def _open(self):
+        self._start = time.monotonic()
+
+    def _receive(self):
+        n_samples = int(self.duration * self.sample_rate) + 1
+        if self._sample >= n_samples:
+            return None
+        samples = np.arange(self._sample, min(self._sample + self.block_size, n_samples))
+        self._sample = samples[-1] + 1
+        t = samples / self.sample_rate
+        if self.realtime:
+            delay = self._start + t[-1] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        rows = np.empty((len(t), len(self.columns)))
+        rows[:, 0] = t
+        for i, column in enumerate(self.columns[1:], start=1):
+            rows[:, i] = self.signals[column](t) if column in self.signals else 0.0
+        if self.noise:
+            rows[:, 1:] += self.noise * self.rng.standard_normal((len(t), len(self.columns) - 1))
+        return rows
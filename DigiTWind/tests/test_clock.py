@@ -0,0 +1,75 @@
+'''
+Unit tests for the twin clock and latency histograms
+
+Tests:
+    TwinClock
+    LatencyHistogram
+'''
+
+import time
+import unittest
+import numpy as np
+
+from DigiTWind.clock import TwinClock, LatencyHistogram
+
+
+class TestTwinClock(unittest.TestCase):
+    def test_tick_times(self):
+        clock = TwinClock(0.1)
+        self.assertEqual(clock.tick_count(10.0), 101)
+        self.assertEqual(clock.tick_count(0.05), 1)
+        self.assertEqual(clock.time_of(3), 0.3)
+        self.assertEqual(clock.tick_of(clock.time_of(12345)), 12345)
+
+    def test_ticks_on_time(self):
+        clock = TwinClock(0.01)
+        self.assertEqual(list(clock.ticks('physical', 5)), [0, 1, 2, 3, 4])
+        stats = clock.stats('physical')
+        self.assertEqual(stats['ticks'], 5)
+        self.assertEqual(clock.stats('virtual')['ticks'], 0)
+
+    def test_late_ticks_are_skipped(self):
+        clock = TwinClock(0.01)
+        clock.epoch
+        time.sleep(0.055)
+        tick = clock.wait('virtual', 0)
+        self.assertGreaterEqual(tick, 5)
+        stats = clock.stats('virtual')
+        self.assertEqual(stats['missed'], tick)
+        self.assertEqual(stats['overruns'], 1)
+        self.assertLess(stats['jitter_max'], clock.period)
+
+    def test_miss(self):
+        clock = TwinClock(0.1)
+        clock.miss('physical')
+        clock.miss('physical', 2)
+        self.assertEqual(clock.stats('physical')['missed'], 3)
+        self.assertEqual(clock.stats('physical')['ticks'], 0)
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = LatencyHistogram('test')
+        self.assertTrue(np.isnan(histogram.percentile(50)))
+        for seconds in [1e-4] * 98 + [0.02, 0.5]:
+            histogram.record(seconds)
+        stats = histogram.stats()
+        self.assertEqual(stats['count'], 100)
+        self.assertAlmostEqual(stats['max'], 0.5)
+        self.assertAlmostEqual(stats['mean'], (98e-4 + 0.52) / 100)
+        # bin upper edges, 10 bins per decade
+        self.assertGreaterEqual(stats['p50'], 1e-4)
+        self.assertLess(stats['p50'], 1e-4 * 10 ** 0.1 * 1.001)
+        self.assertGreaterEqual(stats['p99'], 0.02)
+        self.assertLessEqual(histogram.percentile(100), 0.5)
+
+    def test_overflow(self):
+        histogram = LatencyHistogram('test')
+        histogram.record(1e-9)
+        histogram.record(100.0)
+        self.assertEqual(histogram.counts[0], 1)
+        self.assertEqual(histogram.counts[-1], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+'''
+Unit tests for the decimation of plotted series
+
+Tests:
+    minmax
+    lttb
+    minmax_buckets
+'''
+
+import unittest
+import numpy as np
+
+from DigiTWind.downsample import minmax, lttb, minmax_buckets, decimate
+
+
+class TestDecimate(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = np.arange(10007) * 0.01
+        self.y = np.sin(self.x) + 0.1 * rng.standard_normal(len(self.x))
+
+    def test_minmax(self):
+        for n_out in [4, 5, 100, 1001]:
+            x, y = minmax(self.x, self.y, n_out)
+            self.assertLessEqual(len(x), n_out)
+            self.assertEqual((x[0], x[-1]), (self.x[0], self.x[-1]))
+            self.assertTrue(np.all(np.diff(x) > 0))
+        # the extremes survive
+        self.assertEqual(y.max(), self.y.max())
+        self.assertEqual(y.min(), self.y.min())
+
+    def test_lttb(self):
+        for n_out in [3, 100, 1001]:
+            x, y = lttb(self.x, self.y, n_out)
+            self.assertEqual(len(x), n_out)
+            self.assertEqual((x[0], x[-1]), (self.x[0], self.x[-1]))
+            self.assertEqual((y[0], y[-1]), (self.y[0], self.y[-1]))
+            self.assertTrue(np.all(np.diff(x) > 0))
+
+    def test_short_series_unchanged(self):
+        for method in ['minmax', 'lttb']:
+            x, y = decimate(self.x[:50], self.y[:50], 100, method)
+            np.testing.assert_array_equal(x, self.x[:50])
+            x, y = decimate(self.x, self.y, None, method)
+            self.assertEqual(len(x), len(self.x))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            decimate(self.x, self.y, 100, 'mean')
+
+
+class TestMinmaxBuckets(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.x = np.arange(1000.0)
+        self.y = rng.standard_normal(len(self.x))
+
+    def test_buckets(self):
+        x, y, used = minmax_buckets(self.x, self.y, 7)
+        self.assertEqual(used, 994)
+        self.assertEqual(len(x), 2 * 142)
+        self.assertTrue(np.all(np.diff(x) > 0))
+        np.testing.assert_array_equal(np.sort(y[:2]), [self.y[:7].min(), self.y[:7].max()])
+
+    def test_pieces_match_whole(self):
+        whole = minmax_buckets(self.x, self.y, 7)
+        xs, ys, position = [], [], 0
+        for stop in [10, 11, 250, 251, 600, 1000]:
+            x, y, used = minmax_buckets(self.x[position:stop], self.y[position:stop], 7)
+            xs.append(x)
+            ys.append(y)
+            position += used
+        np.testing.assert_array_equal(np.concatenate(xs), whole[0])
+        np.testing.assert_array_equal(np.concatenate(ys), whole[1])
+        self.assertEqual(position, whole[2])
+
+    def test_width_one(self):
+        x, y, used = minmax_buckets(self.x, self.y, 1)
+        self.assertEqual(used, len(self.x))
+        np.testing.assert_array_equal(y, self.y)
+
+
+if __name__ == '__main__':
+    unittest.main()
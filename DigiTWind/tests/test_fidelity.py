@@ -0,0 +1,83 @@
+'''
+Unit tests for the fidelity scoring of the virtual against the physical data
+
+Tests:
+    FidelityEngine
+    rescore
+'''
+
+import unittest
+import numpy as np
+import pandas as pd
+
+from DigiTWind.fidelity import FidelityEngine, rescore
+
+
+def score_per_row(pdata, vdata, channels, tol, n_ticks):
+    # Row by row, channel by channel scoring, as the twin did before the engine
+    current_error = {channel: 0.0 for channel in channels}
+    total_error = {channel: 0.0 for channel in channels}
+    mirrcount = {channel: 0 for channel in channels}
+    mirrcoeff_t = {channel: [] for channel in channels}
+    for prow, vrow in zip(pdata, vdata):
+        for i, channel in enumerate(channels):
+            error = abs(prow[i] - vrow[i])
+            current_error[channel] = error
+            total_error[channel] += error
+            if error < tol:
+                mirrcount[channel] += 1
+            mirrcoeff_t[channel].append(mirrcount[channel] / n_ticks * 1e2)
+    return current_error, total_error, mirrcoeff_t
+
+
+class TestFidelityEngine(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.channels = ['GenPwr', 'RotSpeed', 'PtfmPitch']
+        self.pdata = rng.standard_normal((500, 3))
+        self.vdata = self.pdata + 0.2 * rng.standard_normal((500, 3))
+        self.tol = 0.15
+        self.n_ticks = 600
+
+    def test_matches_per_row_loop(self):
+        engine = FidelityEngine(self.channels, self.n_ticks, self.tol, capacity=64)
+        for start, stop in [(0, 1), (1, 40), (40, 41), (41, 300), (300, 500)]:
+            engine.update(self.pdata[start:stop], self.vdata[start:stop])
+
+        current_error, total_error, mirrcoeff_t = score_per_row(
+            self.pdata, self.vdata, self.channels, self.tol, self.n_ticks)
+        np.testing.assert_allclose(engine.current_error, [current_error[c] for c in self.channels])
+        np.testing.assert_allclose(engine.total_error, [total_error[c] for c in self.channels])
+        np.testing.assert_allclose(engine.mirrcoeff, [mirrcoeff_t[c][-1] for c in self.channels])
+        history = engine.history()
+        self.assertEqual(len(history), len(self.pdata))
+        for channel in self.channels:
+            np.testing.assert_allclose(history[channel], mirrcoeff_t[channel])
+
+        error = np.abs(self.pdata - self.vdata)
+        np.testing.assert_allclose(engine.rmse, np.sqrt(np.mean(error ** 2, axis=0)))
+        np.testing.assert_allclose(engine.normalized_error, engine.rmse / self.pdata.std(axis=0))
+
+    def test_column_groups(self):
+        # groups scored separately end up as if scored together
+        together = FidelityEngine(self.channels, self.n_ticks, self.tol)
+        together.update(self.pdata, self.vdata)
+        groups = FidelityEngine(self.channels, self.n_ticks, self.tol)
+        groups.update(self.pdata[:, :2], self.vdata[:, :2], slice(0, 2))
+        groups.update(self.pdata[:, 2:], self.vdata[:, 2:], slice(2, 3))
+        np.testing.assert_allclose(groups.total_error, together.total_error)
+        np.testing.assert_allclose(groups.history(), together.history())
+
+    def test_rescore(self):
+        time = np.arange(len(self.pdata)) * 0.1
+        pdata = pd.DataFrame(self.pdata, columns=self.channels).assign(Time=time)
+        vdata = pd.DataFrame(self.vdata, columns=self.channels).assign(Time=time)
+        engine = rescore(pdata, vdata, self.channels, self.tol, self.n_ticks)
+        _, total_error, mirrcoeff_t = score_per_row(
+            self.pdata, self.vdata, self.channels, self.tol, self.n_ticks)
+        np.testing.assert_allclose(engine.total_error, [total_error[c] for c in self.channels])
+        np.testing.assert_allclose(engine.mirrcoeff, [mirrcoeff_t[c][-1] for c in self.channels])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+'''
+Unit tests for the shared-memory buffers of the twin
+
+Tests:
+    RingBuffer
+    ChannelVector
+    Tick
+'''
+
+import pickle
+import threading
+import unittest
+import numpy as np
+
+from DigiTWind.memory import RingBuffer, ChannelVector, Tick
+
+
+class TestRingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = RingBuffer(['Time', 'A', 'B'], 8)
+
+    def tearDown(self):
+        self.buffer.close()
+        self.buffer.unlink()
+
+    def fill(self, n, start=0):
+        for tick in range(start, start + n):
+            self.buffer.put(tick, [0.1 * tick, tick, -tick])
+
+    def test_wrap_around(self):
+        self.fill(20)
+        self.assertEqual(self.buffer.seq, 20)
+        self.assertEqual(len(self.buffer), 8)
+        self.assertIsNone(self.buffer.get(11))
+        np.testing.assert_allclose(self.buffer.get(12), [1.2, 12, -12])
+
+        start, rows = self.buffer.read()
+        self.assertEqual(start, 12)
+        np.testing.assert_array_equal(rows[:, 1], np.arange(12, 20))
+        np.testing.assert_array_equal(self.buffer.latest(3)[:, 1], [17, 18, 19])
+
+    def test_read_columns(self):
+        self.fill(5)
+        start, rows = self.buffer.read(1, 3, columns=['B', 'Time'])
+        self.assertEqual(start, 1)
+        np.testing.assert_allclose(rows, [[-1, 0.1], [-2, 0.2]])
+
+    def test_torn_write(self):
+        # a row whose stamp does not match its tick is being rewritten and must be skipped
+        self.fill(8)
+        self.buffer._stamps[5] = -1
+        self.assertIsNone(self.buffer.get(5))
+        _, rows = self.buffer.read()
+        np.testing.assert_array_equal(rows[:, 1], [0, 1, 2, 3, 4, 6, 7])
+
+    def test_window(self):
+        self.fill(20)
+        rows = self.buffer.window(1.35, 1.65, columns=['A'])
+        np.testing.assert_array_equal(rows[:, 1], [14, 15, 16])
+        self.assertEqual(rows.shape[1], 2)
+        self.assertEqual(self.buffer.search(1.5), 15)
+        self.assertEqual(self.buffer.search(1.5, right=True), 16)
+
+    def test_interp(self):
+        self.fill(6)
+        row, tick = self.buffer.interp(0.25)
+        np.testing.assert_allclose(row, [0.25, 2.5, -2.5])
+        self.assertEqual(tick, 2)
+        row, tick = self.buffer.interp(0.4, tick)
+        np.testing.assert_allclose(row, [0.4, 4, -4])
+        self.assertEqual(tick, 4)
+        row, _ = self.buffer.interp(0.55, tick)
+        self.assertIsNone(row)
+
+    def test_pickle_attaches_by_name(self):
+        self.fill(3)
+        copy = pickle.loads(pickle.dumps(self.buffer))
+        try:
+            self.buffer.put(3, [0.3, 3, -3])
+            self.assertEqual(copy.seq, 4)
+            np.testing.assert_allclose(copy.get(3), [0.3, 3, -3])
+        finally:
+            copy.close()
+
+
+class TestChannelVector(unittest.TestCase):
+    def test_access(self):
+        vector = ChannelVector(['A', 'B'], value=1.0)
+        vector['B'] = 3.5
+        self.assertEqual(vector['A'], 1.0)
+        self.assertEqual(vector.items(), [('A', 1.0), ('B', 3.5)])
+        self.assertIn('B', vector)
+        self.assertNotIn('C', vector)
+
+
+class TestTick(unittest.TestCase):
+    def test_timeout(self):
+        tick = Tick()
+        self.assertEqual(tick.wait(0, timeout=0.01), 0)
+
+    def test_signal(self):
+        tick = Tick()
+        threading.Timer(0.05, tick.signal).start()
+        self.assertEqual(tick.wait(0, timeout=5), 1)
+        self.assertEqual(tick.seq, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
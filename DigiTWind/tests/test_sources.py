@@ -0,0 +1,63 @@
+'''
+Unit tests for the physical acquisition sources
+
+Tests:
+    LiveSource parsing
+    SyntheticSource
+    prefetch
+'''
+
+import unittest
+import numpy as np
+
+from DigiTWind.sources import SyntheticSource, prefetch
+
+
+class TestParsing(unittest.TestCase):
+    def setUp(self):
+        self.source = SyntheticSource(['Time', 'A'], columns=['Time', 'A', 'B'], realtime=False)
+
+    def test_binary(self):
+        rows = np.arange(6, dtype='<f8').reshape(2, 3)
+        np.testing.assert_array_equal(self.source._parse_binary(rows.tobytes()), rows)
+        self.assertEqual(self.source.malformed, 0)
+
+    def test_binary_partial_row(self):
+        parsed = self.source._parse_binary(np.arange(5, dtype='<f8').tobytes())
+        self.assertEqual(parsed.shape, (0, 3))
+        self.assertEqual(self.source.malformed, 1)
+
+    def test_text(self):
+        parsed = self.source._parse_text(b"0.0, 1.5, 2\n0.1 2.5 3\n")
+        np.testing.assert_array_equal(parsed, [[0.0, 1.5, 2], [0.1, 2.5, 3]])
+        parsed = self.source._parse_text(b"0.0, x, 2\n")
+        self.assertEqual(parsed.shape, (0, 3))
+        self.assertEqual(self.source.malformed, 1)
+
+
+class TestSyntheticSource(unittest.TestCase):
+    def test_blocks(self):
+        source = SyntheticSource(['Time', 'B'], columns=['Time', 'A', 'B'], sample_rate=10.0,
+                                 duration=5.0, realtime=False, block_size=7,
+                                 signals={'B': lambda t: 2 * t})
+        block = np.vstack(list(source.blocks()))
+        self.assertEqual(block.shape, (51, 2))
+        np.testing.assert_allclose(block[:, 0], np.arange(51) / 10.0)
+        np.testing.assert_allclose(block[:, 1], 2 * block[:, 0])
+        self.assertEqual(source.stats(), {'received': 51, 'dropped': 0, 'malformed': 0})
+
+
+class TestPrefetch(unittest.TestCase):
+    def test_order_and_end(self):
+        pending = prefetch(iter(range(10)), maxsize=2)
+        blocks = []
+        while True:
+            block = pending.get(timeout=5)
+            if block is None:
+                break
+            blocks.append(block)
+        self.assertEqual(blocks, list(range(10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
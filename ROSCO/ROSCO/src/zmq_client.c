@@ -20,6 +20,59 @@ void delete_blank_spaces_in_string(char *s)
 }
 
 
+#ifdef ZMQ_BINARY
+// Packed binary messages: 8-byte header (magic "RZ", uint16 version, uint32 number of values)
+// followed by the values as little-endian float64. Must match ROSCO_toolbox/control_interface.py
+#define ZMQ_BINARY_VERSION 1
+#define ZMQ_BINARY_HEADER 8
+
+static void write_binary_header(unsigned char *buffer, unsigned int count)
+{
+    buffer[0] = 'R';
+    buffer[1] = 'Z';
+    buffer[2] = ZMQ_BINARY_VERSION & 0xFF;
+    buffer[3] = (ZMQ_BINARY_VERSION >> 8) & 0xFF;
+    buffer[4] = count & 0xFF;
+    buffer[5] = (count >> 8) & 0xFF;
+    buffer[6] = (count >> 16) & 0xFF;
+    buffer[7] = (count >> 24) & 0xFF;
+}
+
+int zmq_client (
+    char *zmq_address,
+    double measurements[34],
+    double setpoints[5]
+)
+{
+	int num_measurements = 34;
+	int num_setpoints = 5;
+	unsigned char message_to_ssc[ZMQ_BINARY_HEADER + 34 * sizeof(double)];
+	unsigned char message_from_ssc[ZMQ_BINARY_HEADER + 5 * sizeof(double)];
+
+    // Open connection with ZeroMQ server
+    void *context = zmq_ctx_new ();
+    void *requester = zmq_socket (context, ZMQ_REQ);
+    zmq_connect (requester, zmq_address);
+
+    // Header followed by the raw measurements (assumes a little-endian host)
+    write_binary_header(message_to_ssc, num_measurements);
+    memcpy(message_to_ssc + ZMQ_BINARY_HEADER, measurements, num_measurements * sizeof(double));
+
+    zmq_send (requester, message_to_ssc, sizeof(message_to_ssc), 0);
+    int nbytes = zmq_recv (requester, message_from_ssc, sizeof(message_from_ssc), 0);
+
+    if (nbytes == (int) sizeof(message_from_ssc) && message_from_ssc[0] == 'R' && message_from_ssc[1] == 'Z') {
+        memcpy(setpoints, message_from_ssc + ZMQ_BINARY_HEADER, num_setpoints * sizeof(double));
+    } else {
+        printf("zmq_client.c: Unexpected setpoint message (%d bytes)\n", nbytes);
+    }
+
+    // Close connection
+    zmq_close (requester);
+    zmq_ctx_destroy (context);
+    return 0;
+}
+#else
 int zmq_client (
     char *zmq_address,
     double measurements[34],
@@ -93,3 +146,4 @@ int zmq_client (
     zmq_ctx_destroy (context);
     return 0;
 }
+#endif
@@ -0,0 +1,83 @@
+'''
+Unit tests for the ZeroMQ interface of ROSCO
+
+Tests:
+    binary protocol
+    text protocol
+'''
+
+import socket
+import unittest
+import numpy as np
+import zmq
+
+# ROSCO toolbox modules
+from ROSCO_toolbox.control_interface import (turbine_zmq_server, zmq_measurement_names,
+                                             ZMQ_BINARY_MAGIC, ZMQ_BINARY_VERSION,
+                                             ZMQ_BINARY_HEADER)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class ZMQInterfaceTesting(unittest.TestCase):
+    def setUp(self):
+        address = "tcp://127.0.0.1:%d" % free_port()
+        self.server = turbine_zmq_server(network_address=address, timeout=5.0)
+        self.context = zmq.Context()
+        self.client = self.context.socket(zmq.REQ)
+        self.client.setsockopt(zmq.LINGER, 0)
+        self.client.connect(address)
+        self.values = np.arange(len(zmq_measurement_names), dtype='<f8') * 1.5 - 7
+
+    def tearDown(self):
+        self.client.close()
+        self.context.term()
+        self.server.socket.close()
+
+    def test_binary(self):
+        header = ZMQ_BINARY_HEADER.pack(ZMQ_BINARY_MAGIC, ZMQ_BINARY_VERSION, len(self.values))
+        self.client.send(header + self.values.tobytes())
+        measurements = self.server.get_measurements()
+        self.assertEqual(list(measurements), zmq_measurement_names)
+        np.testing.assert_array_equal(list(measurements.values()), self.values)
+
+        setpoints = [1.25e6, 0.1, 0.02, 0.03, 0.04]
+        self.server.send_setpoints(setpoints[0], setpoints[1], setpoints[2:])
+        reply = self.client.recv()
+        self.assertEqual(ZMQ_BINARY_HEADER.unpack_from(reply),
+                         (ZMQ_BINARY_MAGIC, ZMQ_BINARY_VERSION, 5))
+        np.testing.assert_array_equal(
+            np.frombuffer(reply, dtype='<f8', offset=ZMQ_BINARY_HEADER.size), setpoints)
+
+    def test_binary_structured(self):
+        self.server.structured = True
+        header = ZMQ_BINARY_HEADER.pack(ZMQ_BINARY_MAGIC, ZMQ_BINARY_VERSION, len(self.values))
+        self.client.send(header + self.values.tobytes())
+        measurements = self.server.get_measurements()
+        for name, value in zip(zmq_measurement_names, self.values):
+            self.assertEqual(measurements[name], value)
+
+    def test_binary_wrong_count(self):
+        header = ZMQ_BINARY_HEADER.pack(ZMQ_BINARY_MAGIC, ZMQ_BINARY_VERSION, 3)
+        self.client.send(header + self.values[:3].tobytes())
+        with self.assertRaises(ValueError):
+            self.server.get_measurements()
+
+    def test_text(self):
+        message = ', '.join('%016.5f' % value for value in self.values)
+        self.client.send(message.encode() + b'\x00')
+        measurements = self.server.get_measurements()
+        np.testing.assert_allclose(list(measurements.values()), self.values)
+
+        self.server.send_setpoints(1.25e6, 0.1, [0.02, 0.03, 0.04])
+        reply = self.client.recv()
+        np.testing.assert_allclose([float(v) for v in reply.decode().split(',')],
+                                   [1.25e6, 0.1, 0.02, 0.03, 0.04])
+
+
+if __name__ == '__main__':
+    unittest.main()
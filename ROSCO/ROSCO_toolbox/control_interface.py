@@ -12,6 +12,8 @@
 from ctypes import byref, cdll, POINTER, c_float, c_char_p, c_double, create_string_buffer, c_int32, c_void_p
 import numpy as np
 import platform, ctypes
+import os, shutil, tempfile
+import struct
 import zmq
 
 # Some useful constants
@@ -19,6 +21,35 @@ deg2rad = np.deg2rad(1)
 rad2deg = np.rad2deg(1)
 rpm2RadSec = 2.0*(np.pi)/60.0
 
+# ZeroMQ measurements sent by ROSCO, in message order
+zmq_measurement_names = [
+    'iStatus', 'Time', 'VS_MechGenPwr', 'VS_GenPwr', 'GenSpeed', 'RotSpeed', 'GenTqMeas',
+    'NacelleHeading', 'NacelleVane', 'HorWindV', 'rootMOOP1', 'rootMOOP2', 'rootMOOP3',
+    'FA_Acc', 'NacIMU_FA_Acc', 'Azimuth',
+    'PtfmTDX', 'PtfmTDY', 'PtfmTDZ', 'PtfmRDX', 'PtfmRDY', 'PtfmRDZ',
+    'PtfmTVX', 'PtfmTVY', 'PtfmTVZ', 'PtfmRVX', 'PtfmRVY', 'PtfmRVZ',
+    'PtfmTAX', 'PtfmTAY', 'PtfmTAZ', 'PtfmRAX', 'PtfmRAY', 'PtfmRAZ',
+]
+zmq_measurement_dtype = np.dtype([(name, '<f8') for name in zmq_measurement_names])
+
+# Binary ZeroMQ messages: header (magic, protocol version, number of values) followed by
+# the values as little-endian float64. Must match zmq_client.c built with ZMQ_BINARY.
+ZMQ_BINARY_MAGIC   = b'RZ'
+ZMQ_BINARY_VERSION = 1
+ZMQ_BINARY_HEADER  = struct.Struct('<2sHI')
+
+# Turbine state written to avrSWAP by ControllerInterface.call_controller: field names (the
+# order of a state vector) and the avrSWAP indices each one is written to (offset by -1 from Fortran)
+avrSWAP_state_fields = [
+    'iStatus', 't', 'dt', 'bld_pitch', 'gen_power', 'gen_torque', 'gen_speed', 'rot_speed',
+    'Y_MeasErr', 'ws', 'Yaw_fromNorth', 'NacIMU_FA_Acc',
+]
+avrSWAP_state_indices = {
+    'iStatus': [0], 't': [1], 'dt': [2], 'bld_pitch': [3, 32, 33], 'gen_power': [14],
+    'gen_torque': [22], 'gen_speed': [19], 'rot_speed': [20], 'Y_MeasErr': [23], 'ws': [26],
+    'Yaw_fromNorth': [36], 'NacIMU_FA_Acc': [82],
+}
+
 class ControllerInterface():
     """
     Define interface to a given controller using the avrSWAP array
@@ -27,12 +58,20 @@ class ControllerInterface():
     --------
     call_discon
     call_controller
+    state_vector
+    reset_discon
+    reload_discon
+    unload_discon
     show_control_values
+    kill_discon
 
     Parameters:
     -----------
     lib_name : str
                 name of compiled dynamic library containing controller, (.dll,.so,.dylib)
+    isolated : bool, optional
+                load a private copy of the library, so this controller does not share its
+                (Fortran module) state with other controllers loaded from lib_name
 
     """
 
@@ -50,6 +89,7 @@ class ControllerInterface():
         self.char_buffer = 500
         self.avr_size = 1100
         self.sim_name = 'simDEBUG'
+        self.isolated = False
 
         # Set kwargs, like DT
         for (k, w) in kwargs.items():
@@ -62,12 +102,44 @@ class ControllerInterface():
 
     def init_discon(self):
 
-        # Initialize
+        # -- discon: the same path loaded twice is the same library (and state), so an isolated
+        #    controller loads its own copy from a temporary directory
+        if self.isolated:
+            self.lib_dir = tempfile.mkdtemp(prefix='discon_')
+            self.lib_path = os.path.join(self.lib_dir, os.path.basename(self.lib_name))
+            shutil.copy(self.lib_name, self.lib_path)
+        else:
+            self.lib_dir = None
+            self.lib_path = self.lib_name
+        self.discon = cdll.LoadLibrary(self.lib_path)
+        # avrSWAP is passed to DISCON in place: write into it, do not rebind it
+        self.avrSWAP = np.zeros(self.avr_size, dtype=np.float32)
+        self.p_avrSWAP = self.avrSWAP.ctypes.data_as(POINTER(c_float))
+
+        # Index table of the turbine state: avrSWAP[avr_index] = state_vector[field_index]
+        self.avr_index = np.array([i for field in avrSWAP_state_fields for i in avrSWAP_state_indices[field]])
+        self.field_index = np.array([f for f, field in enumerate(avrSWAP_state_fields) for _ in avrSWAP_state_indices[field]])
+
+        # Initialize DISCON and related
+        self.aviFAIL = c_int32() # 1
+        self.accINFILE = self.param_name.encode('utf-8')
+        self.avcOUTNAME = (self.sim_name + '.RO.dbg').encode('utf-8')
+        self.avcMSG = create_string_buffer(1000)
+        self.discon.DISCON.argtypes = [POINTER(c_float), POINTER(c_int32), c_char_p, c_char_p, c_char_p] # (all defined by ctypes)
+        self.discon.DISCON.restype = None
+        self.p_aviFAIL = byref(self.aviFAIL)
+
+        self.reset_discon()
+
+    def reset_discon(self):
+        '''
+        Restart the controller with a first call, without reloading the library. The state
+        DISCON keeps in its (Fortran module) variables carries over; use reload_discon for a
+        clean controller.
+        '''
         self.pitch = 0
         self.torque = 0
-        # -- discon
-        self.discon = cdll.LoadLibrary(self.lib_name)
-        self.avrSWAP = np.zeros(self.avr_size)
+        self.avrSWAP[:] = 0
 
         # Define some avrSWAP parameters, NOTE: avrSWAP indices are offset by -1 from Fortran
         self.avrSWAP[2] = self.DT
@@ -96,13 +168,6 @@ class ControllerInterface():
         self.avrSWAP[50] = self.char_buffer
         self.avrSWAP[51] = self.char_buffer
 
-        # Initialize DISCON and related
-        self.aviFAIL = c_int32() # 1
-        self.accINFILE = self.param_name.encode('utf-8')
-        self.avcOUTNAME = (self.sim_name + '.RO.dbg').encode('utf-8')
-        self.avcMSG = create_string_buffer(1000)
-        self.discon.DISCON.argtypes = [POINTER(c_float), POINTER(c_int32), c_char_p, c_char_p, c_char_p] # (all defined by ctypes)
-
         # Run DISCON
         self.call_discon()
 
@@ -110,20 +175,21 @@ class ControllerInterface():
         self.avrSWAP[0] = 1
 
 
+    def reload_discon(self):
+        '''
+        Unload the library and load it again, then restart the controller with a first call, so
+        none of the library state carries over. An isolated controller loads a new private copy,
+        a fresh library even if the old one could not be unloaded.
+        '''
+        self.unload_discon()
+        self.init_discon()
+
     def call_discon(self):
         '''
         Call libdiscon.dll (or .so,.dylib,...)
         '''
-        # Convert AVR swap to the c pointer
-        c_float_p = POINTER(c_float)
-        data = self.avrSWAP.astype(np.float32)
-        p_data = data.ctypes.data_as(c_float_p)
-
-        # Run DISCON
-        self.discon.DISCON(p_data, byref(self.aviFAIL), self.accINFILE, self.avcOUTNAME, self.avcMSG)
-
-        # Push back to avr swap
-        self.avrSWAP = data
+        # Run DISCON on the persistent float32 avrSWAP, updated in place
+        self.discon.DISCON(self.p_avrSWAP, self.p_aviFAIL, self.accINFILE, self.avcOUTNAME, self.avcMSG)
 
 
     def call_controller(self, turbine_state, end=False):
@@ -132,7 +198,8 @@ class ControllerInterface():
 
         Parameters:
         -----------
-        turbine_state: dict
+        turbine_state: dict or array-like
+            state vector in avrSWAP_state_fields order (see state_vector), or a dict of:
             t: float
                 time, (s)
             dt: float
@@ -155,23 +222,9 @@ class ControllerInterface():
         '''
 
         # Add states to avr
-        self.avrSWAP[0] = turbine_state['iStatus']
-        self.avrSWAP[1] = turbine_state['t']
-        self.avrSWAP[2] = turbine_state['dt']
-        self.avrSWAP[3] =  turbine_state['bld_pitch']
-        self.avrSWAP[32] = turbine_state['bld_pitch']
-        self.avrSWAP[33] = turbine_state['bld_pitch']
-        self.avrSWAP[14] = turbine_state['gen_speed'] * turbine_state['gen_torque'] * turbine_state['gen_eff']
-        self.avrSWAP[22] = turbine_state['gen_torque']
-        self.avrSWAP[19] = turbine_state['gen_speed']
-        self.avrSWAP[20] = turbine_state['rot_speed']
-        self.avrSWAP[23] = turbine_state['Y_MeasErr']
-        self.avrSWAP[26] = turbine_state['ws']
-        self.avrSWAP[36] = turbine_state['Yaw_fromNorth']
-        try:
-            self.avrSWAP[82] = turbine_state['NacIMU_FA_Acc']
-        except KeyError:
-            self.avrSWAP[82] = 0
+        if isinstance(turbine_state, dict):
+            turbine_state = self.state_vector(turbine_state)
+        self.avrSWAP[self.avr_index] = np.asarray(turbine_state)[self.field_index]
 
         # call controller
         self.call_discon()
@@ -183,6 +236,16 @@ class ControllerInterface():
 
         return(self.torque,self.pitch,self.nac_yawrate)
 
+    def state_vector(self, turbine_state):
+        '''
+        Turbine state dict (see call_controller) as a state vector in avrSWAP_state_fields order,
+        which can be reused and updated in place between calls
+        '''
+        state = dict(turbine_state)
+        state['gen_power'] = turbine_state['gen_speed'] * turbine_state['gen_torque'] * turbine_state['gen_eff']
+        state.setdefault('NacIMU_FA_Acc', 0)
+        return np.array([state[field] for field in avrSWAP_state_fields], dtype=np.float32)
+
     def show_control_values(self):
         '''
         Show control values - should be obvious
@@ -195,7 +258,13 @@ class ControllerInterface():
         Unload the dylib from memory: https://github.com/bwoodsend/cslug/blob/master/cslug/_stdlib.py
         '''
 
-        print('Shutting down {}'.format(self.lib_name))
+        print('Shutting down {}'.format(self.lib_path))
+        self.unload_discon()
+
+    def unload_discon(self):
+        '''
+        Unload the dylib from memory (see kill_discon), quietly
+        '''
         handle = self.discon._handle
 
         # Start copy here
@@ -270,10 +339,92 @@ class ControllerInterface():
 
         del self.discon
 
+        # Remove the private copy of an isolated controller
+        if self.lib_dir is not None:
+            shutil.rmtree(self.lib_dir, ignore_errors=True)
+            self.lib_dir = None
+
+
+class ControllerPool():
+    """
+    Pool of isolated controllers (see ControllerInterface), so batch simulations can reuse
+    controller interfaces: released controllers are reloaded from a fresh copy of the library
+    (reload_discon), so an acquired controller never carries the state of a previous run.
+
+    Methods:
+    --------
+    acquire
+    release
+    close
+
+    Parameters:
+    -----------
+    lib_name : str
+                name of compiled dynamic library containing controller, (.dll,.so,.dylib)
+    param_filename : str, optional
+                controller input file
+    size : int, optional
+                maximum number of controllers (default: no limit)
+    kwargs :
+                passed to each ControllerInterface, e.g. DT
+    """
+
+    def __init__(self, lib_name, param_filename='DISCON.IN', size=None, **kwargs):
+        self.lib_name = lib_name
+        self.param_filename = param_filename
+        self.size = size
+        self.kwargs = kwargs
+        self.idle = []      # freshly loaded, ready to be acquired
+        self.busy = []      # acquired
+
+    def acquire(self, n=None):
+        '''
+        One controller, or a list of n controllers, loading new ones when none are idle
+        '''
+        count = 1 if n is None else n
+        if self.size is not None and len(self.busy) + count > self.size:
+            raise RuntimeError('Controller pool exhausted ({} of {} in use)'.format(len(self.busy), self.size))
+        controllers = []
+        for _ in range(count):
+            if self.idle:
+                controller_int = self.idle.pop()
+            else:
+                controller_int = ControllerInterface(self.lib_name, param_filename=self.param_filename,
+                                                     isolated=True, **self.kwargs)
+            self.busy.append(controller_int)
+            controllers.append(controller_int)
+        return controllers[0] if n is None else controllers
+
+    def release(self, controllers):
+        '''
+        Reload controller(s) and return them to the pool
+        '''
+        if isinstance(controllers, ControllerInterface):
+            controllers = [controllers]
+        for controller_int in controllers:
+            self.busy.remove(controller_int)
+            controller_int.reload_discon()
+            self.idle.append(controller_int)
+
+    def close(self):
+        '''
+        Unload all controllers
+        '''
+        for controller_int in self.idle + self.busy:
+            controller_int.kill_discon()
+        self.idle = []
+        self.busy = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
 
 class farm_zmq_server():
     def __init__(self, network_addresses=["tcp://*:5555", "tcp://*:5556"],
-                 identifiers=None, timeout=600.0, verbose=False):
+                 identifiers=None, timeout=600.0, verbose=False, structured=False):
         """Python implementation for communicating with multiple instances
         of the ROSCO ZeroMQ interface. This is useful for SOWFA and FAST.Farm
         simulations in which multiple turbines are running in real time.
@@ -287,8 +438,14 @@ class farm_zmq_server():
             timeout (float, optional): Seconds to wait for a message from
             the ZeroMQ server before timing out. Defaults to 600.0.
             verbose (bool, optional): Print to console. Defaults to False.
+            structured (bool, optional): Return measurements as reusable
+            numpy structured records (see turbine_zmq_server).
+
+        All sockets are multiplexed on a single poller, so turbines are
+        served in the order their measurements arrive.
         """
         self.network_addresses = network_addresses
+        self.timeout = timeout
         self.verbose = verbose
         self.nturbs = len(self.network_addresses)
 
@@ -302,19 +459,67 @@ class farm_zmq_server():
                 network_address=address,
                 identifier=identifiers[ti],
                 timeout=timeout,
-                verbose=verbose)
+                verbose=verbose,
+                structured=structured)
+
+        # Single poller over all turbine sockets
+        self.poller = zmq.Poller()
+        self._socket_index = {}
+        for ti, server in enumerate(self.zmq_servers):
+            self.poller.register(server.socket, zmq.POLLIN)
+            self._socket_index[server.socket] = ti
+
+    def _disconnect(self, turbines=None):
+        '''
+        Disconnect turbines (default: all), e.g. once they report iStatus == -1
+        '''
+        for ti in (range(self.nturbs) if turbines is None else turbines):
+            server = self.zmq_servers[ti]
+            if server.socket in self._socket_index:
+                self.poller.unregister(server.socket)
+                del self._socket_index[server.socket]
+                server._disconnect()
+
+    def poll(self, timeout=None):
+        '''
+        Wait up to timeout seconds (default: self.timeout) for measurements
+        and return the indices of the turbines that have one waiting
+        '''
+        timeout = self.timeout if timeout is None else timeout
+        events = self.poller.poll(int(timeout * 1000))
+        return sorted(self._socket_index[socket] for socket, _ in events)
+
+    def get_ready_measurements(self, timeout=None):
+        '''
+        Get measurements from the turbines that have sent one, without
+        waiting on the others
+
+        Returns:
+        --------
+        measurements: dict
+            Measurements by turbine index (empty on timeout)
+        '''
+        return {ti: self.zmq_servers[ti].read_measurements()
+                for ti in self.poll(timeout)}
 
     def get_measurements(self):
         '''
         Get measurements from zmq servers
         '''
         measurements = [None for _ in range(self.nturbs)]
-        for ti in range(self.nturbs):
-            measurements[ti] = self.zmq_servers[ti].get_measurements()
+        waiting = set(range(self.nturbs))
+        while waiting:
+            ready = [ti for ti in self.poll() if ti in waiting]
+            if not ready:
+                raise IOError("Connection to turbine(s) %s timed out."
+                              % [self.zmq_servers[ti].identifier for ti in sorted(waiting)])
+            for ti in ready:
+                measurements[ti] = self.zmq_servers[ti].read_measurements()
+                waiting.discard(ti)
         return measurements
 
     def send_setpoints(self, genTorques=None, nacelleHeadings=None,
-                       bladePitchAngles=None):
+                       bladePitchAngles=None, turbines=None):
         '''
         Send setpoints to DLL via zmq server for farm level controls
 
@@ -326,6 +531,9 @@ class farm_zmq_server():
             List of nacelle headings of length self.nturbs
         bladePitchAngles: List
             List of blade pitch angles of length self.nturbs
+        turbines: List, optional
+            Indices of the turbines to reply to (default: all), e.g. those
+            returned by get_ready_measurements
         '''
         # Default choices if unspecified
         if genTorques is None:
@@ -336,7 +544,7 @@ class farm_zmq_server():
             bladePitchAngles = [[0.0, 0.0, 0.0]] * self.nturbs
 
         # Send setpoints
-        for ti in range(self.nturbs):
+        for ti in (range(self.nturbs) if turbines is None else turbines):
             self.zmq_servers[ti].send_setpoints(
                 genTorque=genTorques[ti],
                 nacelleHeading=nacelleHeadings[ti],
@@ -346,7 +554,7 @@ class farm_zmq_server():
 
 class turbine_zmq_server():
     def __init__(self, network_address="tcp://*:5555", identifier="0",
-                 timeout=600.0, verbose=False):
+                 timeout=600.0, verbose=False, structured=False):
         """Python implementation of the ZeroMQ server side for the ROSCO
         ZeroMQ wind farm control interface. This class makes it easy for
         users to receive measurements from ROSCO and then send back control
@@ -364,11 +572,23 @@ class turbine_zmq_server():
             timeout (float, optional): Seconds to wait for a message from
             the ZeroMQ server before timing out. Defaults to 600.0.
             verbose (bool, optional): Print to console. Defaults to False.
+            structured (bool, optional): Return measurements as a reusable
+            numpy structured record (read like a dict, overwritten on the
+            next call) instead of a new dict. Defaults to False.
+
+        Both the text protocol and the packed binary protocol (ROSCO built
+        with ZMQ_BINARY) are understood; setpoints are replied in the
+        protocol of the last measurement message.
         """
         self.network_address = network_address
         self.identifier = identifier
         self.timeout = timeout
         self.verbose = verbose
+        self.structured = structured
+        self.binary = False  # protocol of the last measurement message
+        self._measurements = np.zeros(1, dtype=zmq_measurement_dtype)
+        self._setpoints = np.zeros(5, dtype='<f8')
+        self._setpoint_header = ZMQ_BINARY_HEADER.pack(ZMQ_BINARY_MAGIC, ZMQ_BINARY_VERSION, 5)
         self._connect()
 
     def _connect(self):
@@ -405,55 +625,40 @@ class turbine_zmq_server():
         poller = zmq.Poller()
         poller.register(self.socket, zmq.POLLIN)
         timeout_ms = int(self.timeout * 1000)
-        if poller.poll(timeout_ms):
-            # Receive measurements over network protocol
-            message_in = self.socket.recv_string()
-        else:
+        if not poller.poll(timeout_ms):
             raise IOError("[%s] Connection to '%s' timed out."
                           % (self.identifier, self.network_address))
+        return self.read_measurements()
 
-        # Convert to individual strings and then to floats
-        measurements = message_in
-        measurements = measurements.replace('\x00', '').split(',')
-        measurements = [float(m) for m in measurements]
-
-        # Convert to a measurement dict
-        measurements = dict({
-            'iStatus': measurements[0],
-            'Time': measurements[1],
-            'VS_MechGenPwr':  measurements[2],
-            'VS_GenPwr': measurements[3],
-            'GenSpeed': measurements[4],
-            'RotSpeed': measurements[5],
-            'GenTqMeas': measurements[6],
-            'NacelleHeading': measurements[7],
-            'NacelleVane': measurements[8],
-            'HorWindV': measurements[9],
-            'rootMOOP1': measurements[10],
-            'rootMOOP2': measurements[11],
-            'rootMOOP3': measurements[12],
-            'FA_Acc': measurements[13],
-            'NacIMU_FA_Acc': measurements[14],
-            'Azimuth': measurements[15],
-            'PtfmTDX': measurements[16],
-            'PtfmTDY': measurements[17],
-            'PtfmTDZ': measurements[18],
-            'PtfmRDX': measurements[19],
-            'PtfmRDY': measurements[20],
-            'PtfmRDZ': measurements[21],
-            'PtfmTVX': measurements[22],
-            'PtfmTVY': measurements[23],
-            'PtfmTVZ': measurements[24],
-            'PtfmRVX': measurements[25],
-            'PtfmRVY': measurements[26],
-            'PtfmRVZ': measurements[27],
-            'PtfmTAX': measurements[28],
-            'PtfmTAY': measurements[29],
-            'PtfmTAZ': measurements[30],
-            'PtfmRAX': measurements[31],
-            'PtfmRAY': measurements[32],
-            'PtfmRAZ': measurements[33]
-        })
+    def read_measurements(self):
+        '''
+        Receive and decode a measurement message that is already waiting
+        on the socket (e.g. after polling several servers at once)
+        '''
+        # Receive measurements over network protocol
+        message_in = self.socket.recv()
+
+        n_values = len(zmq_measurement_names)
+        self.binary = message_in[:2] == ZMQ_BINARY_MAGIC
+        if self.binary:
+            # Packed binary message: check the header, then decode in place
+            _, version, count = ZMQ_BINARY_HEADER.unpack_from(message_in)
+            if version != ZMQ_BINARY_VERSION or count != n_values:
+                raise ValueError("[%s] Unsupported binary message (version %d, %d values)"
+                                 % (self.identifier, version, count))
+            self._measurements[0] = np.frombuffer(message_in, dtype=zmq_measurement_dtype,
+                                                  count=1, offset=ZMQ_BINARY_HEADER.size)[0]
+        else:
+            # Convert to individual strings and then to floats
+            measurements = message_in.decode()
+            measurements = measurements.replace('\x00', '').split(',')
+            self._measurements.view('<f8')[:] = [float(m) for m in measurements[:n_values]]
+
+        if self.structured:
+            measurements = self._measurements[0]
+        else:
+            # Convert to a measurement dict
+            measurements = dict(zip(zmq_measurement_names, self._measurements.view('<f8').tolist()))
 
         if self.verbose:
             print('[%s] Measurements received:' % self.identifier, measurements)
@@ -475,9 +680,14 @@ class turbine_zmq_server():
             Blade pitch angle setpoint
         '''
         # Create a message with setpoints to send to ROSCO
-        message_out = b"%016.5f, %016.5f, %016.5f, %016.5f, %016.5f" % (
-            genTorque, nacelleHeading, bladePitch[0], bladePitch[1],
-            bladePitch[2])
+        if self.binary:
+            self._setpoints[:] = (genTorque, nacelleHeading, bladePitch[0],
+                                  bladePitch[1], bladePitch[2])
+            message_out = self._setpoint_header + self._setpoints.tobytes()
+        else:
+            message_out = b"%016.5f, %016.5f, %016.5f, %016.5f, %016.5f" % (
+                genTorque, nacelleHeading, bladePitch[0], bladePitch[1],
+                bladePitch[2])
 
         #  Send reply back to client
         if self.verbose:
@@ -224,10 +224,6 @@ class Controller():
 
         # initialize variables
         pitch_op    = np.empty(len(TSR_op))
-        dCp_beta    = np.empty(len(TSR_op))
-        dCp_TSR     = np.empty(len(TSR_op))
-        dCt_beta    = np.empty(len(TSR_op))
-        dCt_TSR     = np.empty(len(TSR_op))
         Ct_op       = np.empty(len(TSR_op))
 
         # ------------- Find Linearized State "Matrices" ------------- #
@@ -247,16 +243,15 @@ class Controller():
             else:                                                             # no defined minimum pitch schedule
                 pitch_op[i] = f_cp_pitch(Cp_op[i])     
 
-            # Calculate Cp Surface gradients
-            dCp_beta[i], dCp_TSR[i] = turbine.Cp.interp_gradient(pitch_op[i],TSR_op[i]) 
-            dCt_beta[i], dCt_TSR[i] = turbine.Ct.interp_gradient(pitch_op[i],TSR_op[i]) 
-        
             # Thrust
             Ct_TSR      = np.ndarray.flatten(turbine.Ct.interp_surface(turbine.pitch_initial_rad, TSR_op[i]))     # all Cp values for a given tsr
             f_ct        = interpolate.interp1d(pitch_initial_rad,Ct_TSR)
             Ct_op[i]    = f_ct(pitch_op[i])
             Ct_op[i]    = np.clip(Ct_op[i], np.min(Ct_TSR), np.max(Ct_TSR))        # saturate Ct values to be on Ct surface
 
+        # Calculate Cp Surface gradients (all operating points at once)
+        dCp_beta, dCp_TSR = turbine.Cp.interp_gradient_batch(pitch_op, TSR_op).T
+        dCt_beta, dCt_TSR = turbine.Ct.interp_gradient_batch(pitch_op, TSR_op).T
 
         # Define minimum pitch saturation to be at Cp-maximizing pitch angle if not specifically defined
         if not isinstance(self.min_pitch, float):
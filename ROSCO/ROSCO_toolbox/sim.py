@@ -10,7 +10,9 @@
 # speROSCO_cific language governing permissions and limitations under the License.
 
 import numpy as np
+import multiprocessing as mp
 from ROSCO_toolbox import turbine as ROSCO_turbine
+from ROSCO_toolbox import control_interface as ROSCO_ci
 import matplotlib.pyplot as plt
 import sys
 
@@ -33,6 +35,7 @@ class Sim():
     Methods:
     --------
     sim_ws_series
+    sim_ws_batch
 
     Parameters:
     -----------
@@ -210,6 +213,121 @@ class Sim():
                 ax.set_xlabel('Time (s)')
                 ax.grid()
 
+    def sim_ws_batch(self, t_array, ws_array, rotor_rpm_init=10, init_pitch=0.0,
+                     wd_array=None, yaw_init=0.0, controller_ints=None, unload=True):
+        '''
+        Simulate M wind speed series at once, advancing the M 1DOF rotor models in lock-step.
+            - same model as sim_ws_series, with the rotor states held in (M x T) arrays
+
+        Parameters:
+        -----------
+            t_array: list-like
+                     Array of time steps, (s)
+            ws_array: array-like
+                      [M x T] array of wind speeds, one series per scenario, (m/s)
+            wd_array: array-like, optional
+                      [M x T] array of wind directions, (rad)
+            yaw_init: float, optional
+                      Initial "north", (or constant) yaw angle, (rad)
+            rotor_rpm_init: float, optional
+                            initial rotor speed, (rpm)
+            init_pitch: float, optional
+                        initial blade pitch angle, (deg)
+            controller_ints: list, optional
+                             One controller interface per scenario (default: [self.controller_int]
+                             for a single scenario). DISCON keeps its state per loaded library, so
+                             each one must load its own copy of the library (isolated=True, or from
+                             a ControllerPool); otherwise use sim_ws_batch_parallel.
+            unload: bool, optional
+                    unload the controllers at the end (False to release them back to a ControllerPool)
+
+        Returns:
+        --------
+            results: dict
+                     [M x T] arrays: bld_pitch, rot_speed, gen_speed, aero_torque, gen_torque,
+                     gen_power, nac_yaw, nac_yawrate, ws, wd
+        '''
+        ws_array = np.atleast_2d(np.asarray(ws_array, dtype=float))
+        M, T = ws_array.shape
+        if controller_ints is None:
+            controller_ints = [self.controller_int]
+        if len(controller_ints) != M:
+            raise ValueError('One controller interface per scenario is required ({} for {} scenarios)'.format(len(controller_ints), M))
+        if len(set(ci.lib_path for ci in controller_ints)) < M:
+            raise ValueError('Controller interfaces share a library (and its state); load a copy per scenario or use sim_ws_batch_parallel')
+
+        # check for wind direction array
+        if wd_array is not None:
+            wd_array = np.atleast_2d(np.asarray(wd_array, dtype=float))
+            if wd_array.shape != ws_array.shape:
+                raise ValueError('ws_array and wd_array must be the same shape')
+        else:
+            wd_array = np.zeros_like(ws_array)
+
+        # Store turbine data for convenience
+        dt = t_array[1] - t_array[0]
+        R = self.turbine.rotor_radius
+        GBRatio = self.turbine.Ng
+        gen_eff = self.turbine.GenEff/100
+
+        # Declare output arrays
+        bld_pitch = np.full((M, T), init_pitch * deg2rad)
+        rot_speed = np.full((M, T), rotor_rpm_init * rpm2RadSec)  # represent rot speed in rad / s
+        gen_speed = np.full((M, T), rotor_rpm_init * GBRatio * rpm2RadSec)  # represent gen speed in rad/s
+        aero_torque = np.full((M, T), 1000.0)
+        gen_torque = np.ones((M, T))
+        gen_power = np.zeros((M, T))
+        nac_yaw = np.full((M, T), yaw_init)
+        nac_yawerr = np.zeros((M, T))
+        nac_yawrate = np.zeros((M, T))
+
+        # Loop through time
+        for i in range(1, T):
+            ws = ws_array[:, i]
+
+            # Current Cp for all scenarios
+            tsr = rot_speed[:, i-1] * R / ws
+            cp = self.turbine.Cp.interp_surface_batch(bld_pitch[:, i-1], tsr)
+            # Update the turbine states
+            #       -- 1DOF model: rotor speed and generator speed (scaled by Ng)
+            aero_torque[:, i] = 0.5 * self.turbine.rho * (np.pi * R**3) * (cp/tsr) * ws**2
+            rot_speed[:, i] = rot_speed[:, i-1] + (dt/self.turbine.J)*(aero_torque[:, i]
+                                                                       * gen_eff - GBRatio * gen_torque[:, i-1])
+            gen_speed[:, i] = rot_speed[:, i] * GBRatio
+            #       -- Simple nacelle model
+            nac_yawerr[:, i] = wd_array[:, i] - nac_yaw[:, i-1]
+
+            # Call each scenario's controller
+            for m, controller_int in enumerate(controller_ints):
+                turbine_state = {
+                    'iStatus': 1,
+                    't': t_array[i],
+                    'dt': dt,
+                    'ws': ws[m],
+                    'bld_pitch': bld_pitch[m, i-1],
+                    'gen_torque': gen_torque[m, i-1],
+                    'gen_speed': gen_speed[m, i],
+                    'gen_eff': gen_eff,
+                    'rot_speed': rot_speed[m, i],
+                    'Yaw_fromNorth': nac_yaw[m, i],
+                    'Y_MeasErr': nac_yawerr[m, i-1],
+                }
+                gen_torque[m, i], bld_pitch[m, i], nac_yawrate[m, i] = controller_int.call_controller(turbine_state)
+
+            # Calculate the power
+            gen_power[:, i] = gen_speed[:, i] * gen_torque[:, i] * gen_eff
+
+            # Calculate the nacelle position
+            nac_yaw[:, i] = nac_yaw[:, i-1] + nac_yawrate[:, i] * dt
+
+        if unload:
+            for controller_int in controller_ints:
+                controller_int.kill_discon()
+
+        return {'bld_pitch': bld_pitch, 'rot_speed': rot_speed, 'gen_speed': gen_speed,
+                'aero_torque': aero_torque, 'gen_torque': gen_torque, 'gen_power': gen_power,
+                'nac_yaw': nac_yaw, 'nac_yawrate': nac_yawrate, 'ws': ws_array, 'wd': wd_array}
+
     def sim_ws_wd_series(self, t_array, ws_array, wd_array,
                          rotor_rpm_init=10,
                          init_pitch=0.0,
@@ -354,3 +472,55 @@ class Sim():
             ax.set_xlabel('Time (s)')
             for ax in axarr:
                 ax.grid()
+
+
+def _sim_ws_worker(args):
+    # One scenario in a fresh process, so the controller library starts from a clean state
+    turbine, lib_name, param_filename, controller_kwargs, t_array, ws_array, wd_array, sim_kwargs = args
+    controller_int = ROSCO_ci.ControllerInterface(lib_name, param_filename=param_filename, **controller_kwargs)
+    return Sim(turbine, controller_int).sim_ws_batch(t_array, ws_array, wd_array=wd_array, **sim_kwargs)
+
+
+def sim_ws_batch_parallel(turbine, lib_name, t_array, ws_array, wd_array=None,
+                          param_filename='DISCON.IN', n_workers=None, controller_kwargs=None, **sim_kwargs):
+    '''
+    Simulate M wind speed series with the simplified turbine model, one scenario per worker process
+    (each loads its own controller library).
+
+    Parameters:
+    -----------
+        turbine: class
+                 Turbine class containing wind turbine information from OpenFAST model
+        lib_name: str
+                  Compiled controller library (.dll, .so, .dylib)
+        t_array: list-like
+                 Array of time steps, (s)
+        ws_array: array-like
+                  [M x T] array of wind speeds, (m/s)
+        wd_array: array-like, optional
+                  [M x T] array of wind directions, (rad)
+        param_filename: str, optional
+                        Controller input file
+        n_workers: int, optional
+                   Worker processes (default: number of CPUs)
+        controller_kwargs: dict, optional
+                           Keyword arguments of the controller interfaces, e.g. DT
+        sim_kwargs:
+                   Keyword arguments of Sim.sim_ws_batch (rotor_rpm_init, init_pitch, yaw_init)
+
+    Returns:
+    --------
+        results: dict
+                 [M x T] arrays, as Sim.sim_ws_batch
+    '''
+    ws_array = np.atleast_2d(np.asarray(ws_array, dtype=float))
+    wd_rows = [None] * len(ws_array) if wd_array is None else np.atleast_2d(wd_array)
+    controller_kwargs = {} if controller_kwargs is None else controller_kwargs
+    tasks = [(turbine, lib_name, param_filename, controller_kwargs, t_array, ws_row[None], None if wd_row is None else wd_row[None], sim_kwargs)
+             for ws_row, wd_row in zip(ws_array, wd_rows)]
+
+    # maxtasksperchild=1: a new process (and controller state) for every scenario
+    with mp.Pool(n_workers, maxtasksperchild=1) as pool:
+        scenarios = pool.map(_sim_ws_worker, tasks)
+
+    return {key: np.vstack([scenario[key] for scenario in scenarios]) for key in scenarios[0]}
@@ -12,11 +12,12 @@
 import os
 import numpy as np
 import datetime
+import hashlib
+import json
 from scipy import interpolate
 from numpy import gradient
 import pickle
 import matplotlib.pyplot as plt
-import pandas as pd
 
 from ROSCO_toolbox.utilities import load_from_txt
 
@@ -316,11 +317,19 @@ class Turbine():
 
     
     def generate_rotperf_fast(self, openfast_path, FAST_runDirectory=None, run_BeamDyn=False,
-                              debug_level=1, run_type='multi'):
+                              debug_level=1, run_type='multi', cores=None, pitch_initial=None,
+                              TSR_initial=None, cache_dir=None, TMax=110, TMax_max=330, t_avg=30,
+                              conv_tol=1e-3):
         '''
         Use openfast to generate Cp surface data. Will be slow, especially if using BeamDyn,
         but may be necessary if cc-blade is not sufficient.
 
+        Each grid point is cached under a key of the model inputs, the convergence settings and
+        the point, so only points that are not cached yet are run (e.g. after refining the grid).
+        Runs start at TMax and are rerun with twice the length until the means of Cq and Ct over
+        the last two t_avg windows agree within conv_tol, as long as the simulated time of a
+        point stays within TMax_max (the cost of a single run of TMax_max).
+
         Parameters:
         -----------
         openfast_path: str
@@ -334,27 +343,40 @@ class Turbine():
         run_type: str
             'serial' - run in serial, 'multi' - run using python multiprocessing tools, 
             'mpi' - run using mpi tools
+        cores: int, optional
+            processes for run_type='multi' (default: number of CPUs)
+        pitch_initial: array-like, optional
+            blade pitch angles of the grid, (deg)
+        TSR_initial: array-like, optional
+            tip speed ratios of the grid
+        cache_dir: str, optional
+            directory of cached grid points (default: FAST_runDirectory/cache)
+        TMax: float
+            first simulation length, (s)
+        TMax_max: float
+            simulated time budget of a grid point over all its runs, points are cached as not
+            converged once it does not allow a longer run, (s)
+        t_avg: float
+            averaging window, (s)
+        conv_tol: float
+            relative tolerance on the change of the Cq and Ct means between windows
         '''
         if use_weis:
-            from weis.aeroelasticse import runFAST_pywrapper, CaseGen_General
-            from weis.aeroelasticse.Util import FileTools
+            from weis.aeroelasticse import runFAST_pywrapper
         else:
-            from ROSCO_toolbox.ofTools.case_gen import runFAST_pywrapper, CaseGen_General
-            from ROSCO_toolbox.ofTools.util import FileTools
-        # Load pCrunch tools
-        from pCrunch import Processing
+            from ROSCO_toolbox.ofTools.case_gen import runFAST_pywrapper
+        from ROSCO_toolbox.ofTools.fast_io.output_processing import load_binary_output
 
         # setup values for surface
         v0 = self.v_rated + 2
-        TSR_initial = np.arange(3, 15,1)
-        pitch_initial = np.arange(-1,25,1)
+        TSR_initial = np.arange(3, 15,1) if TSR_initial is None else np.asarray(TSR_initial)
+        pitch_initial = np.arange(-1,25,1) if pitch_initial is None else np.asarray(pitch_initial)
         rotspeed_initial = TSR_initial*v0/self.rotor_radius * RadSec2rpm # rpms
 
         # Specify Case Inputs
         case_inputs = {}
 
         # ------- Setup OpenFAST inputs --------
-        case_inputs[('Fst','TMax')] = {'vals': [330], 'group': 0}
         case_inputs[('Fst','Compinflow')] = {'vals': [1], 'group': 0}
         case_inputs[('Fst','CompAero')] = {'vals': [2], 'group': 0}
         case_inputs[('Fst','CompServo')] = {'vals': [1], 'group': 0}
@@ -403,45 +425,57 @@ class Turbine():
         case_inputs[('ServoDyn', 'HSSBrMode')] = {'vals': [0], 'group': 0}
         case_inputs[('ServoDyn', 'YCMode')] = {'vals': [0], 'group': 0}
 
-        # ------- Setup sweep values inputs --------
-        case_inputs[('ElastoDyn', 'BlPitch1')] = {'vals': list(pitch_initial), 'group': 1}
-        case_inputs[('ElastoDyn', 'BlPitch2')] = {'vals': list(pitch_initial), 'group': 1}
-        case_inputs[('ElastoDyn', 'BlPitch3')] = {'vals': list(pitch_initial), 'group': 1}
-        case_inputs[('ElastoDyn', 'RotSpeed')] = {'vals': list(rotspeed_initial), 'group': 2}
-
+        # ------- Cache of grid points --------
+        if not FAST_runDirectory:
+            FAST_runDirectory = os.path.join(os.getcwd(), 'RotPerf_OpenFAST')
+        if not cache_dir:
+            cache_dir = os.path.join(FAST_runDirectory, 'cache')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Model key: the model as read by load_from_fast (without the controller inputs, which
+        # hold the tables generated here), the fixed case inputs, the convergence settings (a
+        # point cached as not converged is run again with a larger budget or another tolerance)
+        # and the OpenFAST executable (a rebuilt or upgraded executable changes its size or
+        # modification time)
+        model_key = hashlib.sha1()
+        _hash_update(model_key, {k: v for k, v in self.fast.fst_vt.items() if k != 'DISCON_in'})
+        _hash_update(model_key, case_inputs)
+        _hash_update(model_key, [float(TMax), float(TMax_max), float(t_avg), float(conv_tol)])
+        openfast_exe = os.path.realpath(openfast_path)
+        if os.path.isfile(openfast_exe):
+            openfast_stat = os.stat(openfast_exe)
+            _hash_update(model_key, [openfast_exe, openfast_stat.st_size, openfast_stat.st_mtime_ns])
+        else:
+            _hash_update(model_key, openfast_path)
+        model_key = model_key.hexdigest()
+
+        points = [(float(pitch), float(rotspeed)) for pitch in pitch_initial for rotspeed in rotspeed_initial]
+        keys = [hashlib.sha1('{}|{!r}|{!r}'.format(model_key, pitch, rotspeed).encode()).hexdigest()
+                for pitch, rotspeed in points]
+        cached = {}
+        for key in keys:
+            cache_file = os.path.join(cache_dir, key + '.json')
+            if os.path.exists(cache_file):
+                with open(cache_file) as f:
+                    cached[key] = json.load(f)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        print('Rotor performance: {} of {} grid points cached, running {}.'.format(
+            len(points) - len(missing), len(points), len(missing)))
 
         # FAST details
         fastBatch = runFAST_pywrapper.runFAST_pywrapper_batch()
         fastBatch.FAST_exe = openfast_path  # Path to executable
         fastBatch.FAST_InputFile = self.fast.FAST_InputFile
         fastBatch.FAST_directory = self.fast.FAST_directory
-        if not FAST_runDirectory:
-            FAST_runDirectory = os.path.join(os.getcwd(), 'RotPerf_OpenFAST')
         fastBatch.FAST_runDirectory = FAST_runDirectory
         fastBatch.debug_level = debug_level
 
-        # Generate cases
-        case_name_base = self.TurbineName + '_rotperf'
-        case_list, case_name_list = CaseGen_General.CaseGen_General(
-            case_inputs, dir_matrix=fastBatch.FAST_runDirectory, namebase=case_name_base)
-        fastBatch.case_list = case_list
-        fastBatch.case_name_list = case_name_list
-
         # Make sure proper outputs exist
         var_out = [
-            # ElastoDyn (this is probably overkill on the outputs)
-            "BldPitch1", "BldPitch2", "BldPitch3", "Azimuth", "RotSpeed", "GenSpeed", "NacYaw",
-            "OoPDefl1", "IPDefl1", "TwstDefl1", "OoPDefl2", "IPDefl2", "TwstDefl2", "OoPDefl3",
-            "IPDefl3", "TwstDefl3", "RootFxc1",
-            "RootFyc1", "RootFzc1", "RootMxc1", "RootMyc1", "RootMzc1", "RootFxc2", "RootFyc2",
-            "RootFzc2", "RootMxc2", "RootMyc2", "RootMzc2", "RootFxc3", "RootFyc3", "RootFzc3",
-            "RootMxc3", "RootMyc3", "RootMzc3", "Spn1MLxb1", "Spn1MLyb1", "Spn1MLzb1", "Spn1MLxb2",
-            "Spn1MLyb2", "Spn1MLzb2", "Spn1MLxb3", "Spn1MLyb3", "Spn1MLzb3", "RotThrust", "LSSGagFya",
-            "LSSGagFza", "RotTorq", "LSSGagMya", "LSSGagMza", 
-            # ServoDyn
-            "GenPwr", "GenTq",
+            # ElastoDyn
+            "BldPitch1", "BldPitch2", "BldPitch3", "Azimuth", "RotSpeed", "GenSpeed",
+            "RotThrust", "RotTorq",
             # AeroDyn15
-            "RtArea", "RtVAvgxh", "B1N3Clrnc", "B2N3Clrnc", "B3N3Clrnc",
             "RtFldCp", 'RtFldCq', 'RtFldCt', 'RtTSR', # NECESSARY
             # InflowWind
             "Wind1VelX", 
@@ -451,56 +485,64 @@ class Turbine():
             channels[var] = True
         fastBatch.channels = channels
 
-        # Run OpenFAST
-        if run_type.lower() == 'multi':
-            fastBatch.run_multi()
-        elif run_type.lower()=='mpi':
-            fastBatch.run_mpi()
-        elif run_type.lower()=='serial':
-            fastBatch.run_serial()
-
-        # ========== Post Processing ==========
-        # Save statistics
-        fp = Processing.FAST_Processing()
-
-        # Find all outfiles
-        fname_case_matrix = os.path.join(FAST_runDirectory, 'case_matrix.yaml')
-        case_matrix = FileTools.load_yaml(fname_case_matrix, package=1)
-        cm = pd.DataFrame(case_matrix)
-        # Parse case matrix and find outfiles names
-        outfiles = []
-        case_names = cm['Case_Name']
-        outfiles = []
-        for name in case_names:
-            outfiles.append(os.path.join(FAST_runDirectory, name + '.outb'))
-
-
-
-        # Set some processing parameters
-        fp.OpenFAST_outfile_list = outfiles
-        fp.namebase = case_name_base
-        fp.t0 = 270 
-        fp.parallel_analysis = True
-        fp.results_dir = os.path.join(FAST_runDirectory,'stats')
-        fp.verbose = True
-        # Save for debug!
-        fp.save_LoadRanking = False
-        fp.save_SummaryStats = False
-
-        print('Processing openfast data on {} cores.'.format(fp.parallel_cores))
-
-        # Load and save statistics and load rankings
-        stats, load_rankings = fp.batch_processing()
-
-        # Get means of last 30 seconds of 300 second simulation
-        CP = stats[0]['RtAeroCp']['mean']
-        CT = stats[0]['RtAeroCt']['mean']
-        CQ = stats[0]['RtAeroCq']['mean']
+        # ------- Run missing points, extending the runs that have not converged --------
+        case_name_base = self.TurbineName + '_rotperf'
+        fixed_case = {key: value['vals'][0] for key, value in case_inputs.items()}
+        tmax = max(TMax, 2 * t_avg)
+        spent = 0  # simulated time of each missing point so far (runs restart from t=0)
+        while missing:
+            case_list, case_name_list = [], []
+            for i in missing:
+                pitch, rotspeed = points[i]
+                case = dict(fixed_case)
+                case[('Fst','TMax')] = tmax
+                case[('ElastoDyn', 'BlPitch1')] = pitch
+                case[('ElastoDyn', 'BlPitch2')] = pitch
+                case[('ElastoDyn', 'BlPitch3')] = pitch
+                case[('ElastoDyn', 'RotSpeed')] = rotspeed
+                case_list.append(case)
+                case_name_list.append('{}_{}'.format(case_name_base, keys[i][:12]))
+            fastBatch.case_list = case_list
+            fastBatch.case_name_list = case_name_list
+
+            # Run OpenFAST
+            if run_type.lower() == 'multi':
+                fastBatch.run_multi(cores)
+            elif run_type.lower()=='mpi':
+                fastBatch.run_mpi()
+            elif run_type.lower()=='serial':
+                fastBatch.run_serial()
+
+            # Next run length within the budget, the points are final if it is not longer
+            spent += tmax
+            tmax_next = min(2 * tmax, TMax_max - spent)
+            final = tmax_next <= tmax
+
+            still_missing = []
+            for i, name in zip(missing, case_name_list):
+                data, info = load_binary_output(os.path.join(FAST_runDirectory, name + '.outb'))
+                out = dict(zip(info['channels'], data.T))
+                coeffs, steady = {}, {}
+                for coeff in ['Cp', 'Ct', 'Cq']:
+                    # AeroDyn outputs were renamed from RtAero* to RtFld* in OpenFAST 3.5
+                    signal = out['RtFld' + coeff] if 'RtFld' + coeff in out else out['RtAero' + coeff]
+                    coeffs[coeff], steady[coeff] = _steady_mean(out['Time'], signal, t_avg, conv_tol)
+                converged = steady['Cq'] and steady['Ct']  # steady rotor torque and thrust
+                if converged or final:
+                    pitch, rotspeed = points[i]
+                    cached[keys[i]] = dict(pitch=pitch, rotspeed=rotspeed, TMax=tmax,
+                                           converged=bool(converged), **coeffs)
+                    with open(os.path.join(cache_dir, keys[i] + '.json'), 'w') as f:
+                        json.dump(cached[keys[i]], f)
+                else:
+                    still_missing.append(i)
+            missing = still_missing
+            tmax = tmax_next
 
         # Reshape Cp, Ct and Cq
-        Cp = np.transpose(np.reshape(CP, (len(pitch_initial), len(TSR_initial))))
-        Ct = np.transpose(np.reshape(CT, (len(pitch_initial), len(TSR_initial))))
-        Cq = np.transpose(np.reshape(CQ, (len(pitch_initial), len(TSR_initial))))
+        Cp = np.transpose(np.reshape([cached[key]['Cp'] for key in keys], (len(pitch_initial), len(TSR_initial))))
+        Ct = np.transpose(np.reshape([cached[key]['Ct'] for key in keys], (len(pitch_initial), len(TSR_initial))))
+        Cq = np.transpose(np.reshape([cached[key]['Cq'] for key in keys], (len(pitch_initial), len(TSR_initial))))
 
         # Store necessary metrics for analysis
         self.pitch_initial_rad = pitch_initial * deg2rad
@@ -570,6 +612,42 @@ class Turbine():
         self.twist = theta
         self.bld_flapwise_damp = self.fast.fst_vt['ElastoDynBlade']['BldFlDmp1']/100
 
+
+def _hash_update(h, obj):
+    # Feed a nested structure of dicts, lists, arrays and scalars to a hashlib object (other
+    # types have no stable representation to hash)
+    if isinstance(obj, dict):
+        for key in sorted(obj, key=repr):
+            h.update(repr(key).encode())
+            _hash_update(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'[')
+        for item in obj:
+            _hash_update(h, item)
+        h.update(b']')
+    elif isinstance(obj, np.ndarray):
+        h.update(str(obj.dtype).encode() + repr(obj.shape).encode())
+        if obj.dtype == object:
+            _hash_update(h, obj.tolist())
+        else:
+            h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, np.generic):
+        _hash_update(h, obj.item())
+    elif obj is None or isinstance(obj, (str, bytes, bool, int, float, complex)):
+        h.update(type(obj).__name__.encode() + repr(obj).encode())
+    else:
+        raise TypeError('Cannot hash {} in the model key'.format(type(obj).__name__))
+
+
+def _steady_mean(time, signal, t_avg, tol):
+    # Mean of the last t_avg seconds, and whether it agrees with the window before within tol
+    last = time >= time[-1] - t_avg
+    previous = (time >= time[-1] - 2 * t_avg) & ~last
+    mean = float(np.mean(signal[last]))
+    change = abs(mean - np.mean(signal[previous])) if previous.any() else np.inf
+    return mean, bool(change <= tol * max(abs(mean), 1e-6))
+
+
 class RotorPerformance():
     '''
     Class RotorPerformance used to find details from rotor performance 
@@ -579,6 +657,8 @@ class RotorPerformance():
     --------
     interp_surface
     interp_gradient
+    interp_surface_batch
+    interp_gradient_batch
     plot_performance
 
     Parameters:
@@ -625,6 +705,27 @@ class RotorPerformance():
         performance_max_ind = np.where(performance_fine == np.max(performance_fine)) # Find max performance at fine pitch
         self.TSR_opt = float(TSR_fine[performance_max_ind[0]])  # TSR to maximize Cx at fine pitch
 
+    def _interpolants(self):
+        '''
+        Spline interpolants of the performance surface (bicubic) and of its gradients (bilinear),
+        built once per table and reused by every lookup. Values outside the table are clamped
+        to its edges.
+        '''
+        if getattr(self, '_interp', None) is None:
+            self._interp = (
+                interpolate.RectBivariateSpline(self.TSR_initial, self.pitch_initial_rad, self.performance_table, kx=3, ky=3),
+                interpolate.RectBivariateSpline(self.TSR_initial, self.pitch_initial_rad, self.gradient_pitch, kx=1, ky=1),
+                interpolate.RectBivariateSpline(self.TSR_initial, self.pitch_initial_rad, self.gradient_TSR, kx=1, ky=1),
+            )
+        return self._interp
+
+    @staticmethod
+    def _grid_eval(interp_fun, pitch, TSR):
+        # Evaluate on the (sorted) grid of pitch and TSR values: [n_TSR x n_pitch], with unit
+        # dimensions dropped (a single point gives a [1] array)
+        z = interp_fun(np.sort(np.atleast_1d(TSR)), np.sort(np.atleast_1d(pitch)))
+        return np.atleast_1d(z.squeeze())
+
     def interp_surface(self,pitch,TSR):
         '''
         2d interpolation to find point on rotor performance surface
@@ -637,10 +738,9 @@ class RotorPerformance():
               Tip-speed ratio to look up
         '''
         
-        # Form the interpolant functions which can look up any arbitrary location on rotor performance surface
-        interp_fun = interpolate.interp2d(
-            self.pitch_initial_rad, self.TSR_initial, self.performance_table, kind='cubic')
-        return interp_fun(pitch,TSR)
+        # Look up any arbitrary location on rotor performance surface
+        interp_fun, _, _ = self._interpolants()
+        return self._grid_eval(interp_fun, pitch, TSR)
 
     def interp_gradient(self,pitch,TSR):
         '''
@@ -658,13 +758,52 @@ class RotorPerformance():
         interp_gradient : array_like
                           [1 x 2] array coresponding to gradient in pitch and TSR directions, respectively
         '''
-        # Form the interpolant functions to find gradient at any arbitrary location on rotor performance surface
-        dCP_beta_interp = interpolate.interp2d(self.pitch_initial_rad, self.TSR_initial, self.gradient_pitch, kind='linear')
-        dCP_TSR_interp = interpolate.interp2d(self.pitch_initial_rad, self.TSR_initial, self.gradient_TSR, kind='linear')
+        # Find gradient at any arbitrary location on rotor performance surface
+        _, dCP_beta_interp, dCP_TSR_interp = self._interpolants()
 
         # grad.shape output as (2,) numpy array, equivalent to (pitch-direction,TSR-direction)
-        grad = np.array([dCP_beta_interp(pitch,TSR), dCP_TSR_interp(pitch,TSR)])
+        grad = np.array([self._grid_eval(dCP_beta_interp, pitch, TSR), self._grid_eval(dCP_TSR_interp, pitch, TSR)])
         return np.ndarray.flatten(grad)
+
+    def interp_surface_batch(self,pitch,TSR):
+        '''
+        Point-wise interpolation on the rotor performance surface for many operating points
+
+        Parameters:
+        -----------
+        pitch : array_like (rad)
+                Pitch angles to look up
+        TSR : array_like (rad)
+              Tip-speed ratios to look up (same shape as pitch, or broadcastable to it)
+
+        Returns:
+        --------
+        values : array_like
+                 Performance values at each (pitch, TSR) pair, in the broadcast shape of the inputs
+        '''
+        interp_fun, _, _ = self._interpolants()
+        pitch, TSR = np.broadcast_arrays(np.asarray(pitch, dtype=float), np.asarray(TSR, dtype=float))
+        return interp_fun.ev(TSR, pitch)
+
+    def interp_gradient_batch(self,pitch,TSR):
+        '''
+        Point-wise gradient of the rotor performance surface for many operating points
+
+        Parameters:
+        -----------
+        pitch : array_like (rad)
+                Pitch angles to look up
+        TSR : array_like (rad)
+              Tip-speed ratios to look up (same shape as pitch, or broadcastable to it)
+
+        Returns:
+        --------
+        grad : array_like
+               [... x 2] array of gradients in pitch and TSR directions, respectively
+        '''
+        _, dCP_beta_interp, dCP_TSR_interp = self._interpolants()
+        pitch, TSR = np.broadcast_arrays(np.asarray(pitch, dtype=float), np.asarray(TSR, dtype=float))
+        return np.stack([dCP_beta_interp.ev(TSR, pitch), dCP_TSR_interp.ev(TSR, pitch)], axis=-1)
     
     def plot_performance(self):
         '''
@@ -0,0 +1,68 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from wrp import Params, WaveGauges, DataLoader, DataManager, WRP
+import numpy as np
+import time
+
+# times the inversion with the dense least squares path ('lstsq') against the
+# normal equations solved by Cholesky factorization ('cholesky')
+
+dataDirectory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+def timeInversion(wrp, dm, solver, repeats):
+    wrp.solver = solver
+    wrp.inversion(dm)   # warm up
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        wrp.inversion(dm)
+    elapsed = (time.perf_counter() - start_time) / repeats
+    a, b = dm.inversionGetValues('newest')
+    return elapsed, np.concatenate((a, b))
+
+if __name__ == "__main__":
+    repeats = 20
+
+    # files to read statically
+    load = DataLoader(
+        os.path.join(dataDirectory, '3.12.22.full.csv'),
+        os.path.join(dataDirectory, '3.12.22.time.csv'),
+    )
+
+    print('  nf   lstsq (ms)   cholesky (ms)   speedup   max weight difference')
+    for nf in [50, 100, 200, 400]:
+        # initialize parameters with default settings
+        pram = Params()
+        pram.nf = nf
+
+        # create wave gauge object and add gauges
+        gauges = WaveGauges()
+        gauges.addGauge(-4, .08083, "PXI1Slot5/ai2", 0)
+        gauges.addGauge(-3.5, .10301, "PXI1Slot5/ai6", 0)
+        gauges.addGauge(-2, .10570, "PXI1Slot5/ai4", 0)
+        gauges.addGauge(-0, .08163, "PXI1Slot5/ai0", 1) # the '1' here indicates for prediction
+
+        # create dm object which manages transferring data to wrp
+        dm = DataManager(
+            pram,
+            gauges,
+            readSampleRate=30,
+            writeSampleRate=30,
+            updateInterval = 1,
+        )
+
+        # initialize wrp
+        wrp = WRP(gauges)
+        wrp.nf = nf
+
+        # buffers at 40 s of the test, spectral information from them
+        load.generateBuffersStatic(dm, 40)
+        wrp.spectral(dm)
+
+        lstsqTime, lstsqWeights = timeInversion(wrp, dm, 'lstsq', repeats)
+        choleskyTime, choleskyWeights = timeInversion(wrp, dm, 'cholesky', repeats)
+
+        print('{:4d}   {:10.3f}   {:13.3f}   {:7.1f}   {:.2e}'.format(
+            nf, lstsqTime * 1e3, choleskyTime * 1e3, lstsqTime / choleskyTime,
+            np.max(np.abs(lstsqWeights - choleskyWeights))))
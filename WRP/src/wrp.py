@@ -1,5 +1,6 @@
 import numpy as np
-from scipy.signal import welch
+from collections import deque
+from scipy.signal import get_window
 from scipy import linalg
 import matplotlib.pyplot as plt
 from numpy import genfromtxt
@@ -76,6 +77,7 @@ class Params:
         mu: threshold parameter to determine fastest/slowest 
             group velocities for prediction zone
         lam: regularization parameter for least squares fit
+        nperseg: number of samples per segment of the spectral estimate
     """
     def __init__(self):
         # wrp parameters
@@ -84,6 +86,64 @@ class Params:
         self.nf = 100           # 
         self.mu = 0.05          # 
         self.lam = 1            # 
+        self.nperseg = 256      # 
+
+
+class CircularBuffer:
+    """Fixed-length circular buffer of samples with O(1) updates
+
+    Each sample is written twice, at its slot and one buffer length further,
+    so the most recent `length` samples are always a contiguous view of the
+    storage, oldest first, and reading a window never copies.
+
+    Args:
+        nRows: number of rows (channels)
+        length: number of samples held
+        dtype: data type of the samples
+    """
+    def __init__(self, nRows, length, dtype=np.float64):
+        self.length = int(length)
+        self.storage = np.zeros((nRows, 2 * self.length), dtype=dtype)
+        self.head = 0       # slot of the oldest sample
+
+    def update(self, newData):
+        """adds new samples (columns) at the end, dropping the same number of oldest samples
+
+        Args:
+            newData: array of new samples, (nRows x nSamples)
+        """
+        newData = newData[:, -self.length:]
+        n = newData.shape[1]
+        # write in at most two contiguous pieces, each into both copies
+        first = min(n, self.length - self.head)
+        for start, piece in ((self.head, newData[:, :first]), (0, newData[:, first:])):
+            stop = start + piece.shape[1]
+            self.storage[:, start:stop] = piece
+            self.storage[:, start + self.length:stop + self.length] = piece
+        self.head = (self.head + n) % self.length
+
+    def fill(self, values):
+        """replaces the whole content, oldest sample first
+
+        Args:
+            values: array of samples, (nRows x length)
+        """
+        self.storage[:, :self.length] = values
+        self.storage[:, self.length:] = values
+        self.head = 0
+
+    def view(self, nSamples=None):
+        """the most recent samples, oldest first, as a view (do not write into it)
+
+        Args:
+            nSamples: number of samples, all samples when None
+
+        Returns:
+            array view, (nRows x nSamples)
+        """
+        stop = self.head + self.length
+        start = stop - (self.length if nSamples is None else nSamples)
+        return self.storage[:, start:stop]
 
 
 class DataManager:
@@ -122,19 +182,22 @@ class DataManager:
 
         # set up buffer - samples, values, time -
         self.bufferNSamples = self.readSampleRate * pram.ts
-        self.bufferValues = np.zeros((self.nChannels, self.bufferNSamples), dtype=np.float64) 
+        self.buffer = CircularBuffer(self.nChannels, self.bufferNSamples)
+        self.samplesRead = 0        # samples added to the buffer since the last reset
+        self.bufferResets = 0       # times the buffer content was replaced as a whole
         self.bufferTime = np.arange(-pram.ts, 0, self.readDT)
 
         # set up validation - samples, values, time -
         self.validateNSamples = self.readSampleRate * (pram.ta + self.preWindow + self.postWindow)
         self.validateNFutureSamples = self.readSampleRate * self.postWindow
         self.validateNPastSamples = self.readSampleRate * (pram.ta + self.preWindow)
-        self.validateValues = np.zeros((self.nChannels, self.validateNSamples), dtype=np.float64)
+        self.validate = CircularBuffer(self.nChannels, self.validateNSamples)
         self.validateTime = np.arange(-pram.ta - self.preWindow, self.postWindow, self.readDT)
 
         # array to save results of inversions for the length of time to visualize in the future
         self.inversionNSaved = int(self.postWindow / self.updateInterval) + 1
         self.inversionSavedValues = np.zeros((2, self.inversionNSaved, pram.nf))
+        self.inversionHead = 0      # slot of the oldest saved inversion
 
         # number of samples for reconstruction
         self.assimilationSamples = pram.ta * self.readSampleRate
@@ -148,6 +211,31 @@ class DataManager:
         # alter calibration constants for easy multiplying
         self.calibrationSlopes = np.expand_dims(gauges.calibrationSlopes, axis = 1)
 
+        # preallocated outputs of preprocessing, overwritten by the next call
+        self.reconstructionValues = np.zeros((len(self.mg), self.assimilationSamples))
+        self.spectralValues = np.zeros((len(self.mg), self.bufferNSamples))
+        self.validateProcessedValues = np.zeros((len(self.pg), self.validateNSamples))
+
+    @property
+    def bufferValues(self):
+        """view of the spectral buffer, oldest sample first"""
+        return self.buffer.view()
+
+    @bufferValues.setter
+    def bufferValues(self, values):
+        self.buffer.fill(values)
+        self.samplesRead = 0
+        self.bufferResets += 1
+
+    @property
+    def validateValues(self):
+        """view of the validation buffer, oldest sample first"""
+        return self.validate.view()
+
+    @validateValues.setter
+    def validateValues(self, values):
+        self.validate.fill(values)
+
  
     def addUpdateInterval(self):
         """Initialize read and write - samples, values, time - based on update interval
@@ -169,27 +257,21 @@ class DataManager:
         self.predictTime = np.arange(0, self.updateInterval, self.writeDT)
 
     def bufferUpdate(self, newData):
-        """adds new data to the end of bufferValues, shifting existing data and removing the oldest
+        """adds new data to the end of bufferValues, removing the oldest
         
         Args:
             newData: array of new data collected with length readNSamples
         """
-        # shift old data to the end of the matrix
-        self.bufferValues = np.roll(self.bufferValues, -self.readNSamples)
-        # write over old data with new data
-        self.bufferValues[:, -self.readNSamples:] = newData
+        self.buffer.update(newData)
+        self.samplesRead += np.shape(newData)[1]
 
     def validateUpdate(self, newData):
-        """adds new data to the end of validateValues, shifting existing data and removing the oldest
+        """adds new data to the end of validateValues, removing the oldest
         
         Args:
             newData: array of new data collected with length readNSamples
         """
-        # shift old data to the end of the matrix
-        self.validateValues = np.roll(self.validateValues, -self.readNSamples)
-        
-        # write over old data with new data
-        self.validateValues[:, -self.readNSamples:] = newData
+        self.validate.update(newData)
 
     def inversionUpdate(self, a, b):
         """adds most recent inversion to the end ofinversionSavedValues, deletes the oldest
@@ -198,12 +280,12 @@ class DataManager:
             a: array of weights for cosine
             b: array of weights for sine
         """
-        # array to save backlog of inversion results, good for validating real time
-        self.inversionSavedValues = np.roll(self.inversionSavedValues, -1, axis = 1)
-
+        # array to save backlog of inversion results, good for validating real time;
+        # the oldest slot is overwritten by the newest result
         # need to squeeze to fit it into the matrix
-        self.inversionSavedValues[0][self.inversionNSaved - 1] = np.squeeze(a)
-        self.inversionSavedValues[1][self.inversionNSaved - 1] = np.squeeze(b)
+        self.inversionSavedValues[0][self.inversionHead] = np.squeeze(a)
+        self.inversionSavedValues[1][self.inversionHead] = np.squeeze(b)
+        self.inversionHead = (self.inversionHead + 1) % self.inversionNSaved
 
 
     def inversionGetValues(self, method):
@@ -221,14 +303,14 @@ class DataManager:
         # need expand_dims for the matrix math in reconstruct
 
         if method == 'oldest':
-            a = np.expand_dims(self.inversionSavedValues[0][0][:], axis=1)
-            b = np.expand_dims(self.inversionSavedValues[1][0][:], axis=1)
+            a = np.expand_dims(self.inversionSavedValues[0][self.inversionHead][:], axis=1)
+            b = np.expand_dims(self.inversionSavedValues[1][self.inversionHead][:], axis=1)
 
             return a,b
 
         if method == 'newest':
-            a = np.expand_dims(self.inversionSavedValues[0][-1][:], axis=1)
-            b = np.expand_dims(self.inversionSavedValues[1][-1][:], axis=1)
+            a = np.expand_dims(self.inversionSavedValues[0][self.inversionHead - 1][:], axis=1)
+            b = np.expand_dims(self.inversionSavedValues[1][self.inversionHead - 1][:], axis=1)
 
             return a,b
 
@@ -241,9 +323,9 @@ class DataManager:
             An array of processed data for reconstruction
         """
         # select measurement gauges across reconstruction time
-        data = self.bufferValues[self.mg, -self.assimilationSamples:]
+        data = self.buffer.view(self.assimilationSamples)
 
-        processedData = self.preprocess(data, self.mg)
+        processedData = self.preprocess(data, self.mg, self.reconstructionValues)
         return processedData
 
     def reconstructionTime(self):
@@ -263,9 +345,9 @@ class DataManager:
         Returns:
             An array of processed data for spectral information
         """
-        data = self.bufferValues[self.mg, :]
+        data = self.buffer.view()
 
-        processedData = self.preprocess(data, self.mg)
+        processedData = self.preprocess(data, self.mg, self.spectralValues)
         return processedData
 
     def validateData(self):
@@ -274,22 +356,24 @@ class DataManager:
         Returns:
             processed data for validation
         """
-        data = self.validateValues[self.pg, :]
+        data = self.validate.view()
 
-        processedData = self.preprocess(data, self.pg)
+        processedData = self.preprocess(data, self.pg, self.validateProcessedValues)
         return processedData
 
-    def preprocess(self, data, whichGauges):
+    def preprocess(self, data, whichGauges, out=None):
         """scales data by calibration constants and subtracts the mean
         
         Args: 
-            data: array of values to be processed
-            whichGauges: the indices of the gauges which correspond to the data being processed
+            data: array of values of all gauges (left unchanged)
+            whichGauges: the indices of the gauges to be processed
+            out: array to write the processed data into, a new array when None
         
         Returns: 
             array of processed data
         """
-        # scale by calibration constants
+        # select and scale by calibration constants
+        data = np.take(data, whichGauges, axis = 0, out = out)
         data *= self.calibrationSlopes[whichGauges]
 
         # center on mean
@@ -300,6 +384,99 @@ class DataManager:
 
 
 
+class StreamingWelch:
+    """Welch power spectral density of the spectral buffer, updated segment by segment
+
+    Segments of `nperseg` samples start at multiples of `nperseg - noverlap` of
+    the samples read since the last buffer reset, so a segment keeps its place as
+    the buffer slides and each one is transformed only once, when it completes.
+    An update of fewer samples than the hop transforms at most one segment, and
+    a segment leaves the average when it leaves the buffer.
+
+    The periodograms are those of scipy.signal.welch (constant detrend,
+    one-sided density), and the average is welch over the span of the buffer
+    the segments cover. That span starts up to one hop after the buffer does and
+    ends up to one hop before it, so the estimate can differ slightly from welch
+    on the whole buffer, whose segments start at the first buffered sample. The
+    calibration constants are applied as weights of the gauge average.
+
+    Args:
+        flow: instance of DataManager
+        whichGauges: indices of the gauges to average
+        nperseg: number of samples per segment
+        noverlap: number of samples shared by consecutive segments, nperseg // 2 when None
+        window: window function, as accepted by scipy.signal.get_window
+    """
+    def __init__(self, flow, whichGauges, nperseg=256, noverlap=None, window='hann'):
+        self.flow = flow
+        self.whichGauges = whichGauges
+        self.nperseg = min(nperseg, flow.bufferNSamples)
+        noverlap = self.nperseg // 2 if noverlap is None else noverlap
+        self.hop = self.nperseg - noverlap
+
+        self.window = get_window(window, self.nperseg)
+        self.f = np.fft.rfftfreq(self.nperseg, flow.readDT)
+        # density scaling, doubled for the one-sided spectrum except at 0 and Nyquist
+        self.scale = np.full(len(self.f), 2 / (flow.readSampleRate * np.sum(self.window**2)))
+        self.scale[0] /= 2
+        if self.nperseg % 2 == 0:
+            self.scale[-1] /= 2
+        # gauge weights of the average: calibration constants squared
+        self.weights = np.squeeze(flow.calibrationSlopes[whichGauges], axis = 1)**2 / len(whichGauges)
+
+        self.segments = deque()     # (segment index, periodograms of the gauges)
+        self.psdSum = np.zeros((len(whichGauges), len(self.f)))
+        self.key = None             # (flow.bufferResets, newest segment index) of the sums
+        self.transformed = 0        # segments transformed by the last update
+
+    def update(self):
+        """Adds the segments completed since the last call, drops those no longer buffered
+
+        Returns:
+            f: array of frequencies
+            pxx: array of power spectral density
+        """
+        flow = self.flow
+        S = flow.samplesRead
+        L = flow.bufferNSamples
+        # segments j held in the buffer (absolute samples S - L .. S - 1), starting at j * hop
+        first = -((L - S) // self.hop)
+        last = (S - self.nperseg) // self.hop
+
+        if self.key is None or self.key[0] != flow.bufferResets:
+            self.segments.clear()
+            self.psdSum[:] = 0
+            newest = first - 1
+        else:
+            newest = self.key[1]
+
+        while self.segments and self.segments[0][0] < first:
+            self.psdSum -= self.segments.popleft()[1]
+
+        view = flow.buffer.view()
+        self.transformed = 0
+        for j in range(max(newest + 1, first), last + 1):
+            start = j * self.hop - (S - L)
+            data = np.take(view[:, start:start + self.nperseg], self.whichGauges, axis = 0)
+            data = (data - np.mean(data, axis = 1, keepdims = True)) * self.window
+            psd = np.abs(np.fft.rfft(data, axis = 1))**2 * self.scale
+            self.segments.append((j, psd))
+            self.psdSum += psd
+            self.transformed += 1
+
+        self.key = (flow.bufferResets, max(last, newest))
+        return self.psd()
+
+    def psd(self):
+        """Averaged power spectral density of the gauges
+
+        Returns:
+            f: array of frequencies
+            pxx: array of power spectral density
+        """
+        return self.f, self.weights @ self.psdSum / max(len(self.segments), 1)
+
+
 class DataLoader:
     """Hands data from a static file to DataManager
     
@@ -391,7 +568,7 @@ class DataLoader:
 
         # add samples from self.dataFull to flow.validateValues until the number of samples added
         # matches flow.validateNFutureSamples
-        flow.validateValues[:, -flow.validateNFutureSamples:] = self.dataFull[:, :flow.validateNFutureSamples]
+        flow.validateUpdate(self.dataFull[:, :flow.validateNFutureSamples])
         self.validateCurrentIndex = flow.validateNFutureSamples
 
         while self.bufferCurrentIndex < self.reconstructionIndex:
@@ -411,6 +588,27 @@ class DataLoader:
 
         print(flow.bufferValues)
 
+def isUniform(t):
+    """Whether the times `t` are evenly spaced"""
+    dt = (t[-1] - t[0]) / (len(t) - 1)
+    return np.allclose(np.diff(t), dt, rtol=1e-6, atol=0)
+
+
+def dirichlet(x, N):
+    """sin(N·x) / sin(x), the sum of exp(2i·n·x) over n = 0..N-1 without its phase
+
+    Args:
+        x: array of half phase increments
+        N: number of terms
+
+    Returns:
+        array like x, with the limit ±N where sin(x) = 0
+    """
+    sinx = np.sin(x)
+    small = np.abs(sinx) < 1e-9
+    return np.where(small, N * np.cos(N * x) / np.cos(x), np.sin(N * x) / np.where(small, 1, sinx))
+
+
 class WRP(Params):
     """Implements methods of wave reconstruction and propagation
 
@@ -436,6 +634,29 @@ class WRP(Params):
 
         self.plotFlag = False
 
+        # 'cholesky' solves the normal equations assembled without the data matrix,
+        # 'lstsq' builds the dense data matrix (reference path)
+        self.solver = 'cholesky'
+        self.normalMatrix = None    # preallocated work arrays of the normal equations
+        self.normalVector = None
+
+        # recursive mode: while k is unchanged, keep the factorized ZᵀZ and slide the data
+        # sums of Zᵀη over the window, adding new samples and removing expired ones
+        self.recursive = False
+        self.refitInterval = 100    # updates between full recomputations of the sums
+        self.slidingKey = None      # (k grid, window, buffer) the state below belongs to
+        self.slidingFactor = None   # Cholesky factor of ZᵀZ + λI
+        self.slidingGridSums = None # Σ_t exp(i(k·x - w·t)) per gauge, for the window means
+        self.slidingSums = None     # Σ_τ data·exp(-i·w·τ) per gauge, τ in absolute time
+        self.slidingMeans = None    # Σ_τ data per gauge
+        self.slidingSamples = 0     # flow.samplesRead at the last update
+        self.slidingUpdates = 0     # updates since the last full recomputation
+
+        # cos/sin bases of the reconstruction windows, by window name: (key, basis)
+        self.basisCache = {}
+
+        self.spectralEstimator = None   # StreamingWelch of the DataManager in use
+
     def spectral(self, flow):
         """Calculates spectral information
 
@@ -448,14 +669,18 @@ class WRP(Params):
             - xe, xb: spatial reconstruction parameters
             - k_min, k_max: wavenumber bandwidth for reconstruction
 
+        The spectrum is the Welch estimate of the spectral buffer, computed by a
+        StreamingWelch of the measurement gauges that transforms each segment once.
+
         Args:
             flow: instance of DataManager
         """
-        # assign spectral variables to wrp class
-        data = flow.spectralData()
+        estimator = self.spectralEstimator
+        if estimator is None or estimator.flow is not flow:
+            estimator = self.spectralEstimator = StreamingWelch(flow, self.mg, nperseg = self.nperseg)
 
-        f, pxxEach = welch(data, fs = flow.readSampleRate)
-        pxx = np.mean(pxxEach, 0)
+        # assign spectral variables to wrp class
+        f, pxx = estimator.update()
   
         # added 0.01 because warning when divide by zero
         self.T_p = 1 / (f[pxx == np.max(pxx)] + 0.01)
@@ -464,7 +689,7 @@ class WRP(Params):
         self.k_p = (1 / 9.81) * (2 * np.pi / self.T_p)**2
 
         # zero-th moment as area under power curve
-        self.m0 = np.trapz(pxx, f)
+        self.m0 = np.sum((pxx[1:] + pxx[:-1]) * np.diff(f)) / 2
 
         # significant wave height from zero moment
         self.Hs = 4 * np.sqrt(self.m0)
@@ -518,16 +743,43 @@ class WRP(Params):
         w = np.sqrt(9.81 * k)
 
     # get data
-        eta = flow.reconstructionData()
         t = flow.reconstructionTime()
         x = np.array(self.x)[self.mg]
 
-    # grid data and reshape for matrix operations
-        X, T = np.meshgrid(x, t)
-
         self.k = np.reshape(k, (self.nf, 1))
         self.w = np.reshape(w, (self.nf, 1))
 
+        if self.solver == 'lstsq':
+            weights = self.inversionDense(flow.reconstructionData(), t, x)
+        elif self.recursive and isUniform(t):
+            weights = self.inversionRecursive(flow, t, x, k, w)
+        else:
+            m, n = self.normalEquations(flow.reconstructionData(), t, x, k, w)
+            # m is symmetric positive definite (lam > 0)
+            weights = linalg.cho_solve(linalg.cho_factor(m, overwrite_a=True, check_finite=False),
+                                       n, check_finite=False)
+
+        # choose all columns [:] for future matrix math
+        a = weights[:self.nf,:]
+        b = weights[self.nf:,:]
+
+        flow.inversionUpdate(a, b)
+
+
+    def inversionDense(self, eta, t, x):
+        """Least squares fit through the dense data matrix Z (samples*gauges x 2*nf)
+
+        Args:
+            eta: processed data, (gauges x samples)
+            t: sample times
+            x: gauge positions
+
+        Returns:
+            weights for cosine and sine, (2*nf x 1)
+        """
+    # grid data and reshape for matrix operations
+        X, T = np.meshgrid(x, t)
+
         X = np.reshape(X, (1, np.size(X)), order='F')
 
         T = np.reshape(T, (1, np.size(T)), order='F')        
@@ -545,13 +797,138 @@ class WRP(Params):
         m = np.transpose(Z)@Z + (np.identity(self.nf * 2) * self.lam)
         n = np.transpose(Z)@eta
         weights, res, rnk, s = linalg.lstsq(m, n)
+        return weights
 
-        # choose all columns [:] for future matrix math
-        a = weights[:self.nf,:]
-        b = weights[self.nf:,:]
+    def normalEquations(self, eta, t, x, k, w):
+        """Assembles the regularized normal equations ZᵀZ + λI and Zᵀη without forming Z
 
-        flow.inversionUpdate(a, b)
+        Args:
+            eta: processed data, (gauges x samples)
+            t: sample times
+            x: gauge positions
+            k: wavenumbers
+            w: frequencies
+
+        Returns:
+            m: ZᵀZ + λI, (2*nf x 2*nf), overwritten by the next call
+            n: Zᵀη, (2*nf x 1), overwritten by the next call
+        """
+        nf = len(k)
+        if self.normalMatrix is None or self.normalMatrix.shape[0] != 2 * nf:
+            self.normalMatrix = np.empty((2 * nf, 2 * nf))
+            self.normalVector = np.empty((2 * nf, 1))
+
+        m = self.assembleNormalMatrix(t, x, k, w, self.normalMatrix)
 
+        # Σ_g exp(i·k·x_g) Σ_t η exp(-i·w·t)
+        etaHat = np.sum(np.exp(1j * np.outer(x, k)) * (eta @ np.exp(-1j * np.outer(t, w))), axis=0)
+        n = self.normalVector
+        n[:nf, 0] = etaHat.real
+        n[nf:, 0] = etaHat.imag
+        return m, n
+
+    def assembleNormalMatrix(self, t, x, k, w, m):
+        """Writes ZᵀZ + λI into `m`
+
+        With phases ψ = k·x - w·t, the products of the cosine and sine columns of Z
+        are sums of exp(i(ψ_i ∓ ψ_j)). On a uniform time grid each sum over time
+        is a geometric series with a closed form, so ZᵀZ costs O(gauges·nf²)
+        instead of O(samples·gauges·nf²). Other time grids are accumulated gauge
+        by gauge.
+
+        Args:
+            t: sample times
+            x: gauge positions
+            k: wavenumbers
+            w: frequencies
+            m: array to write into, (2*nf x 2*nf)
+
+        Returns:
+            m
+        """
+        nf = len(k)
+        N = len(t)
+        if isUniform(t):
+            dt = (t[-1] - t[0]) / (N - 1)
+            # phase at the middle of the window and its change per sample
+            u = np.exp(1j * (np.outer(x, k) - w * (t[0] + dt * (N - 1) / 2)))
+            half = w * dt / 2
+            P = (u.T @ np.conj(u)) * dirichlet(half[:, None] - half[None, :], N)
+            Q = (u.T @ u) * dirichlet(half[:, None] + half[None, :], N)
+            m[:nf, :nf] = 0.5 * (P.real + Q.real)
+            m[nf:, nf:] = 0.5 * (P.real - Q.real)
+            m[nf:, :nf] = 0.5 * (Q.imag + P.imag)
+            m[:nf, nf:] = 0.5 * (Q.imag - P.imag)
+        else:
+            m[:] = 0
+            for xg in x:
+                psi = k * xg - np.outer(t, w)
+                Zg = np.hstack((np.cos(psi), np.sin(psi)))
+                m += Zg.T @ Zg
+        m[np.diag_indices(2 * nf)] += self.lam
+        return m
+
+    def inversionRecursive(self, flow, t, x, k, w):
+        """Sliding-window solution of the normal equations
+
+        On a fixed uniform time grid ZᵀZ only depends on k, so its Cholesky factor
+        is kept until k changes. Zᵀη is kept as per-gauge sums of the raw data times
+        exp(-i·w·τ) in absolute time τ: each update adds the new samples and removes
+        the expired ones, then shifts the phase to the window's time grid and applies
+        the calibration and mean removal of DataManager.preprocess. The sums are
+        recomputed from the whole window every `refitInterval` updates, when k or
+        the window change, or when the expired samples are no longer in the buffer.
+
+        Args:
+            flow: instance of DataManager
+            t: sample times (uniform)
+            x: gauge positions
+            k: wavenumbers
+            w: frequencies
+
+        Returns:
+            weights for cosine and sine, (2*nf x 1)
+        """
+        nf = len(k)
+        N = len(t)
+        dt = flow.readDT
+        S = flow.samplesRead
+        new = S - self.slidingSamples
+        key = (k.tobytes(), t.tobytes(), x.tobytes(), self.lam, flow.bufferResets)
+
+        if key != self.slidingKey:
+            # new grid: factorize ZᵀZ + λI, sums of the grid for the window means
+            m = self.assembleNormalMatrix(t, x, k, w, np.empty((2 * nf, 2 * nf)))
+            self.slidingFactor = linalg.cho_factor(m, overwrite_a=True, check_finite=False)
+            self.slidingGridSums = np.exp(1j * np.outer(x, k)) * np.sum(np.exp(-1j * np.outer(t, w)), axis=0)
+
+        if (key != self.slidingKey or self.slidingUpdates >= self.refitInterval
+                or new < 0 or new > N or N + new > flow.bufferNSamples):
+            # full recomputation over the window (samples S - N .. S - 1)
+            window = np.take(flow.buffer.view(N), self.mg, axis=0)
+            self.slidingSums = window @ np.exp(-1j * np.outer(np.arange(S - N, S) * dt, w))
+            self.slidingMeans = np.sum(window, axis=1)
+            self.slidingUpdates = 0
+        else:
+            # add the new samples, remove the expired ones
+            recent = np.take(flow.buffer.view(N + new), self.mg, axis=0)
+            expired, added = recent[:, :new], recent[:, N:]
+            self.slidingSums += added @ np.exp(-1j * np.outer(np.arange(S - new, S) * dt, w))
+            self.slidingSums -= expired @ np.exp(-1j * np.outer(np.arange(S - N - new, S - N) * dt, w))
+            self.slidingMeans += np.sum(added, axis=1) - np.sum(expired, axis=1)
+            self.slidingUpdates += 1
+        self.slidingKey = key
+        self.slidingSamples = S
+
+        # absolute time of the window's time grid: τ = t + T
+        T = (S - 1) * dt - t[-1]
+        slopes = flow.calibrationSlopes[self.mg, 0]
+        etaHat = (np.exp(1j * np.outer(x, k)) * self.slidingSums * np.exp(1j * w * T)
+                  - (self.slidingMeans / N)[:, None] * self.slidingGridSums)
+        etaHat = slopes @ etaHat
+
+        n = np.concatenate((etaHat.real, etaHat.imag))[:, None]
+        return linalg.cho_solve(self.slidingFactor, n, check_finite=False)
 
     def reconstruct(self, flow):
         """Reconstructs surface using saved inversion values
@@ -570,34 +947,40 @@ class WRP(Params):
         self.t_min = (1 / self.cg_slow) * (self.xpred - self.xe)
         self.t_max = (1 / self.cg_fast) * (self.xpred - self.xb)
 
-        # matrix for summing across frequencies
-        sumMatrix = np.ones((1, self.nf))
-
 # Reconstruct for validation
-        # dx array for surface representation at desired location
-        dxValidate = self.xpred * np.ones((1, flow.validateNSamples))
-
-        # time for matrix math
-        tValidate = np.expand_dims(flow.validateTime, axis = 0)
-
         aValidate, bValidate = flow.inversionGetValues('oldest')
+        basisValidate = self.trigBasis('validate', flow.validateTime)
 
-        acosValidate = aValidate * np.cos( (self.k @ dxValidate) - self.w @ tValidate )
-        bsinValidate = bValidate * np.sin( (self.k @ dxValidate) - self.w @ tValidate )
-        
-        self.reconstructedSurfaceValidate = sumMatrix @ (acosValidate + bsinValidate)
+        # sum across frequencies: weights for cosine and sine times the basis
+        self.reconstructedSurfaceValidate = np.vstack((aValidate, bValidate)).T @ basisValidate
 
 # Reconstruct for prediction
-        # dx array for surface representation at desired location
-        dxPredict = self.xpred * np.ones((1, flow.predictNSamples))
-
-        tPredict = np.expand_dims(flow.predictTime, axis = 0)
         aPredict, bPredict = flow.inversionGetValues('newest')
+        basisPredict = self.trigBasis('predict', flow.predictTime)
 
-        acosPredict = aPredict * np.cos( (self.k @ dxPredict) - self.w @ tPredict )
-        bsinPredict = bPredict * np.sin( (self.k @ dxPredict) - self.w @ tPredict )
-        
-        self.reconstructedSurfacePredict = np.squeeze(sumMatrix @ (acosPredict + bsinPredict))
+        self.reconstructedSurfacePredict = np.squeeze(np.vstack((aPredict, bPredict)).T @ basisPredict)
+
+    def trigBasis(self, window, t):
+        """cos and sin of k·dx - w·t at the prediction location, cached per window
+
+        The basis is kept until the wavenumbers (changed by `spectral` through the
+        reconstruction bandwidth), the prediction location or the time grid change.
+
+        Args:
+            window: name of the reconstruction window
+            t: array of times of the window
+
+        Returns:
+            array of cosine rows followed by sine rows, (2*nf x samples)
+        """
+        key = (self.k.tobytes(), self.xpred.tobytes(), t.tobytes())
+        cached = self.basisCache.get(window)
+        if cached is None or cached[0] != key:
+            # dx array for surface representation at desired location
+            dx = self.xpred * np.ones((1, len(t)))
+            phase = (self.k @ dx) - self.w @ np.expand_dims(t, axis = 0)
+            cached = self.basisCache[window] = (key, np.vstack((np.cos(phase), np.sin(phase))))
+        return cached[1]
     def setVis(self, flow):
         # plt.ion()
         figure, ax = plt.subplots(figsize = (8,5))
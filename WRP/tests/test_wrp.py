@@ -0,0 +1,174 @@
+'''
+Unit tests for the WRP buffers, spectral estimate and inversion
+
+Tests:
+    CircularBuffer
+    StreamingWelch
+    inversion (normal equations, recursive)
+'''
+
+import os
+import sys
+import unittest
+import numpy as np
+from scipy.signal import welch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from wrp import Params, WaveGauges, DataManager, CircularBuffer, StreamingWelch, WRP
+
+
+def makeGauges():
+    gauges = WaveGauges()
+    gauges.addGauge(-4, .08083, "PXI1Slot5/ai2", 0)
+    gauges.addGauge(-3.5, .10301, "PXI1Slot5/ai6", 0)
+    gauges.addGauge(-2, .10570, "PXI1Slot5/ai4", 0)
+    gauges.addGauge(-0, .08163, "PXI1Slot5/ai0", 1)
+    return gauges
+
+
+def makeDataManager(updateInterval=1):
+    gauges = makeGauges()
+    return DataManager(Params(), gauges, readSampleRate=30, writeSampleRate=30,
+                       updateInterval=updateInterval)
+
+
+def waveData(nChannels, nSamples, sampleRate=30):
+    # a few deep water components travelling past the gauges, plus noise
+    rng = np.random.default_rng(1)
+    x = np.array(makeGauges().xPositions)[:, None]
+    t = np.arange(nSamples) / sampleRate
+    eta = np.zeros((nChannels, nSamples))
+    for f, amplitude, phase in zip([0.5, 0.7, 0.9], [0.02, 0.01, 0.005], rng.uniform(0, 2 * np.pi, 3)):
+        w = 2 * np.pi * f
+        eta += amplitude * np.cos(w**2 / 9.81 * x - w * t + phase)
+    return 1 + eta + 1e-3 * rng.standard_normal((nChannels, nSamples))
+
+
+class TestCircularBuffer(unittest.TestCase):
+    def test_wrap_around(self):
+        buffer = CircularBuffer(2, 5)
+        samples = np.arange(24).reshape(2, 12)
+        for start in range(0, 12, 3):
+            buffer.update(samples[:, start:start + 3])
+        np.testing.assert_array_equal(buffer.view(), samples[:, -5:])
+        np.testing.assert_array_equal(buffer.view(2), samples[:, -2:])
+
+    def test_update_longer_than_buffer(self):
+        buffer = CircularBuffer(1, 4)
+        buffer.update(np.arange(3)[None, :])
+        buffer.update(np.arange(10, 17)[None, :])
+        np.testing.assert_array_equal(buffer.view(), [[13, 14, 15, 16]])
+
+    def test_fill(self):
+        buffer = CircularBuffer(1, 4)
+        buffer.update(np.arange(3)[None, :])
+        buffer.fill(np.arange(4)[None, :] + 7)
+        np.testing.assert_array_equal(buffer.view(), [[7, 8, 9, 10]])
+
+
+class TestInversion(unittest.TestCase):
+    def setUp(self):
+        self.dm = makeDataManager()
+        self.data = waveData(self.dm.nChannels, 3000)
+        self.dm.bufferValues = self.data[:, :self.dm.bufferNSamples]
+        self.position = self.dm.bufferNSamples
+
+        self.wrp = WRP(makeGauges())
+        # fixed bandwidth, so every solver sees the same wavenumbers
+        self.wrp.k_min = 2 * np.pi / 20
+        self.wrp.k_max = 2 * np.pi / 1.5
+
+    def weights(self):
+        self.wrp.inversion(self.dm)
+        return np.concatenate(self.dm.inversionGetValues('newest'))
+
+    def assertWeightsClose(self, actual, desired):
+        np.testing.assert_allclose(actual, desired, rtol=0, atol=1e-8 * np.max(np.abs(desired)))
+
+    def test_cholesky_matches_lstsq(self):
+        self.wrp.solver = 'lstsq'
+        dense = self.weights()
+        self.wrp.solver = 'cholesky'
+        self.assertWeightsClose(self.weights(), dense)
+
+    def test_normal_equations_match_data_matrix(self):
+        t = self.dm.reconstructionTime()
+        x = np.array(self.wrp.x)[self.wrp.mg]
+        k = np.linspace(self.wrp.k_min, self.wrp.k_max, self.wrp.nf)
+        w = np.sqrt(9.81 * k)
+        m, n = self.wrp.normalEquations(self.dm.reconstructionData(), t, x, k, w)
+
+        psi = np.concatenate([k * xg - np.outer(t, w) for xg in x])
+        Z = np.hstack((np.cos(psi), np.sin(psi)))
+        eta = self.dm.reconstructionData().reshape(-1, 1)
+        np.testing.assert_allclose(m, Z.T @ Z + self.wrp.lam * np.identity(2 * self.wrp.nf), atol=1e-8)
+        np.testing.assert_allclose(n, Z.T @ eta, atol=1e-10)
+
+    def test_recursive_matches_cholesky(self):
+        self.wrp.recursive = True
+        self.wrp.refitInterval = 10
+        reference = WRP(makeGauges())
+        reference.k_min, reference.k_max = self.wrp.k_min, self.wrp.k_max
+        for _ in range(25):
+            self.dm.bufferUpdate(self.data[:, self.position:self.position + self.dm.readNSamples])
+            self.position += self.dm.readNSamples
+            recursive = self.weights()
+            reference.inversion(self.dm)
+            self.assertWeightsClose(recursive, np.concatenate(self.dm.inversionGetValues('newest')))
+
+
+class TestStreamingWelch(unittest.TestCase):
+    def setUp(self):
+        self.dm = makeDataManager()
+        rng = np.random.default_rng(0)
+        self.data = 2 + 0.01 * rng.standard_normal((self.dm.nChannels, 20000)).cumsum(axis=1)
+        self.estimator = StreamingWelch(self.dm, self.dm.mg)
+        self.dm.bufferValues = self.data[:, :self.dm.bufferNSamples]
+        self.position = self.dm.bufferNSamples
+
+    def advance(self):
+        newData = self.data[:, self.position:self.position + self.dm.readNSamples]
+        self.position += self.dm.readNSamples
+        self.dm.bufferUpdate(newData)
+        return self.estimator.update()
+
+    def welchOfSegments(self):
+        # scipy welch over the span of the buffer covered by the kept segments
+        S, L, hop = self.dm.samplesRead, self.dm.bufferNSamples, self.estimator.hop
+        low = self.estimator.segments[0][0] * hop - (S - L)
+        high = self.estimator.segments[-1][0] * hop + self.estimator.nperseg - (S - L)
+        span = self.dm.bufferValues[self.dm.mg, low:high] * self.dm.calibrationSlopes[self.dm.mg]
+        f, pxx = welch(span, fs=self.dm.readSampleRate, nperseg=self.estimator.nperseg)
+        return f, np.mean(pxx, axis=0)
+
+    def test_matches_welch(self):
+        self.estimator.update()
+        for _ in range(40):
+            f, pxx = self.advance()
+            fRef, pxxRef = self.welchOfSegments()
+            np.testing.assert_allclose(f, fRef)
+            np.testing.assert_allclose(pxx, pxxRef, rtol=1e-10, atol=1e-12 * pxxRef.max())
+
+    def test_transforms_each_segment_once(self):
+        self.estimator.update()
+        nUpdates = 200
+        transformed = []
+        for _ in range(nUpdates):
+            self.advance()
+            transformed.append(self.estimator.transformed)
+        # updates shorter than the hop complete at most one segment each
+        self.assertLessEqual(max(transformed), 1)
+        expected = nUpdates * self.dm.readNSamples / self.estimator.hop
+        self.assertLessEqual(abs(sum(transformed) - expected), 1)
+
+    def test_reset(self):
+        self.estimator.update()
+        self.dm.bufferValues = self.data[:, 5000:5000 + self.dm.bufferNSamples]
+        self.estimator.update()
+        nSegments = (self.dm.bufferNSamples - self.estimator.nperseg) // self.estimator.hop + 1
+        self.assertEqual(self.estimator.transformed, nSegments)
+        self.assertEqual(len(self.estimator.segments), nSegments)
+
+
+if __name__ == '__main__':
+    unittest.main()